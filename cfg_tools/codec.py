@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+Преобразование двоичных значений полей 1CD: числа (N, BCD), даты (DT, BCD), строки (NC, NVC, UTF-16)
+Функции для одного значения используются при разборе строк таблиц,
+пакетные (*_column) - для колонки значений из многих записей (см. columnar)
+
+BCD: каждый байт - две десятичные цифры (старшая тетрада первая).
+N: первая тетрада - знак (0 - отрицательное), далее length цифр, последняя тетрада при четном length - заполнение
+DT: ГГГГММДДЧЧММСС
+"""
+from datetime import datetime
+
+INVALID_BCD = 10000
+
+# Значение байта BCD (00..99), для байт с тетрадами больше 9 - заведомо недопустимое значение
+BCD = [(byte >> 4) * 10 + (byte & 0x0f) if byte >> 4 < 10 and byte & 0x0f < 10 else INVALID_BCD
+       for byte in range(256)]
+
+
+def decode_numeric(field, data):
+    """
+    Число из BCD представления поля типа N
+    :param FieldDesc field: Описание поля (length, precision)
+    :param data: Двоичные данные значения
+    :return: int, при precision - float
+    """
+    digits = data.hex()
+    value = int(digits[1: field.length + 1])
+    if field.precision:
+        value = value / 10 ** field.precision
+    return -value if digits[0] == '0' else value
+
+
+def decode_datetime(data):
+    """
+    Дата из BCD представления поля типа DT
+    Нулевой год (незаполненная дата) не преобразуется: поля DT таблиц хранилища всегда заполнены,
+    такое значение означает ошибку разбора записи
+    :param data: Двоичные данные значения (7 байт)
+    :return datetime:
+    """
+    if data[0] == 0 and data[1] == 0:
+        raise Exception("Ошибка преобразования даты. Значение: " + data.hex())
+    return datetime(BCD[data[0]] * 100 + BCD[data[1]], BCD[data[2]], BCD[data[3]],
+                    BCD[data[4]], BCD[data[5]], BCD[data[6]])
+
+
+def decode_nc(data):
+    """
+    Строка фиксированной длины (NC)
+    :param data: Двоичные данные значения
+    :return str:
+    """
+    return str(data, 'utf-16')
+
+
+def decode_nvc(data):
+    """
+    Строка переменной длины (NVC): int16 длина в символах, символы
+    :param data: Двоичные данные значения
+    :return str:
+    """
+    return str(data[2: 2 + 2 * int.from_bytes(data[:2], 'little', signed=True)], 'utf-16')
+
+
+def decode_numeric_column(field, values):
+    """
+    Пакетное преобразование значений поля типа N
+    Все значения переводятся в шестнадцатеричную строку одним вызовом
+    :param FieldDesc field: Описание поля
+    :param list values: Двоичные данные значений одинаковой длины
+    :return list:
+    """
+    if not values:
+        return []
+    step = 2 * len(values[0])
+    digits = b''.join(values).hex()
+    end = field.length + 1
+    result = [int(digits[pos + 1: pos + end]) for pos in range(0, len(digits), step)]
+    if field.precision:
+        scale = 10 ** field.precision
+        result = [value / scale for value in result]
+    return [-value if digits[pos] == '0' else value for pos, value in zip(range(0, len(digits), step), result)]
+
+
+def decode_datetime_column(field, values):
+    """
+    Пакетное преобразование значений поля типа DT
+    :param FieldDesc field: Описание поля
+    :param list values: Двоичные данные значений
+    :return list:
+    """
+    return [decode_datetime(value) for value in values]
+
+
+def decode_string_column(field, values):
+    """
+    Пакетное преобразование строковых значений (NC, NVC)
+    Строки NC декодируются одним вызовом, если в данных нет суррогатных пар и маркеров порядка байт,
+    иначе - по одной
+    :param FieldDesc field: Описание поля
+    :param list values: Двоичные данные значений
+    :return list:
+    """
+    if field.type == 'NVC' or not values:
+        return [decode_nvc(value) for value in values]
+    data = b''.join(values)
+    try:
+        text = data.decode('utf-16-le')
+    except UnicodeDecodeError:
+        text = None
+    size = len(values[0]) // 2
+    if text is None or len(text) != len(data) // 2 or '\ufeff' in text:
+        return [decode_nc(value) for value in values]
+    return [text[pos: pos + size] for pos in range(0, len(text), size)]
+
+
+column_decoders = {
+    'N': decode_numeric_column,
+    'DT': decode_datetime_column,
+    'NC': decode_string_column,
+    'NVC': decode_string_column,
+}
+
+
+def decode_column(field, values):
+    """
+    Пакетное преобразование значений поля
+    :param FieldDesc field: Описание поля
+    :param list values: Двоичные данные значений, None - NULL
+    :return list: Значения, None для NULL; None - тип не поддерживается пакетным преобразованием
+    """
+    decode = column_decoders.get(field.type)
+    if decode is None:
+        return None
+    present = [ind for ind, value in enumerate(values) if value is not None]
+    if len(present) == len(values):
+        return decode(field, values)
+    result = [None] * len(values)
+    for ind, value in zip(present, decode(field, [values[ind] for ind in present])):
+        result[ind] = value
+    return result
@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+"""
+Колоночное чтение таблиц 1CD в массивы NumPy
+Записи таблицы имеют фиксированный размер, поэтому данные таблицы отображаются в структурированный массив
+без разбора отдельных записей, значения полей преобразуются векторно.
+Чтение в списки без NumPy (read_columns_python) - отдельная функция, значения преобразуются пакетно (см. codec)
+"""
+import logging
+from cfg_tools import codec
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+logger = None
+
+
+def check_numpy():
+    """
+    Проверяет доступность NumPy
+    :return:
+    """
+    if numpy is None:
+        raise Exception('Для колоночного чтения таблиц требуется пакет numpy')
+
+
+def _raw_format(field):
+    """
+    Формат numpy для физического представления значения поля (без признака NULL)
+    :param FieldDesc field: Описание поля
+    :return:
+    """
+    size = field.byte_size - (1 if field.nullable else 0)
+    if field.type == 'GUID':
+        return 'S16'
+    elif field.type == 'L':
+        return 'u1'
+    elif field.type == 'RV':
+        return ('<u4', 4)
+    elif field.type in ('NT', 'I'):
+        return ('<u4', 2)
+    elif field.type == 'B':
+        return 'S%s' % size
+    else:
+        # N, DT - BCD, NC, NVC - UTF-16: разбираются по байтам
+        return ('u1', size)
+
+
+def table_dtype(table_desc, fields):
+    """
+    Формирует структурированный тип numpy для записи таблицы
+    :param TableDesc table_desc: Описание таблицы
+    :param list fields: Описания читаемых полей
+    :return numpy.dtype:
+    """
+    names = ['_deleted']
+    formats = ['u1']
+    offsets = [0]
+    for field in fields:
+        value_offset = field.offset
+        if field.nullable:
+            names.append(field.name + '_null')
+            formats.append('u1')
+            offsets.append(field.offset)
+            value_offset += 1
+        names.append(field.name)
+        formats.append(_raw_format(field))
+        offsets.append(value_offset)
+    return numpy.dtype({'names': names, 'formats': formats, 'offsets': offsets, 'itemsize': table_desc.row_size})
+
+
+def bcd_digits(raw):
+    """
+    Раскладывает BCD-значения на десятичные цифры
+    :param numpy.ndarray raw: Массив байт (строк x байт)
+    :return numpy.ndarray: Массив цифр (строк x 2*байт)
+    """
+    raw = numpy.ascontiguousarray(raw)
+    digits = numpy.empty((raw.shape[0], raw.shape[1] * 2), numpy.uint8)
+    digits[:, 0::2] = raw >> 4
+    digits[:, 1::2] = raw & 0x0f
+    return digits
+
+
+def digits_to_int(digits):
+    """
+    Собирает числа из десятичных цифр
+    :param numpy.ndarray digits: Массив цифр (строк x цифр), старшая цифра первая
+    :return numpy.ndarray: int64 для чисел до 18 знаков, иначе массив объектов int
+    """
+    count = digits.shape[1]
+    if count <= 18:
+        weights = 10 ** numpy.arange(count - 1, -1, -1, dtype=numpy.int64)
+        return digits.astype(numpy.int64) @ weights
+    weights = numpy.array([10 ** i for i in range(count - 1, -1, -1)], dtype=object)
+    return digits.astype(object) @ weights
+
+
+def decode_numeric(field, raw):
+    """
+    Векторное преобразование полей типа N (BCD, первая тетрада - знак)
+    :param FieldDesc field: Описание поля
+    :param numpy.ndarray raw: Массив байт значений
+    :return numpy.ndarray: int64 или float64 при наличии дробной части
+    """
+    digits = bcd_digits(raw)
+    values = digits_to_int(digits[:, 1:field.length + 1])
+    negative = digits[:, 0] == 0
+    if field.precision:
+        values = values.astype(numpy.float64) / 10 ** field.precision
+    values[negative] = -values[negative]
+    return values
+
+
+def decode_datetime(raw):
+    """
+    Векторное преобразование полей типа DT (BCD ГГГГММДДЧЧММСС) в datetime64[s]
+    Пустые даты преобразуются в NaT
+    :param numpy.ndarray raw: Массив байт значений
+    :return numpy.ndarray:
+    """
+    digits = bcd_digits(raw)
+    year = digits_to_int(digits[:, 0:4])
+    month = digits_to_int(digits[:, 4:6])
+    day = digits_to_int(digits[:, 6:8])
+    seconds = digits_to_int(digits[:, 8:10]) * 3600 + digits_to_int(digits[:, 10:12]) * 60 + \
+        digits_to_int(digits[:, 12:14])
+    empty = year == 0
+    year[empty] = 1970
+    month[empty] = 1
+    day[empty] = 1
+    result = (year - 1970).astype('datetime64[Y]').astype('datetime64[M]') + (month - 1).astype('timedelta64[M]')
+    result = result.astype('datetime64[D]') + (day - 1).astype('timedelta64[D]')
+    result = result.astype('datetime64[s]') + seconds.astype('timedelta64[s]')
+    result[empty] = numpy.datetime64('NaT')
+    return result
+
+
+def decode_strings(field, raw, lengths=None):
+    """
+    Преобразование строковых полей (UTF-16) в массив объектов str
+    :param FieldDesc field: Описание поля
+    :param numpy.ndarray raw: Массив байт значений
+    :param numpy.ndarray lengths: Длины строк в символах (для NVC)
+    :return numpy.ndarray:
+    """
+    result = numpy.empty(raw.shape[0], dtype=object)
+    if field.type == 'NVC':
+        data = numpy.ascontiguousarray(raw[:, 2:])
+        lengths = data.shape[1] // 2 if lengths is None else lengths
+        for i, size in enumerate(lengths.tolist()):
+            result[i] = data[i, :2 * size].tobytes().decode('utf-16-le')
+    else:
+        data = numpy.ascontiguousarray(raw)
+        for i in range(data.shape[0]):
+            result[i] = data[i].tobytes().decode('utf-16-le')
+    return result
+
+
+def decode_column(field, records):
+    """
+    Преобразует колонку структурированного массива в массив значений
+    :param FieldDesc field: Описание поля
+    :param numpy.ndarray records: Записи таблицы
+    :return numpy.ndarray: Значения, для NULL-полей - numpy.ma.MaskedArray
+    """
+    raw = records[field.name]
+    if field.type == 'L':
+        values = raw == 1
+    elif field.type == 'N':
+        values = decode_numeric(field, raw)
+    elif field.type == 'DT':
+        values = decode_datetime(raw)
+    elif field.type == 'NVC':
+        lengths = numpy.ascontiguousarray(raw[:, :2]).view('<i2').reshape(-1)
+        values = decode_strings(field, raw, lengths)
+    elif field.type == 'NC':
+        values = decode_strings(field, raw)
+    else:
+        # GUID, B, RV, NT, I - как есть
+        values = numpy.array(raw)
+    if field.nullable:
+        mask = records[field.name + '_null'] == 0
+        if values.ndim > 1:
+            mask = numpy.repeat(mask[:, None], values.shape[1], axis=1)
+        values = numpy.ma.masked_array(values, mask=mask)
+    return values
+
+
+def _columns_fields(table_desc, columns):
+    if columns is None:
+        return table_desc.fields
+    return [table_desc.fields[table_desc.index_by_field_name(name)] for name in columns]
+
+
+def read_columns(data, table_desc, columns=None):
+    """
+    Разбирает данные таблицы в массивы NumPy
+    :param data: Данные таблицы (bytes, memoryview)
+    :param TableDesc table_desc: Описание таблицы
+    :param list columns: Имена читаемых полей, None - все поля
+    :return dict: Имя поля - массив значений
+    """
+    check_numpy()
+    fields = _columns_fields(table_desc, columns)
+    count = len(data) // table_desc.row_size
+    records = numpy.frombuffer(data, dtype=table_dtype(table_desc, fields), count=count)
+    records = records[records['_deleted'] != 1]
+    logger.debug('Колоночное чтение: %s, записей: %s' % (table_desc.name, len(records)))
+    return {field.name: decode_column(field, records) for field in fields}
+
+
+def read_columns_python(data, table_desc, columns=None):
+    """
+    Разбирает данные таблицы в списки значений без NumPy
+    Значения поля собираются срезами данных всех записей и преобразуются одним вызовом (N, DT, NC, NVC),
+    значения остальных типов - как при чтении строк. NULL - None
+    :param data: Данные таблицы (bytes, memoryview)
+    :param TableDesc table_desc: Описание таблицы
+    :param list columns: Имена читаемых полей, None - все поля
+    :return dict: Имя поля - список значений
+    """
+    fields = _columns_fields(table_desc, columns)
+    size = table_desc.row_size
+    rows = [pos for pos in range(0, len(data) // size * size, size) if data[pos] != 1]
+    result = {}
+    for field in fields:
+        start = field.offset + (1 if field.nullable else 0)
+        end = field.offset + field.byte_size
+        values = [data[pos + start: pos + end] for pos in rows]
+        if field.nullable:
+            values = [value if data[pos + field.offset] else None for pos, value in zip(rows, values)]
+        decoded = codec.decode_column(field, values)
+        if decoded is None:
+            decoded = [None if value is None else field.func(field, value) for value in values]
+        result[field.name] = decoded
+    logger.debug('Колоночное чтение без NumPy: %s, записей: %s' % (table_desc.name, len(rows)))
+    return result
+
+
+logger = logging.getLogger('1CD')
@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 from cfg_tools import utils
 from struct import unpack
+from collections import OrderedDict
 import logging
 
 
@@ -8,24 +9,51 @@ class Guid:
     """
     Описывает GUID 1с: данные 16 байт
     Реализовано правильное отображение, сравнение и вычисление хэш функции
+    Строковое представление вычисляется один раз. Одинаковые GUID, прочитанные из таблиц, - один объект (см. intern)
     """
+    __slots__ = ('data', 'text')
     EMPTY = None
+    INTERN_LIMIT = 1 << 18
+    interned = {}
 
     @staticmethod
     def from_string(guid_str):
         return Guid(utils.guid_to_bytes(guid_str))
 
+    @staticmethod
+    def intern(data):
+        """
+        GUID из таблицы интернирования: для одинаковых данных возвращается один объект
+        При переполнении таблица очищается (объекты остаются корректными, теряется только общее использование)
+        :param bytes data: Данные GUID'а
+        :return Guid:
+        """
+        guid = Guid.interned.get(data)
+        if guid is None:
+            if len(Guid.interned) >= Guid.INTERN_LIMIT:
+                Guid.interned.clear()
+            guid = Guid.interned[data] = Guid(data)
+        return guid
+
     def __init__(self, data):
         self.data = data
+        self.text = None
 
     def __str__(self):
-        return utils.bytes_to_guid(self.data) if utils.BYTES16_AS_GUID else utils.b2s(self.data)
+        if self.text is None:
+            self.text = utils.bytes_to_guid(self.data) if utils.BYTES16_AS_GUID else utils.b2s(self.data)
+        return self.text
 
     def __hash__(self):
         return hash(self.data)
 
     def __eq__(self, other):
-        return self.data == other.data if hasattr(other, 'data') else self.data == other
+        if self is other:
+            return True
+        try:
+            return self.data == other.data
+        except AttributeError:
+            return self.data == other
 
 Guid.EMPTY = Guid(b'\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00')
 
@@ -48,6 +76,91 @@ class Ref(Guid):
         return self.name
 
 
+class LRUCache:
+    """
+    LRU-кэш с ограничением объема в байтах
+    Ведет счетчики попаданий, промахов и вытеснений
+    """
+    def __init__(self, max_size):
+        """
+        :param int max_size: Максимальный объем кэша в байтах, 0 - кэширование отключено
+        :return:
+        """
+        self.max_size = max_size
+        self.size = 0
+        self.items = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, key):
+        return key in self.items
+
+    def get(self, key, default=None):
+        """
+        Получение значения из кэша, значение становится последним использованным
+        :param key: Ключ
+        :param default: Значение, возвращаемое при промахе
+        :return: Значение
+        """
+        item = self.items.get(key)
+        if item is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self.items.move_to_end(key)
+        return item[0]
+
+    def put(self, key, value, size=None):
+        """
+        Помещение значения в кэш, при превышении объема вытесняются давно не использованные значения
+        Значение больше объема кэша не помещается, прежнее значение ключа при этом удаляется
+        :param key: Ключ
+        :param value: Значение
+        :param int size: Объем значения в байтах, по умолчанию len(value)
+        :return:
+        """
+        size = len(value) if size is None else size
+        old = self.items.pop(key, None)
+        if old is not None:
+            self.size -= old[1]
+        if size > self.max_size:
+            return
+        self.items[key] = (value, size)
+        self.size += size
+        while self.size > self.max_size:
+            _, (_, old_size) = self.items.popitem(last=False)
+            self.size -= old_size
+            self.evictions += 1
+
+    def clear(self):
+        """
+        Очистка кэша, счетчики сохраняются
+        :return:
+        """
+        self.items.clear()
+        self.size = 0
+
+    def stats(self):
+        """
+        Статистика использования кэша
+        :return dict:
+        """
+        requests = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / requests if requests else 0.0,
+            'items': len(self.items),
+            'size': self.size,
+            'max_size': self.max_size,
+        }
+
+
 class BlockReader:
     """
     Базовый класс для блочных чтецов
@@ -94,23 +207,23 @@ class BlockReader:
     def read_obj(self, *args):
         """
         Чтитает объект из потока
+        Если объект получен одним куском (например, непрерывный участок отображенного в память файла),
+        он возвращается без копирования
         :param args: список параметров
-        :return:
+        :return: bytes или memoryview с данными объекта
         """
         gen = self.read_obj_iter(*args)
         if gen is None:
             return None
         try:
-            obj_data = bytearray(b'\x00' * next(gen))
+            next(gen)
         except StopIteration:
             return None
 
-        pos = 0
-        for buff in gen:
-            obj_data[pos: pos + len(buff)] = buff
-            pos += len(buff)
-
-        return obj_data
+        parts = list(gen)
+        if len(parts) == 1:
+            return parts[0]
+        return b''.join(parts)
 
 
 logger = logging.getLogger('1CD')
\ No newline at end of file
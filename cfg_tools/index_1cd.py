@@ -0,0 +1,314 @@
+# -*- coding: utf-8 -*-
+"""
+Чтение индексов таблиц 1CD (формат 8.2.14)
+
+Файл индексов таблицы:
+    uint32 количество индексов, uint32[] смещения заголовков индексов
+Заголовок индекса:
+    uint32 смещение корневой страницы, int16 длина ключа
+Страница индекса (4096 байт):
+    uint16 флаги (1 - корневая, 2 - листовая), uint16 количество записей, uint32 пред. страница, uint32 след. страница
+    Ветвь: записи [ключ, uint32 номер записи (big-endian), uint32 смещение дочерней страницы (big-endian)]
+    Лист: uint16 свободно, uint32 маска номера записи, uint16 маски left/right, uint16 разрядности numrec/left/right,
+          uint16 размер упакованной записи. Упакованные записи (номер записи, left, right) идут от начала страницы,
+          ключи - от конца страницы. Ключ собирается из left байт предыдущего ключа, хранимой части
+          и right байт заполнения
+
+Формат проверяется при чтении (длина ключа, маски и разрядности листа, ссылки на страницы, порядок ключей),
+при несоответствии возникает IndexFormatError (см. Reader1CD.seek_table)
+"""
+import re
+import logging
+from struct import unpack_from
+
+logger = None
+
+PAGE_IS_ROOT = 1
+PAGE_IS_LEAF = 2
+BRANCH_HEADER_SIZE = 12
+LEAF_HEADER_SIZE = 30
+NO_PAGE = (0, 0xffffffff)
+
+
+class IndexFormatError(Exception):
+    """
+    Данные файла индексов не соответствуют ожидаемому формату
+    """
+
+
+class IndexDesc:
+    """
+    Описание индекса таблицы
+    """
+    def __init__(self, **kwargs):
+        self.name = kwargs.pop('name')
+        self.is_primary = kwargs.pop('is_primary', False)
+        self.fields = kwargs.pop('fields', [])
+        self.number = kwargs.pop('number', 0)
+
+    def key_length(self, table_desc):
+        """
+        Длина ключа индекса (см. encode_key_field)
+        :param TableDesc table_desc: Описание таблицы
+        :return int:
+        """
+        length = 0
+        for name, _ in self.fields:
+            field = table_desc.field_by_name(name)
+            length += field.byte_size - (2 if field.type == 'NVC' else 0)
+        return length
+
+    def print_info(self):
+        """
+        Вывод описания индекса в консоль
+        :return:
+        """
+        print('          name:', self.name)
+        print('    is_primary:', self.is_primary)
+        print('        fields:', ', '.join('%s(%s)' % (name, length) for name, length in self.fields))
+
+    def encode_key(self, table_desc, values):
+        """
+        Формирует двоичный ключ (или префикс ключа) индекса по значениям полей
+        :param TableDesc table_desc: Описание таблицы
+        :param values: Значения первых полей индекса (кортеж или одно значение)
+        :return bytes:
+        """
+        if not isinstance(values, (tuple, list)):
+            values = (values, )
+        if len(values) > len(self.fields):
+            raise Exception('Количество значений ключа больше количества полей индекса "%s"' % self.name)
+        return b''.join(encode_key_field(table_desc.field_by_name(name), value)
+                        for (name, _), value in zip(self.fields, values))
+
+
+def encode_key_field(field, value):
+    """
+    Двоичное представление значения поля в ключе индекса
+    Строки приводятся к верхнему регистру (если поле не чувствительно к регистру) и дополняются пробелами
+    :param FieldDesc field: Описание поля
+    :param value: Значение
+    :return bytes:
+    """
+    size = field.byte_size - (1 if field.nullable else 0)
+    if value is None:
+        if not field.nullable:
+            raise Exception('Поле "%s" не допускает значение NULL' % field.name)
+        return b'\x00' * (size + 1)
+    if field.type in ('NC', 'NVC'):
+        if not field.case_sensitive:
+            value = value.upper()
+        raw = value.ljust(field.length).encode('utf-16-le')
+    else:
+        raw = field.encode(value)
+    return b'\x01' + raw if field.nullable else raw
+
+
+def parse_indexes(text):
+    """
+    Разбирает секцию Indexes описания таблицы
+    :param str text: Текст секции (после "Indexes")
+    :return list: Описания индексов
+    """
+    indexes = []
+    for number, item in enumerate(re.finditer(r'{"([^"]+)",(\d+),\s*((?:{"[^"]+",\d+},?\s*)+)}', text)):
+        indexes.append(IndexDesc(name=item.group(1),
+                                 is_primary=item.group(2) == '1',
+                                 fields=[(field.group(1), int(field.group(2)))
+                                         for field in re.finditer(r'{"([^"]+)",(\d+)}', item.group(3))],
+                                 number=number))
+    return indexes
+
+
+class IndexReader:
+    """
+    Чтение файла индексов таблицы
+    """
+    def __init__(self, reader, obj_size, address):
+        """
+        :param FileBlockReader reader: Ридер файла 1CD
+        :param int obj_size: Размер файла индексов
+        :param list address: Адреса страниц файла индексов
+        """
+        self.reader = reader
+        self.size = obj_size
+        self.address = address
+        self.page_size = reader.PAGE_SIZE
+        self.starts = None
+
+    def read(self, offset, size):
+        """
+        Чтение данных файла индексов
+        :param int offset: Смещение в файле индексов
+        :param int size: Размер
+        :return:
+        """
+        page = self.reader.read_block(self.address[offset // self.page_size])
+        pos = offset % self.page_size
+        if pos + size <= self.page_size:
+            return page[pos: pos + size]
+        return bytes(page[pos:]) + bytes(self.read((offset // self.page_size + 1) * self.page_size,
+                                                   size - (self.page_size - pos)))
+
+    def read_page(self, offset):
+        """
+        Чтение страницы индекса
+        :param int offset: Смещение страницы в файле индексов
+        :return:
+        """
+        return self.read(offset, self.page_size)
+
+    def get_root(self, number):
+        """
+        Получение корневой страницы и длины ключа индекса
+        :param int number: Номер индекса в описании таблицы
+        :return tuple(int, int): смещение корневой страницы, длина ключа
+        """
+        if self.starts is None:
+            count = unpack_from('<I', self.read(0, 4))[0]
+            if 4 + 4 * count > min(self.size, self.page_size):
+                raise IndexFormatError('Неверное количество индексов: %s' % count)
+            self.starts = unpack_from('<%sI' % count, self.read(4, 4 * count))
+        if number >= len(self.starts):
+            raise Exception('Индекс %s отсутствует в файле индексов' % number)
+        if self.starts[number] + 6 > self.size:
+            raise IndexFormatError('Неверное смещение заголовка индекса %s: %s' % (number, self.starts[number]))
+        header = self.read(self.starts[number], 6)
+        root, length = unpack_from('<I', header)[0], unpack_from('<h', header, 4)[0]
+        self.check_page(root)
+        if length <= 0:
+            raise IndexFormatError('Неверная длина ключа индекса %s: %s' % (number, length))
+        return root, length
+
+    def check_page(self, offset):
+        """
+        Проверка ссылки на страницу индекса
+        :param int offset: Смещение страницы
+        :return:
+        """
+        if offset % self.page_size or offset + self.page_size > self.size:
+            raise IndexFormatError('Неверное смещение страницы индекса: %s' % offset)
+
+    @staticmethod
+    def branch_entries(page, length):
+        """
+        Записи страницы-ветви
+        :param page: Данные страницы
+        :param int length: Длина ключа
+        :return list: (ключ, номер записи, смещение дочерней страницы)
+        """
+        count = unpack_from('<H', page, 2)[0]
+        if BRANCH_HEADER_SIZE + count * (length + 8) > len(page):
+            raise IndexFormatError('Записи страницы-ветви не помещаются на странице: %s' % count)
+        entries = []
+        pos = BRANCH_HEADER_SIZE
+        for i in range(count):
+            key = bytes(page[pos: pos + length])
+            record, child = unpack_from('>II', page, pos + length)
+            entries.append((key, record, child))
+            pos += length + 8
+        return entries
+
+    @staticmethod
+    def leaf_entries(page, length):
+        """
+        Записи листовой страницы
+        :param page: Данные страницы
+        :param int length: Длина ключа
+        :return list: (ключ, номер записи)
+        """
+        count, = unpack_from('<H', page, 2)
+        numrec_mask, left_mask, right_mask, numrec_bits, left_bits, right_bits, rec_bytes = \
+            unpack_from('<IHHHHHH', page, 14)
+        if numrec_mask != (1 << numrec_bits) - 1 or left_mask != (1 << left_bits) - 1 or \
+                right_mask != (1 << right_bits) - 1 or numrec_bits + left_bits + right_bits > rec_bytes * 8 or \
+                LEAF_HEADER_SIZE + count * rec_bytes > len(page):
+            raise IndexFormatError('Неверный заголовок листовой страницы индекса')
+        entries = []
+        key = bytearray(length)
+        pos = LEAF_HEADER_SIZE
+        key_pos = len(page)
+        for i in range(count):
+            packed = int.from_bytes(page[pos: pos + rec_bytes], 'little')
+            pos += rec_bytes
+            record = packed & numrec_mask
+            packed >>= numrec_bits
+            left = packed & left_mask
+            packed >>= left_bits
+            right = packed & right_mask
+            stored = length - left - right
+            if stored < 0 or left and not entries or key_pos - stored < pos:
+                raise IndexFormatError('Неверная запись листовой страницы индекса: %s' % i)
+            key_pos -= stored
+            key[left: left + stored] = page[key_pos: key_pos + stored]
+            key[length - right: length] = bytes(right)
+            entries.append((bytes(key), record))
+        return entries
+
+    def find_leaf(self, root, length, low):
+        """
+        Поиск листовой страницы, с которой начинаются ключи не меньше low
+        В ветви выбирается запись, предшествующая первой записи с ключом не меньше low:
+        дальнейший проход по цепочке листьев отсекает лишние ключи
+        :param int root: Смещение корневой страницы
+        :param int length: Длина ключа
+        :param bytes low: Нижняя граница (префикс ключа), None - с начала индекса
+        :return: Смещение листовой страницы
+        """
+        offset = root
+        visited = set()
+        while True:
+            if offset in visited:
+                raise IndexFormatError('Цикл в дереве индекса: %s' % offset)
+            visited.add(offset)
+            self.check_page(offset)
+            page = self.read_page(offset)
+            if unpack_from('<H', page)[0] & PAGE_IS_LEAF:
+                return offset
+            entries = self.branch_entries(page, length)
+            if not entries:
+                return None
+            ind = 0
+            if low is not None:
+                size = len(low)
+                while ind < len(entries) and entries[ind][0][:size] < low:
+                    ind += 1
+                ind = max(ind - 1, 0)
+            offset = entries[ind][2]
+
+    def iter_range(self, number, low=None, high=None, key_length=None):
+        """
+        Итератор номеров записей в порядке индекса в диапазоне ключей [low, high]
+        :param int number: Номер индекса в описании таблицы
+        :param bytes low: Нижняя граница (префикс ключа), None - без ограничения
+        :param bytes high: Верхняя граница (префикс ключа), None - без ограничения
+        :param int key_length: Ожидаемая длина ключа (см. IndexDesc.key_length), None - не проверять
+        :return: (ключ, номер записи)
+        """
+        root, length = self.get_root(number)
+        if key_length is not None and length != key_length:
+            raise IndexFormatError('Длина ключа индекса %s: %s, ожидается %s' % (number, length, key_length))
+        offset = self.find_leaf(root, length, low)
+        low_size = len(low) if low is not None else 0
+        high_size = len(high) if high is not None else 0
+        visited = set()
+        prev_key = None
+        while offset not in NO_PAGE and offset is not None:
+            if offset in visited:
+                raise IndexFormatError('Цикл в цепочке листовых страниц индекса: %s' % offset)
+            visited.add(offset)
+            self.check_page(offset)
+            page = self.read_page(offset)
+            for key, record in self.leaf_entries(page, length):
+                if prev_key is not None and key < prev_key:
+                    raise IndexFormatError('Нарушен порядок ключей индекса %s' % number)
+                prev_key = key
+                if low is not None and key[:low_size] < low:
+                    continue
+                if high is not None and key[:high_size] > high:
+                    return
+                yield key, record
+            offset = unpack_from('<I', page, 8)[0]
+
+
+logger = logging.getLogger('1CD')
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""
+Счетчики и таймеры стадий выгрузки, отчет выполнения в формате JSON
+Значения накапливаются итогом, по таблицам (если указана таблица) и по версиям: версия задается для потока
+(см. Metrics.set_version), поэтому стадии конвейера, обрабатывающие разные версии в разных потоках,
+учитываются каждая в своей версии
+"""
+import json
+import logging
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+
+logger = None
+
+
+class Metrics:
+    """
+    Сбор счетчиков и времени стадий выгрузки
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.started = datetime.now()
+        self.start_time = time.perf_counter()
+        self.counters = defaultdict(int)
+        self.timers = defaultdict(lambda: [0, 0.0])
+        self.tables = defaultdict(lambda: defaultdict(int))
+        self.versions = {}
+        self.info = {}
+
+    def set_version(self, version):
+        """
+        Задает версию, к которой относятся значения, собираемые в текущем потоке
+        :param int version: Номер версии, None - значения не относятся к версии
+        :return:
+        """
+        self.local.version = version
+        if version is not None and version not in self.versions:
+            with self.lock:
+                self.versions.setdefault(version, (defaultdict(int), defaultdict(lambda: [0, 0.0])))
+
+    def add(self, name, value=1, table=None):
+        """
+        Увеличивает счетчик
+        :param str name: Имя счетчика
+        :param int value: Значение
+        :param str table: Имя таблицы, None - счетчик не относится к таблице
+        :return:
+        """
+        version = getattr(self.local, 'version', None)
+        with self.lock:
+            self.counters[name] += value
+            if table is not None:
+                self.tables[table][name] += value
+            if version is not None:
+                self.versions[version][0][name] += value
+
+    def add_time(self, name, seconds):
+        """
+        Учитывает выполнение стадии
+        :param str name: Имя таймера
+        :param float seconds: Длительность
+        :return:
+        """
+        version = getattr(self.local, 'version', None)
+        with self.lock:
+            timer = self.timers[name]
+            timer[0] += 1
+            timer[1] += seconds
+            if version is not None:
+                timer = self.versions[version][1][name]
+                timer[0] += 1
+                timer[1] += seconds
+
+    @contextmanager
+    def timer(self, name):
+        """
+        Замер времени выполнения блока
+        :param str name: Имя таймера
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def timed_iter(self, iterable, name):
+        """
+        Итератор с замером времени получения каждого элемента (например, стадии чтения версий)
+        :param iterable: Исходный итератор
+        :param str name: Имя таймера
+        :return:
+        """
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self.add_time(name, time.perf_counter() - start)
+            yield item
+
+    def set_info(self, name, value):
+        """
+        Дополнительные сведения отчета (параметры, статистика кэшей)
+        """
+        with self.lock:
+            self.info[name] = value
+
+    @staticmethod
+    def __timers_report(timers):
+        return {name: {'count': count, 'seconds': round(seconds, 6)} for name, (count, seconds) in sorted(timers.items())}
+
+    def report(self):
+        """
+        Отчет выполнения
+        :return dict:
+        """
+        with self.lock:
+            return {
+                'started': self.started.isoformat(timespec='seconds'),
+                'duration': round(time.perf_counter() - self.start_time, 6),
+                'info': dict(self.info),
+                'counters': dict(sorted(self.counters.items())),
+                'timers': self.__timers_report(self.timers),
+                'tables': {name: dict(sorted(counters.items())) for name, counters in sorted(self.tables.items())},
+                'versions': [{'version': version,
+                              'counters': dict(sorted(counters.items())),
+                              'timers': self.__timers_report(timers)}
+                             for version, (counters, timers) in sorted(self.versions.items())],
+            }
+
+    def save(self, file_name):
+        """
+        Сохраняет отчет в файл JSON
+        :param str file_name: Имя файла
+        :return:
+        """
+        with open(file_name, 'w', encoding='utf-8') as f:
+            json.dump(self.report(), f, ensure_ascii=False, indent=1, default=str)
+        logger.info('Отчет выполнения сохранен: %s' % file_name)
+
+
+logger = logging.getLogger('MNG')
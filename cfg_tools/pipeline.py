@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+Конвейер обработки: источник и последовательные стадии выполняются в отдельных потоках,
+между стадиями - очереди ограниченного размера (при заполнении очереди предыдущая стадия ожидает).
+Каждая стадия выполняется одним потоком, поэтому порядок элементов сохраняется
+"""
+import logging
+import queue
+import threading
+
+logger = None
+
+WAIT_TIMEOUT = 0.1
+
+
+class _End:
+    """
+    Признак окончания данных
+    """
+    pass
+
+
+class _Failure:
+    """
+    Ошибка, возникшая в стадии конвейера, передается потребителю
+    """
+    def __init__(self, error):
+        self.error = error
+
+
+class Pipeline:
+    """
+    Конвейер обработки элементов
+    """
+    def __init__(self, source, stages, queue_size=2):
+        """
+        :param source: Итерируемый источник элементов, перебирается в отдельном потоке
+        :param list stages: Функции стадий: элемент -> результат
+        :param int queue_size: Размер очередей между стадиями
+        """
+        self.source = source
+        self.stages = stages
+        self.queue_size = queue_size
+        self.stopped = threading.Event()
+
+    def _put(self, output, item):
+        """
+        Помещает элемент в очередь, ожидая освобождения места
+        :return bool: False - конвейер остановлен
+        """
+        while not self.stopped.is_set():
+            try:
+                output.put(item, timeout=WAIT_TIMEOUT)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _get(self, source):
+        """
+        Получает элемент из очереди
+        :return: Элемент, None - конвейер остановлен
+        """
+        while not self.stopped.is_set():
+            try:
+                return source.get(timeout=WAIT_TIMEOUT)
+            except queue.Empty:
+                pass
+        return None
+
+    def _run_source(self, output):
+        try:
+            for item in self.source:
+                if not self._put(output, item):
+                    return
+        except BaseException as e:
+            self._put(output, _Failure(e))
+            return
+        self._put(output, _End)
+
+    def _run_stage(self, func, source, output):
+        while True:
+            item = self._get(source)
+            if item is None:
+                return
+            if item is _End or isinstance(item, _Failure):
+                self._put(output, item)
+                return
+            try:
+                result = func(item)
+            except BaseException as e:
+                self._put(output, _Failure(e))
+                return
+            if not self._put(output, result):
+                return
+
+    def __iter__(self):
+        queues = [queue.Queue(self.queue_size) for _ in range(len(self.stages) + 1)]
+        threads = [threading.Thread(target=self._run_source, args=(queues[0], ), daemon=True)]
+        for ind, func in enumerate(self.stages):
+            threads.append(threading.Thread(target=self._run_stage,
+                                            args=(func, queues[ind], queues[ind + 1]),
+                                            daemon=True))
+        for thread in threads:
+            thread.start()
+        try:
+            while True:
+                item = queues[-1].get()
+                if item is _End:
+                    break
+                if isinstance(item, _Failure):
+                    raise item.error
+                yield item
+        finally:
+            self.stopped.set()
+            for thread in threads:
+                thread.join()
+            logger.debug('Конвейер остановлен')
+
+
+logger = logging.getLogger('Store')
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""
+Условия отбора записей таблиц 1CD
+Условия проверяются по двоичным данным записи до ее разбора: для GUID, B, L, N, DT сравниваются байты поля,
+для остальных типов разбирается только проверяемое поле. Значения N, не представимые точно в поле
+(дробная часть длиннее precision), сравниваются с разобранным значением поля.
+
+Пример:
+    reader.read_table_by_name('HISTORY', where=[Between('VERNUM', 10, 20), In('OBJID', ids)])
+"""
+from abc import ABC, abstractmethod
+from struct import Struct
+
+
+class Predicate(ABC):
+    """
+    Базовый класс условия отбора по значению поля
+    """
+    def __init__(self, field_name):
+        """
+        :param str field_name: Имя поля
+        """
+        self.field_name = field_name
+
+    @abstractmethod
+    def compile(self, table_desc):
+        """
+        Формирует функцию проверки записи
+        :param TableDesc table_desc: Описание таблицы
+        :return: Функция check(data) -> bool, data - двоичные данные записи
+        """
+
+    @staticmethod
+    def _raw_getter(field):
+        """
+        Функция получения двоичного значения поля (без признака NULL) из данных записи
+        :param FieldDesc field: Описание поля
+        :return:
+        """
+        offset = field.offset + 1 if field.nullable else field.offset
+        unpack = Struct('%ss' % (field.byte_size - (1 if field.nullable else 0))).unpack_from
+        return lambda data: unpack(data, offset)[0]
+
+    def _field(self, table_desc):
+        """
+        :param TableDesc table_desc: Описание таблицы
+        :return tuple(FieldDesc, function): описание поля и функция разбора значения поля из данных записи
+        """
+        ind = table_desc.index_by_field_name(self.field_name)
+        return table_desc.fields[ind], table_desc.field_decoders[ind]
+
+
+class Equal(Predicate):
+    """
+    Значение поля равно заданному, None - значение NULL
+    """
+    def __init__(self, field_name, value):
+        super(Equal, self).__init__(field_name)
+        self.value = value
+
+    def compile(self, table_desc):
+        field, decode = self._field(table_desc)
+        offset = field.offset
+        if self.value is None:
+            if not field.nullable:
+                return lambda data: False
+            return lambda data: data[offset] == 0
+        if not field.raw_comparable or not field.encodes_exactly(self.value):
+            value = self.value
+            return lambda data: decode(data) == value
+        raw = field.encode(self.value)
+        get = self._raw_getter(field)
+        if field.nullable:
+            return lambda data: data[offset] != 0 and get(data) == raw
+        return lambda data: get(data) == raw
+
+
+class NotEqual(Equal):
+    """
+    Значение поля не равно заданному, None - значение NULL
+    """
+    def compile(self, table_desc):
+        equal = super(NotEqual, self).compile(table_desc)
+        return lambda data: not equal(data)
+
+
+class In(Predicate):
+    """
+    Значение поля входит в набор значений, None в наборе - значение NULL
+    """
+    def __init__(self, field_name, values):
+        super(In, self).__init__(field_name)
+        self.values = values
+
+    def compile(self, table_desc):
+        field, decode = self._field(table_desc)
+        offset = field.offset
+        with_null = field.nullable and None in self.values
+        if not field.raw_comparable or \
+                not all(field.encodes_exactly(value) for value in self.values if value is not None):
+            values = set(value for value in self.values if value is not None)
+            if field.nullable:
+                return lambda data: with_null if data[offset] == 0 else decode(data) in values
+            return lambda data: decode(data) in values
+        values = frozenset(field.encode(value) for value in self.values if value is not None)
+        get = self._raw_getter(field)
+        if field.nullable:
+            return lambda data: with_null if data[offset] == 0 else get(data) in values
+        return lambda data: get(data) in values
+
+
+class Between(Predicate):
+    """
+    Значение поля в интервале [low, high] (включительно), None - граница не задана
+    Записи со значением NULL не проходят отбор
+    """
+    def __init__(self, field_name, low=None, high=None):
+        super(Between, self).__init__(field_name)
+        self.low = low
+        self.high = high
+
+    def __raw_ordered(self, field):
+        """
+        Проверяет, что границы можно сравнивать с двоичными значениями поля
+        Для N порядок двоичных значений совпадает с порядком значений только для неотрицательных значений
+        (знак хранится отдельной тетрадой), но при неотрицательных границах отрицательные значения все равно
+        отсекаются верно. Граница должна быть представима в поле точно, иначе округление сдвинет интервал
+        :param FieldDesc field: Описание поля
+        :return bool:
+        """
+        if not field.raw_comparable:
+            return False
+        if field.type == 'N':
+            return all(bound is None or bound >= 0 and field.encodes_exactly(bound) for bound in (self.low, self.high))
+        return True
+
+    def compile(self, table_desc):
+        field, decode = self._field(table_desc)
+        offset = field.offset
+        if self.__raw_ordered(field):
+            low = None if self.low is None else field.encode(self.low)
+            high = None if self.high is None else field.encode(self.high)
+            get = self._raw_getter(field)
+        else:
+            low, high, get = self.low, self.high, decode
+
+        if low is not None and high is not None:
+            check = lambda data: low <= get(data) <= high
+        elif low is not None:
+            check = lambda data: low <= get(data)
+        elif high is not None:
+            check = lambda data: get(data) <= high
+        else:
+            check = lambda data: True
+        if field.nullable:
+            return lambda data: data[offset] != 0 and check(data)
+        return check
+
+
+def compile_all(where, table_desc):
+    """
+    Формирует общую функцию проверки записи по списку условий (И)
+    :param list where: Условия отбора
+    :param TableDesc table_desc: Описание таблицы
+    :return: Функция check(data) -> bool
+    """
+    checks = [predicate.compile(table_desc) for predicate in where]
+    if len(checks) == 1:
+        return checks[0]
+
+    def check_all(data):
+        for check in checks:
+            if not check(data):
+                return False
+        return True
+    return check_all
@@ -1,16 +1,27 @@
 # -*- coding: utf-8 -*-
-from struct import unpack
+from struct import unpack, Struct
+from operator import itemgetter
+import keyword
+import binascii
 import logging
 import re
 from datetime import datetime
 import cfg_tools.utils as utils
-from cfg_tools.common import BlockReader, Guid
+from cfg_tools.common import BlockReader, Guid, LRUCache
+from cfg_tools import codec
+from cfg_tools import columnar
+from cfg_tools import predicates
+from cfg_tools import index_1cd
 import os
+import mmap
+import itertools
+import marshal
+import threading
 
 logger = None
 
 
-def parse_table_info(info):
+def parse_table_info(info, reader=None):
     result = re.compile('{"(.+)",(\d+),\n{"Fields",([\s\S]+)},\n{"Indexes"([\s\S]*)},\n{"Recordlock","(\d)"},\n{"Files",(\d+),(\d+),(\d+)}').match(info)
 
     _iter = re.compile('{"(.+)","(.+)",(\d+),(\d+),(\d+),"(.+)"}').finditer(result.group(3))
@@ -23,12 +34,13 @@ def parse_table_info(info):
 
     table_desc = TableDesc(name=result.group(1),
                            fields=fields,
-                           indexes=[],
+                           indexes=index_1cd.parse_indexes(result.group(4)),
                            record_lock=result.group(5) == '1',
                            data_addr=int(result.group(6)),
                            blob_addr=int(result.group(7)),
                            index_addr=int(result.group(8)),
-                           text=info)
+                           text=info,
+                           reader=reader)
 
     return table_desc
 
@@ -54,16 +66,64 @@ types_sz = {
 Функции преобразования значений из двоичных, f - параметры типа, x - дв. данные значения
 """
 types_fun = {
-    'GUID': lambda f, x:  Guid(x),
+    'GUID': lambda f, x:  Guid.intern(bytes(x)),
     'B': lambda f, x: utils.b2s(x),
     'L': lambda f, x: x[0] == 1,
-    'N': lambda f, x: utils.bytes_to_int(f, x),
-    'NC': lambda f, x: x.decode('utf-16'),
-    'NVC': lambda f, x: x[2:2 + 2 * utils.read_struct(x[:2], 'h')[0]].decode('utf-16'),
+    'N': codec.decode_numeric,
+    'NC': lambda f, x: codec.decode_nc(x),
+    'NVC': lambda f, x: codec.decode_nvc(x),
     'RV': lambda f, x: utils.read_struct(x, '4I'),
     'NT': lambda f, x: utils.read_struct(x, '2I'),
     'I': lambda f, x: utils.read_struct(x, '2I'),
-    'DT': lambda f, x: utils.bytes_to_datetime(f, x)
+    'DT': lambda f, x: codec.decode_datetime(x)
+}
+
+
+"""
+Функции преобразования значений в двоичное представление (обратные types_fun), f - параметры типа, x - значение
+Заданы для типов, двоичное представление которых однозначно и сравнимо побайтно
+"""
+types_encode = {
+    'GUID': lambda f, x: x.data if isinstance(x, Guid) else utils.guid_to_bytes(x) if isinstance(x, str) else bytes(x),
+    'B': lambda f, x: binascii.unhexlify(x) if isinstance(x, str) else bytes(x),
+    'L': lambda f, x: b'\x01' if x else b'\x00',
+    'N': lambda f, x: utils.int_to_bytes(f, x),
+    'DT': lambda f, x: utils.datetime_to_bytes(f, x),
+}
+
+
+"""
+Форматы struct физического представления типов для компилируемого декодера строк, x - логический размер типа
+"""
+types_struct = {
+    'GUID': lambda x: '16s',
+    'B': lambda x: '%ss' % x,
+    'L': lambda x: 'B',
+    'N': lambda x: '%ss' % ((x + 2) // 2),
+    'NC': lambda x: '%ss' % (x * 2),
+    'NVC': lambda x: 'h%ss' % (x * 2),
+    'RV': lambda x: '4I',
+    'NT': lambda x: '2I',
+    'I': lambda x: '2I',
+    'DT': lambda x: '7s',
+}
+
+
+"""
+Выражения преобразования значений для компилируемого декодера строк,
+{0}, {1}... - значения, полученные struct для поля, {f} - описание поля
+"""
+types_expr = {
+    'GUID': 'intern_guid({0})',
+    'B': 'b2s({0})',
+    'L': '{0} == 1',
+    'N': 'decode_numeric({f}, {0})',
+    'NC': "{0}.decode('utf-16')",
+    'NVC': "{1}[:2 * {0}].decode('utf-16')",
+    'RV': '({0}, {1}, {2}, {3})',
+    'NT': '({0}, {1})',
+    'I': '({0}, {1})',
+    'DT': 'decode_datetime({0})',
 }
 
 
@@ -81,6 +141,37 @@ class FieldDesc:
         self.offset = 0
         self.byte_size = 0
 
+    @property
+    def raw_comparable(self):
+        """
+        Значения поля можно сравнивать по двоичному представлению
+        :return bool:
+        """
+        return self.type in types_encode
+
+    def encode(self, value):
+        """
+        Преобразование значения в двоичное представление поля (без признака NULL)
+        :param value: Значение
+        :return bytes:
+        """
+        if self.type not in types_encode:
+            raise Exception('Для типа "%s" (поле "%s") не поддерживается двоичное представление' %
+                            (self.type, self.name))
+        return types_encode[self.type](self, value)
+
+    def encodes_exactly(self, value):
+        """
+        Значение представимо в двоичном виде поля без округления: для N дробная часть умещается в precision знаков
+        Иначе encode округляет значение, и сравнивать по двоичному представлению нельзя
+        :param value: Значение
+        :return bool:
+        """
+        if self.type != 'N':
+            return True
+        scaled = value * 10 ** self.precision
+        return scaled == round(scaled)
+
     def print_info(self):
         """
         Вывод описания поля в консоль
@@ -109,6 +200,7 @@ class TableDesc:
         self.data_addr      = kwargs.pop('data_addr', 0)
         self.blob_addr      = kwargs.pop('blob_addr', 0)
         self.index_addr     = kwargs.pop('index_addr', 0)
+        self.reader         = kwargs.pop('reader', None)
         self.row_size = 0
         self.table_size = 0
         self.rows_count = 0
@@ -116,8 +208,15 @@ class TableDesc:
         self.content_data = None
         self.fields_indexes = None
         self.blob_fields = None
+        self.row_struct = None
+        self.row_class = None
+        self.lazy_row_class = None
+        self.decode_row = None
+        self.field_decoders = None
 
-        self.blob_reader = BlobReader(self.blob_addr) if self.blob_addr else None
+        self.blob_reader = None
+        if self.reader is not None:
+            self.attach(self.reader)
 
     def init(self):
         """
@@ -152,6 +251,114 @@ class TableDesc:
             field.offset = self.row_size
             self.row_size += field.byte_size
 
+        self.row_class = self.__make_row_class(Row)
+        self.lazy_row_class = self.__make_row_class(LazyRow)
+        self.decode_row = self.__compile_decoder()
+
+    def __make_row_class(self, base):
+        """
+        Создает класс строки таблицы с доступом к полям как к атрибутам
+        :param base: Базовый класс (Row или LazyRow)
+        :return: Класс-наследник base
+        """
+        attrs = {
+            '__slots__': (),
+            'table': self,
+        }
+        if base is Row:
+            attrs['__init__'] = list.__init__
+        for ind, field in enumerate(self.fields):
+            if field.name.isidentifier() and not keyword.iskeyword(field.name) and not hasattr(base, field.name):
+                attrs[field.name] = property(itemgetter(ind))
+        return type('%s_%s' % (base.__name__, self.name), (base,), attrs)
+
+    @staticmethod
+    def __field_expr(field, ind, pos):
+        """
+        Формирует формат struct и выражение преобразования значения поля
+        :param FieldDesc field: Описание поля
+        :param int ind: Индекс поля
+        :param int pos: Индекс первого значения поля в результате struct
+        :return tuple(str, str, int): формат, выражение, индекс значения следующего поля
+        """
+        layout = ''
+        null_flag = None
+        if field.nullable:
+            layout = 'B'
+            null_flag = 'v[%s]' % pos
+            pos += 1
+        field_layout = types_struct[field.type](field.length)
+        layout += field_layout
+        count = len(Struct('<' + field_layout).unpack(bytes(Struct('<' + field_layout).size)))
+        expr = types_expr[field.type].format(*['v[%s]' % (pos + i) for i in range(count)], f='f%s' % ind)
+        pos += count
+        if field.nullable:
+            expr = '(%s) if %s else None' % (expr, null_flag)
+        return layout, expr, pos
+
+    def __compile_decoder(self):
+        """
+        Компилирует функции декодирования строки таблицы
+        Вся строка разбирается одним вызовом struct, преобразования значений подставляются в код функции.
+        Для отложенного разбора (LazyRow) дополнительно компилируются функции декодирования отдельных полей
+        :return: Функция decode_row(data, offset=0), возвращающая строку таблицы
+        """
+        env = {
+            'intern_guid': Guid.intern,
+            'b2s': utils.b2s,
+            'decode_numeric': codec.decode_numeric,
+            'decode_datetime': codec.decode_datetime,
+            'Row': self.row_class,
+        }
+        layout = ['<B']
+        exprs = []
+        pos = 1
+        source = []
+        for ind, field in enumerate(self.fields):
+            env['f%s' % ind] = field
+            field_layout, expr, pos = self.__field_expr(field, ind, pos)
+            layout.append(field_layout)
+            exprs.append(expr)
+
+            env['unpack_f%s' % ind] = Struct('<' + field_layout).unpack_from
+            source.append('def decode_f%s(data, offset=0):\n'
+                          '    v = unpack_f%s(data, offset + %s)\n'
+                          '    return %s\n' % (ind, ind, field.offset, self.__field_expr(field, ind, 0)[1]))
+
+        self.row_struct = Struct(''.join(layout))
+        if self.row_struct.size != self.row_size:
+            raise Exception('Ошибка описания таблицы "%s": размер записи %s, ожидается %s' %
+                            (self.name, self.row_struct.size, self.row_size))
+        env['unpack'] = self.row_struct.unpack_from
+        source.append('def decode_row(data, offset=0):\n'
+                      '    v = unpack(data, offset)\n'
+                      '    return Row([%s])\n' % ', '.join(exprs))
+        env['NOT_READ'] = LazyRow.NOT_READ
+        env['list_get'] = list.__getitem__
+        env['list_set'] = list.__setitem__
+        for ind in range(len(self.fields)):
+            source.append('def lazy_f%s(row):\n'
+                          '    value = list_get(row, %s)\n'
+                          '    if value is NOT_READ:\n'
+                          '        value = decode_f%s(row.data)\n'
+                          '        list_set(row, %s, value)\n'
+                          '    return value\n' % (ind, ind, ind, ind))
+        exec(''.join(source), env)
+        self.field_decoders = [env['decode_f%s' % ind] for ind in range(len(self.fields))]
+        for ind, field in enumerate(self.fields):
+            if field.name in self.lazy_row_class.__dict__:
+                setattr(self.lazy_row_class, field.name, property(env['lazy_f%s' % ind]))
+        return env['decode_row']
+
+    def attach(self, reader):
+        """
+        Подключает описание таблицы к ридеру файла
+        :param FileBlockReader reader: Ридер файла 1CD
+        :return:
+        """
+        self.reader = reader
+        self.blob_reader = BlobReader(self.reader, self.blob_addr) if self.blob_addr else None
+
     def print_info(self):
         """
         Вывод информации о таблице в консоль
@@ -173,19 +380,53 @@ class TableDesc:
         """
         return self.fields_indexes[field_name.upper()]
 
+    def get_index(self, index):
+        """
+        Получение описания индекса по имени или номеру
+        :param index: Имя или номер индекса
+        :return IndexDesc:
+        """
+        if isinstance(index, int):
+            return self.indexes[index]
+        for index_desc in self.indexes:
+            if index_desc.name.upper() == index.upper():
+                return index_desc
+        raise Exception('Не найден индекс "%s" таблицы "%s"' % (index, self.name))
+
+    def field_by_name(self, field_name):
+        """
+        Получение описания поля по имени
+        :param str field_name: Имя поля
+        :return FieldDesc:
+        """
+        return self.fields[self.index_by_field_name(field_name)]
+
+    def new_lazy_row(self, data):
+        """
+        Создание строки с отложенным разбором полей
+        :param data: Данные записи (bytes, memoryview), не копируются
+        :return LazyRow:
+        """
+        return self.lazy_row_class(data, len(self.fields))
+
     def new_row(self):
         """
         Создание новой строки таблицы
         :return: Новую не добавленную строку
         """
-        return Row(self)
+        if self.row_class is None:
+            return Row(self)
+        return self.row_class([None] * len(self.fields))
 
 
 class Row(list):
     """
     Описание строки таблицы
     Список с доступом по именам полей и возможностью чтения BLOB значений
+    Для каждой таблицы создается наследник с доступом к полям как к атрибутам (row.VERNUM)
     """
+    __slots__ = ('table', )
+
     def __init__(self, table):
         self.table = table
         self.extend([None] * len(table.fields))
@@ -196,7 +437,10 @@ class Row(list):
         :param str name: Имя поля
         :return: Значение поля
         """
-        return self[self.table.index_by_field_name(name)]
+        try:
+            return self[self.table.fields_indexes[name]]
+        except KeyError:
+            return self[self.table.index_by_field_name(name)]
 
     def get_blob(self, name):
         """
@@ -211,23 +455,58 @@ class Row(list):
         return val
 
 
+class LazyRow(Row):
+    """
+    Строка таблицы с отложенным разбором полей
+    Хранит ссылку на данные записи, поле разбирается при первом обращении, результат сохраняется
+    """
+    __slots__ = ('data', )
+    NOT_READ = object()
+
+    def __init__(self, data, count):
+        """
+        :param data: Данные записи (bytes, memoryview)
+        :param int count: Количество полей
+        """
+        list.__init__(self, (self.NOT_READ, ) * count)
+        self.data = data
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        value = list.__getitem__(self, index)
+        if value is self.NOT_READ:
+            value = self.table.field_decoders[index](self.data)
+            list.__setitem__(self, index, value)
+        return value
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __repr__(self):
+        return repr(list(self))
+
+
 class BlobReader(BlockReader):
     """
     Чтение BLOB-записей таблицы
+    Страницы читаются через ридер файла и кэшируются его общим кэшем страниц
     """
     CHUNK_SIZE = 256
-    reader = None
 
-    def __init__(self, info_address):
+    def __init__(self, reader, info_address):
         """
         Инициализация ридера
+        Адреса страниц берутся из запомненных адресов объектов ридера (в том числе из кэша каталога)
+        :param FileBlockReader reader: Ридер файла 1CD
         :param info_address: Адрес блока описания объекта BLOB-записей
         :return:
         """
-        self.cache = {}
-        self.ratio = self.reader.CHUNK_SIZE // self.CHUNK_SIZE
+        self.reader = reader
+        self.ratio = self.reader.PAGE_SIZE // self.CHUNK_SIZE
         self.blob_table_addr = info_address
-        self.address = self.reader.get_data_address(self.blob_table_addr)[1]
+        self.address = self.reader.get_object_address(self.blob_table_addr)[1]
 
     def read_block(self, addr):
         """
@@ -235,14 +514,9 @@ class BlobReader(BlockReader):
         :param long addr: адрес(номер блока)
         :return:
         """
-        block_num = addr // self.ratio
-        if block_num not in self.cache:
-            data = self.reader.read_block(self.address[block_num])
-            self.cache[block_num] = data
-            if len(self.cache) > 100:
-                self.cache.clear()
-        else:
-            data = self.cache[block_num]
+        data = self.reader.read_block(self.address[addr // self.ratio])
+        if self.reader.metrics is not None:
+            self.reader.metrics.add('blob_chunks', 1, self.reader.owners.get(self.blob_table_addr))
         offset = (addr % self.ratio) * self.CHUNK_SIZE
         return data[offset: offset + self.CHUNK_SIZE]
 
@@ -265,21 +539,84 @@ class BlobReader(BlockReader):
 class FileBlockReader(BlockReader):
     """
     Блочный ридер для файлов 1CD
+    Может работать через отображение файла в память (mmap), в этом режиме страницы и непрерывные
+    участки объектов возвращаются как memoryview без копирования данных
+    Прочитанные страницы хранятся в LRU-кэше, общем для всех таблиц и BLOB. Страницы отображения файла
+    не кэшируются: они не копируются, а ссылки на них в кэше удерживали бы отображение
+    Чтение страниц потокобезопасно: большие BLOB могут читаться при записи файлов параллельно с чтением таблиц
     """
     PAGE_SIZE = 4096
+    CACHE_SIZE = 64 * 1024 * 1024
 
-    def __init__(self, db_file):
+    def __init__(self, db_file, use_mmap=False, cache_size=CACHE_SIZE, metrics=None):
         """
         :param db_file: Поток чтения
+        :param bool use_mmap: Использовать отображение файла в память
+        :param int cache_size: Объем кэша страниц в байтах
+        :param Metrics metrics: Сбор счетчиков чтения (см. cfg_tools.metrics), None - не собирать
         :return:
         """
         self.db_file = db_file
+        self.position = 0
+        self.cache = LRUCache(cache_size)
+        self.lock = threading.Lock()
+        self.objects_address = {}
+        self.objects_crc = {}
+        # адрес заголовка объекта - имя таблицы, для счетчиков чтения по таблицам
+        self.owners = {}
+        self.metrics = metrics
+        self.mmap = None
+        self.view = None
+        if use_mmap:
+            self.mmap = mmap.mmap(db_file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.view = memoryview(self.mmap)
+
+    def close(self):
+        """
+        Освобождает отображение файла в память
+        Если на данные еще есть ссылки (memoryview), отображение будет закрыто сборщиком мусора
+        :return:
+        """
+        if self.mmap is None:
+            return
+        try:
+            self.view.release()
+            self.mmap.close()
+        except BufferError:
+            logger.debug('Отображение файла используется, закрытие отложено')
+        self.view = None
+        self.mmap = None
+
+    def read_block(self, addr):
+        """
+        Чтение страницы по номеру через кэш страниц (при отображении в память - без кэша)
+        :param long addr: номер страницы
+        :return:
+        """
+        with self.lock:
+            data = self.cache.get(addr) if self.view is None else None
+            if data is None:
+                self._set_position(addr)
+                data = self._read()
+                if self.view is None:
+                    self.cache.put(addr, data)
+                if self.metrics is not None:
+                    self.metrics.add('pages_read')
+                    self.metrics.add('bytes_read', len(data))
+        return data
 
     def _set_position(self, addr):
-        self.db_file.seek(self.PAGE_SIZE * addr)
+        self.position = self.PAGE_SIZE * addr
+        if self.view is None:
+            self.db_file.seek(self.position)
 
     def _read(self, n=None):
-        return self.db_file.read(self.PAGE_SIZE if n is None else n)
+        n = self.PAGE_SIZE if n is None else n
+        if self.view is None:
+            return self.db_file.read(n)
+        data = self.view[self.position: self.position + n]
+        self.position += len(data)
+        return data
 
     def get_data_address(self, info_address):
         """
@@ -304,66 +641,127 @@ class FileBlockReader(BlockReader):
             address.extend(unpack(str(sub_blocks_count) + 'i', block_info[4: 4 + sub_blocks_count * 4]))
         return obj_size, address
 
-    def read_obj_iter(self, obj_addr, part_size=PAGE_SIZE):
+    def get_object_address(self, obj_addr):
+        """
+        Получение размера и адресов страниц объекта, результат запоминается
+        :param int obj_addr: Адрес заголовка объекта
+        :return tuple(int, list): размер объекта, адреса страниц
+        """
+        result = self.objects_address.get(obj_addr)
+        if result is None:
+            result = self.get_data_address(obj_addr)
+            self.objects_address[obj_addr] = result
+            # Контрольная сумма заголовка нужна для проверки актуальности кэша каталога
+            self.objects_crc[obj_addr] = binascii.crc32(self.read_block(obj_addr))
+        return result
+
+    def _iter_chunks(self, obj_size, address, start=0):
+        """
+        Итератор участков данных объекта
+        При чтении из файла возвращает страницы, при отображении в память - непрерывные участки
+        из нескольких страниц без копирования
+        :param int obj_size: Размер объекта
+        :param list address: Адреса страниц объекта
+        :param int start: Смещение в объекте, с которого начинается чтение
+        :return:
+        """
+        first = start // self.PAGE_SIZE
+        skip = start % self.PAGE_SIZE
+        lost = obj_size - first * self.PAGE_SIZE
+        address = itertools.islice(address, first, None)
+        if self.view is None:
+            for addr in address:
+                if not addr or lost <= 0:
+                    return
+                readed = min(lost, self.PAGE_SIZE)
+                lost -= readed
+                data = self.read_block(addr)
+                if readed != self.PAGE_SIZE or skip:
+                    data = data[skip:readed]
+                    skip = 0
+                yield data
+            return
+
+        run_start = None
+        run_len = 0
+        if self.metrics is not None:
+            address = self._count_pages(address, obj_size - first * self.PAGE_SIZE)
+        for addr in address:
+            if not addr or lost <= 0:
+                break
+            readed = min(lost, self.PAGE_SIZE)
+            lost -= readed
+            if run_start is not None and addr * self.PAGE_SIZE == run_start + run_len:
+                run_len += readed
+            else:
+                if run_start is not None:
+                    yield self.view[run_start: run_start + run_len]
+                run_start = addr * self.PAGE_SIZE + skip
+                run_len = readed - skip
+                skip = 0
+        if run_start is not None:
+            yield self.view[run_start: run_start + run_len]
+
+    def _count_pages(self, address, lost):
+        """
+        Учет страниц, читаемых через отображение в память (без кэша страниц)
+        """
+        for addr in address:
+            if addr and lost > 0:
+                self.metrics.add('pages_read')
+                self.metrics.add('bytes_read', min(lost, self.PAGE_SIZE))
+                lost -= self.PAGE_SIZE
+            yield addr
+
+    def _count_chunks(self, chunks, table):
+        """
+        Учет прочитанных данных объекта по таблице
+        """
+        for chunk in chunks:
+            self.metrics.add('object_bytes', len(chunk), table)
+            yield chunk
+
+    def read_obj_iter(self, obj_addr, part_size=None, start=0):
         """
         Итератор чтения объекта
         :param obj_addr: Адрес описания объекта
-        :param part_size: Размер блока чтения(возвразаемого итератором)
+        :param part_size: Размер блока чтения(возвразаемого итератором),
+                          None - участки в том виде, в котором они прочитаны (страницы или непрерывные участки)
+        :param int start: Смещение в объекте, с которого начинается чтение
         :return:
         """
-        obj_size, address = self.get_data_address(obj_addr)
+        obj_size, address = self.get_object_address(obj_addr)
         yield obj_size
-        if obj_size == 0:
+        if obj_size <= start:
+            return
+        chunks = self._iter_chunks(obj_size, address, start)
+        if self.metrics is not None:
+            chunks = self._count_chunks(chunks, self.owners.get(obj_addr))
+        if part_size is None:
+            yield from chunks
             return
-        lost = obj_size
-        buff_pos = 0
-        buff_lost = 0
 
-        address_iter = iter(address)
-
-        if part_size == self.PAGE_SIZE:
-            for addr in address_iter:
-                if not addr:
-                    return
-                self._set_position(addr)
-                readed = min(lost, self.PAGE_SIZE)
-                lost -= readed
-                buff = self._read(readed)
-                yield buff
-        elif part_size < self.PAGE_SIZE:
-            while 1:
-                if buff_lost < part_size:
-                    try:
-                        addr = next(address_iter)
-                    except StopIteration:
-                        break
-                    self.db_file.seek(self.PAGE_SIZE * addr)
-                    readed = min(lost, self.PAGE_SIZE)
-                    lost -= readed
-                    if buff_lost:
-                        buff = buff[buff_pos:] + self.db_file.read(readed)
-                    else:
-                        buff = self.db_file.read(readed)
-                    buff_pos = 0
-                    buff_lost = len(buff)
-
-                yield buff[buff_pos: buff_pos + part_size]
-                buff_pos += part_size
-                buff_lost -= part_size
-        else:
-            buf = b''
-            for addr in address_iter:
-                if not addr:
-                    return
-                self._set_position(addr)
-                readed = min(lost, self.PAGE_SIZE)
-                lost -= readed
-                buf += self._read(readed)
-                if len(buf) >= part_size:
-                    yield buf[:part_size]
-                    buf = buf[part_size:]
-            if len(buf):
-                return buf
+        rest = None
+        for chunk in chunks:
+            # части возвращаются как срезы memoryview, без копирования страницы
+            chunk = memoryview(chunk)
+            pos = 0
+            size = len(chunk)
+            if rest:
+                need = part_size - len(rest)
+                if size < need:
+                    rest += bytes(chunk)
+                    continue
+                yield rest + bytes(chunk[:need])
+                rest = None
+                pos = need
+            while pos + part_size <= size:
+                yield chunk[pos: pos + part_size]
+                pos += part_size
+            if pos < size:
+                rest = bytes(chunk[pos:])
+        if rest and part_size >= self.PAGE_SIZE:
+            yield rest
 
 
 class Reader1CD:
@@ -371,20 +769,34 @@ class Reader1CD:
     Выполняет чтение таблиц db 1CD
     """
 
-    def __init__(self, file_name):
+    CATALOG_FORMAT = 2
+
+    def __init__(self, file_name, use_mmap=False, cache_size=FileBlockReader.CACHE_SIZE, catalog_cache=None,
+                 metrics=None):
         """
         Инициализация объекта
         :param file_name: Имя файла файла 1CD
+        :param bool use_mmap: Читать файл через отображение в память (без копирования страниц)
+        :param int cache_size: Объем кэша страниц в байтах
+        :param str catalog_cache: Имя файла кэша каталога (описания таблиц и адреса страниц объектов),
+                                  None - не использовать
+        :param Metrics metrics: Сбор счетчиков чтения (см. cfg_tools.metrics), None - не собирать
         :return:
         """
         self.file_name = file_name
+        self.use_mmap = use_mmap
+        self.cache_size = cache_size
+        self.catalog_cache = catalog_cache
+        self.metrics = metrics
         self.db_file = None
         self.tables = None
         self.version = None
         self.baseLength = None
         self.lang = None
+        self.root_block = None
+        self.file_identity = None
+        self.catalog_stamp = None
         self.__open_reader()
-        BlobReader.reader = self.reader
 
     def __del__(self):
         """
@@ -401,8 +813,9 @@ class Reader1CD:
         if not os.path.exists(self.file_name):
             raise Exception('Файл хранилища не существует')
 
-        self.db_file = open(self.file_name, 'rb')
-        self.reader = FileBlockReader(self.db_file)
+        db_file = open(self.file_name, 'rb')
+        self.reader = FileBlockReader(db_file, self.use_mmap, self.cache_size, self.metrics)
+        self.db_file = db_file
 
     def __read_root_object(self, obj_addr):
         """
@@ -418,18 +831,27 @@ class Reader1CD:
         address_tables_info = utils.read_struct(obj_data, str(root_info[1]) + 'i', 36)
         tables = []
         for addr in address_tables_info:
-            tables.append(parse_table_info(self.reader.read_obj(addr).decode('UTF-16')))
+            tables.append(parse_table_info(str(self.reader.read_obj(addr), 'UTF-16'), self.reader))
 
         for table in tables:
             table.init()
         return tables, lang
 
+    @property
+    def page_cache(self):
+        """
+        Кэш страниц файла
+        :return LRUCache:
+        """
+        return self.reader.cache
+
     def close_file(self):
         """
         Закрывает файл
         :return:
         """
         if self.db_file:
+            self.reader.close()
             self.db_file.close()
             self.db_file = None
         self.file_name = None
@@ -438,6 +860,28 @@ class Reader1CD:
         """
         Считывает мета-описание db
         Содержащее параметры db и описание таблиц
+        При использовании кэша каталога описание берется из него, если файл не изменился
+        :return:
+        """
+        self.file_identity = self.__file_identity()
+        if self.catalog_cache and self.__load_catalog():
+            logger.debug('Каталог загружен из кэша: %s' % self.catalog_cache)
+        else:
+            self.__read_catalog()
+            if self.catalog_cache:
+                self.save_catalog()
+        for table in self.tables.values():
+            for addr in (table.data_addr, table.blob_addr, table.index_addr):
+                if addr:
+                    self.reader.owners[addr] = table.name
+        logger.debug('version: %s' % self.version)
+        logger.debug('lang: %s' % self.lang)
+        logger.debug('base length: %s' % self.baseLength)
+        logger.debug('tables count: %s' % len(self.tables))
+
+    def __read_catalog(self):
+        """
+        Поиск корневого объекта и чтение описания таблиц из файла
         :return:
         """
         block_num = 0
@@ -454,13 +898,109 @@ class Reader1CD:
                 else:
                     tables, self.lang = self.__read_root_object(block_num)
                     self.tables = {table.name.upper(): table for table in tables}
+                    self.root_block = block_num
+                    self.catalog_stamp = self.__catalog_stamp()
                     break
             block_num += 1
             buffer = self.reader.read_block(block_num)
-        logger.debug('version: %s' % self.version)
-        logger.debug('lang: %s' % self.lang)
-        logger.debug('base length: %s' % self.baseLength)
-        logger.debug('tables count: %s' % len(self.tables))
+
+    def __file_identity(self):
+        """
+        Идентификатор состояния файла: размер, время изменения, заголовок
+        :return tuple:
+        """
+        stat = os.fstat(self.db_file.fileno())
+        return stat.st_size, stat.st_mtime_ns, bytes(self.reader.read_block(0)[:24])
+
+    def __catalog_stamp(self):
+        """
+        Контрольная сумма корневого объекта и заголовков описаний таблиц
+        :return int:
+        """
+        obj_data = self.reader.read_obj(self.root_block)
+        root_info = utils.read_struct(obj_data, '32si')
+        crc = binascii.crc32(obj_data)
+        for addr in utils.read_struct(obj_data, str(root_info[1]) + 'i', 36):
+            crc = binascii.crc32(self.reader.read_block(addr), crc)
+        return crc
+
+    def __load_catalog(self):
+        """
+        Загрузка каталога из кэша
+        Если файл изменился (дописан), проверяется корневой объект, адреса страниц объектов,
+        заголовки которых изменились, отбрасываются и будут прочитаны заново
+        Описания таблиц восстанавливаются разбором сохраненного текста описания
+        :return bool: Каталог загружен
+        """
+        try:
+            with open(self.catalog_cache, 'rb') as f:
+                catalog = marshal.load(f)
+            if catalog.get('format') != self.CATALOG_FORMAT or \
+                    catalog['file_name'] != os.path.abspath(self.file_name):
+                return False
+            tables = [parse_table_info(text) for text in catalog['tables']]
+        except FileNotFoundError:
+            return False
+        except Exception as e:
+            logger.warning('Не удалось прочитать кэш каталога %s: %s' % (self.catalog_cache, e))
+            return False
+
+        objects = catalog['objects']
+        self.root_block = catalog['root_block']
+        if catalog['identity'] != self.file_identity:
+            try:
+                if self.__catalog_stamp() != catalog['stamp']:
+                    logger.debug('Описание таблиц изменилось, кэш каталога не используется')
+                    return False
+            except Exception as e:
+                logger.debug('Кэш каталога не соответствует файлу: %s' % e)
+                return False
+            objects = {addr: item for addr, item in objects.items()
+                       if binascii.crc32(self.reader.read_block(addr)) == item[0]}
+            logger.debug('Кэш каталога обновлен, актуальных объектов: %s из %s' %
+                         (len(objects), len(catalog['objects'])))
+        self.version = catalog['version']
+        self.baseLength = catalog['baseLength']
+        self.lang = catalog['lang']
+        self.catalog_stamp = catalog['stamp']
+        # адреса страниц заполняются до подключения таблиц: ридеры BLOB берут их из кэша, не читая файл
+        for addr, (crc, obj_size, address) in objects.items():
+            self.reader.objects_address[addr] = (obj_size, address)
+            self.reader.objects_crc[addr] = crc
+        for table in tables:
+            table.init()
+            table.attach(self.reader)
+        self.tables = {table.name.upper(): table for table in tables}
+        return True
+
+    def save_catalog(self):
+        """
+        Сохраняет каталог и прочитанные адреса страниц объектов в кэш
+        Сохраняется состояние файла на момент открытия: если файл дописывался во время чтения,
+        при следующей загрузке кэш будет проверен
+        Кэш содержит только простые данные (числа, строки, байты) в формате marshal, таблицы - тексты описаний
+        :return:
+        """
+        if not self.catalog_cache or self.tables is None:
+            return
+        catalog = {
+            'format': self.CATALOG_FORMAT,
+            'file_name': os.path.abspath(self.file_name),
+            'identity': self.file_identity,
+            'stamp': self.catalog_stamp,
+            'root_block': self.root_block,
+            'version': self.version,
+            'baseLength': self.baseLength,
+            'lang': self.lang,
+            'tables': [table.text for table in self.tables.values()],
+            'objects': {addr: (self.reader.objects_crc[addr], obj_size, list(address))
+                        for addr, (obj_size, address) in self.reader.objects_address.items()},
+        }
+        temp_name = self.catalog_cache + '.tmp'
+        with open(temp_name, 'wb') as f:
+            marshal.dump(catalog, f)
+        os.replace(temp_name, self.catalog_cache)
+        logger.debug('Кэш каталога сохранен: %s, объектов: %s' % (self.catalog_cache, len(catalog['objects'])))
 
     @staticmethod
     def __set_table_size(table_desc, gen):
@@ -473,19 +1013,26 @@ class Reader1CD:
         table_desc.table_size = next(gen)
         table_desc.rows_count = table_desc.table_size//table_desc.row_size
 
-    def read_table_by_name(self, table, read_blob=False, filter_function=None, push_headers=False):
+    def read_table_by_name(self, table, read_blob=False, filter_function=None, push_headers=False, lazy=False,
+                           where=None, start_row=0):
         """
         Считывает таблицы из файла
         :param str table: Имя таблицы
         :param read_blob: Считывать BLOB-записи
         :param filter_function: Функция фильтрация возвращаемых записей, Выполняется до чтения BLOB
         :param push_headers: Возвращать заголовк таблицы(True - в первой итерации вернется список полей таблицы)
+        :param lazy: Возвращать строки с отложенным разбором полей (LazyRow)
+        :param list where: Условия отбора (см. cfg_tools.predicates), проверяются по двоичным данным записи
+                           до ее разбора, не прошедшие отбор записи не разбираются
+        :param int start_row: Номер записи, с которой начинается чтение (см. find_first_row)
         :return:
         """
         logger.debug('Read table: %s' % table.upper())
         table_desc = self.get_table_info(table)
 
-        gen = self.reader.read_obj_iter(obj_addr=table_desc.data_addr, part_size=table_desc.row_size)
+        gen = self.reader.read_obj_iter(obj_addr=table_desc.data_addr,
+                                        part_size=table_desc.row_size,
+                                        start=start_row * table_desc.row_size)
 
         self.__set_table_size(table_desc, gen)
 
@@ -493,35 +1040,228 @@ class Reader1CD:
         if push_headers:
             yield table_desc.fields
 
-        offset = 0
         blob_fields = table_desc.blob_fields
+        decode_row = table_desc.new_lazy_row if lazy else table_desc.decode_row
+        check = predicates.compile_all(where, table_desc) if where else None
         for row_data in gen:
-            values = table_desc.new_row()
             if row_data[0] == 1:
                 continue
-            i = 0
-            for field in table_desc.fields:
-                if field.nullable:
-                    if row_data[field.offset] == 0:
-                        val = None
-                    else:
-                        val = field.func(field, row_data[field.offset + 1:field.offset + field.byte_size])
-                else:
-                    val = field.func(field, row_data[field.offset:field.offset + field.byte_size])
-
-                values[i] = val
-                i += 1
-            offset += table_desc.row_size
+            if check and not check(row_data):
+                continue
+            values = decode_row(row_data)
             if not filter_function or filter_function(values):
                 if read_blob:  # BLOB
                     for i in blob_fields:
                         val = values[i]
                         val = table_desc.blob_reader.read_obj(val)
                         if val and table_desc.fields[i].type == 'NT':
-                            val = val.decode('utf-16')
+                            val = str(val, 'utf-16')
                         values[i] = val
                 yield values
 
+    def read_table_fields(self, table, fields, start_row=0):
+        """
+        Чтение значений отдельных полей записей таблицы вместе с номерами записей
+        Разбираются только указанные поля, удаленные записи пропускаются
+        :param str table: Имя таблицы
+        :param list fields: Имена полей
+        :param int start_row: Номер записи, с которой начинается чтение
+        :return tuple(int, tuple): Номер записи (см. read_row), значения полей
+        """
+        table_desc = self.get_table_info(table)
+        decoders = [table_desc.field_decoders[table_desc.index_by_field_name(name)] for name in fields]
+        gen = self.reader.read_obj_iter(obj_addr=table_desc.data_addr,
+                                        part_size=table_desc.row_size,
+                                        start=start_row * table_desc.row_size)
+        self.__set_table_size(table_desc, gen)
+        for number, row_data in enumerate(gen, start_row):
+            if row_data[0] == 1:
+                continue
+            yield number, tuple(decode(row_data) for decode in decoders)
+
+    def get_object_address(self, obj_addr):
+        """
+        Получение размера и адресов страниц объекта, результат запоминается
+        :param int obj_addr: Адрес заголовка объекта
+        :return tuple(int, list): размер объекта, адреса страниц
+        """
+        return self.reader.get_object_address(obj_addr)
+
+    def rows_count(self, table):
+        """
+        Количество записей таблицы (включая служебную и удаленные)
+        :param str table: Имя таблицы
+        :return int:
+        """
+        table_desc = self.get_table_info(table)
+        return self.get_object_address(table_desc.data_addr)[0] // table_desc.row_size
+
+    def read_row(self, table, num, lazy=False):
+        """
+        Чтение записи таблицы по номеру
+        :param str table: Имя таблицы
+        :param int num: Номер записи
+        :param lazy: Вернуть строку с отложенным разбором полей (LazyRow)
+        :return: Строка таблицы, None - запись удалена
+        """
+        table_desc = self.get_table_info(table)
+        row_data = self._read_record(table_desc, num)
+        if row_data[0] == 1:
+            return None
+        return table_desc.new_lazy_row(row_data) if lazy else table_desc.decode_row(row_data)
+
+    def find_first_row(self, table, field_name, value, low=0, high=None):
+        """
+        Поиск делением пополам номера первой записи, значение поля которой не меньше value
+        Записи таблицы должны быть упорядочены по полю (например, HISTORY и EXTERNALS по VERNUM),
+        разбирается только значение поля
+        :param str table: Имя таблицы
+        :param str field_name: Имя поля
+        :param value: Искомое значение
+        :param int low: Номер записи, с которой начинается поиск
+        :param int high: Номер записи, на которой заканчивается поиск (не включительно), None - до конца таблицы
+        :return int: Номер записи, с которой нужно начинать чтение (равен количеству записей, если таких нет)
+        """
+        table_desc = self.get_table_info(table)
+        decode = table_desc.field_decoders[table_desc.index_by_field_name(field_name)]
+        high = self.rows_count(table) if high is None else high
+        while low < high:
+            mid = (low + high) // 2
+            probe = mid
+            row_data = self._read_record(table_desc, probe)
+            # Удаленные записи пропускаем вперед
+            while row_data[0] == 1 and probe + 1 < high:
+                probe += 1
+                row_data = self._read_record(table_desc, probe)
+            if row_data[0] == 1:
+                high = mid
+            elif decode(row_data) < value:
+                low = probe + 1
+            else:
+                high = mid
+        return low
+
+    def _read_record(self, table_desc, num):
+        """
+        Чтение двоичных данных записи таблицы по номеру
+        :param TableDesc table_desc: Описание таблицы
+        :param int num: Номер записи (с учетом служебной записи 0)
+        :return: Данные записи
+        """
+        size, address = self.get_object_address(table_desc.data_addr)
+        page_size = self.reader.PAGE_SIZE
+        pos = num * table_desc.row_size
+        if num < 0 or pos + table_desc.row_size > size:
+            raise IndexError('Запись %s таблицы "%s" не существует' % (num, table_desc.name))
+        page = self.reader.read_block(address[pos // page_size])
+        if self.metrics is not None:
+            self.metrics.add('records_read', 1, table_desc.name)
+        offset = pos % page_size
+        if offset + table_desc.row_size <= page_size:
+            return page[offset: offset + table_desc.row_size]
+        rest = offset + table_desc.row_size - page_size
+        return bytes(page[offset:]) + bytes(self.reader.read_block(address[pos // page_size + 1])[:rest])
+
+    def seek_table(self, table, index, key_range=None, lazy=False):
+        """
+        Чтение записей таблицы по индексу в порядке ключа
+        :param str table: Имя таблицы
+        :param index: Имя или номер индекса
+        :param tuple key_range: (нижняя, верхняя) граница ключа включительно, None - без ограничения.
+                                Граница - значение первого поля индекса или кортеж значений первых полей
+                                (поиск по префиксу ключа). Пример: seek_table('HISTORY', 'PK', ((obj_id,), (obj_id,)))
+        :param lazy: Возвращать строки с отложенным разбором полей (LazyRow)
+        :return:
+        """
+        table_desc = self.get_table_info(table)
+        if not table_desc.index_addr:
+            raise Exception('Таблица "%s" не содержит индексов' % table_desc.name)
+        index_desc = table_desc.get_index(index)
+        low, high = key_range if key_range is not None else (None, None)
+        low = None if low is None else index_desc.encode_key(table_desc, low)
+        high = None if high is None else index_desc.encode_key(table_desc, high)
+        logger.debug('Seek table: %s, index: %s' % (table_desc.name, index_desc.name))
+
+        index_reader = index_1cd.IndexReader(self.reader, *self.get_object_address(table_desc.index_addr))
+        decode_row = table_desc.new_lazy_row if lazy else table_desc.decode_row
+        # Если файл индексов не соответствует ожидаемому формату, оставшиеся записи диапазона
+        # находятся полным просмотром таблицы, уже возвращенные записи пропускаются
+        returned = set()
+        try:
+            for key, record in index_reader.iter_range(index_desc.number, low, high,
+                                                       index_desc.key_length(table_desc)):
+                row_data = self._read_record(table_desc, record)
+                returned.add(record)
+                if row_data[0] == 1:
+                    continue
+                yield decode_row(row_data)
+            return
+        except (index_1cd.IndexFormatError, IndexError) as e:
+            logger.warning('Индекс "%s" таблицы "%s" не прочитан (%s), записи отбираются полным просмотром' %
+                           (index_desc.name, table_desc.name, e))
+        for record in self.__scan_key_range(table_desc, index_desc, low, high):
+            if record not in returned:
+                yield decode_row(self._read_record(table_desc, record))
+
+    def __scan_key_range(self, table_desc, index_desc, low, high):
+        """
+        Номера записей в диапазоне ключа индекса полным просмотром таблицы, в порядке ключа
+        Ключи формируются по значениям полей так же, как ключи поиска (см. IndexDesc.encode_key)
+        :param TableDesc table_desc: Описание таблицы
+        :param IndexDesc index_desc: Описание индекса
+        :param bytes low: Нижняя граница (префикс ключа), None - без ограничения
+        :param bytes high: Верхняя граница (префикс ключа), None - без ограничения
+        :return list:
+        """
+        names = [name for name, _ in index_desc.fields]
+        found = []
+        for number, values in self.read_table_fields(table_desc.name, names):
+            key = index_desc.encode_key(table_desc, values)
+            if low is not None and key[:len(low)] < low or high is not None and key[:len(high)] > high:
+                continue
+            found.append((key, number))
+        found.sort()
+        return [number for _, number in found]
+
+    def read_table_columns(self, table, columns=None):
+        """
+        Колоночное чтение таблицы в массивы NumPy
+        Данные таблицы отображаются в структурированный массив (в режиме use_mmap - без копирования),
+        значения преобразуются векторно: GUID - S16, B - байты S<длина> (в строках - hex), N - int64/float64,
+        DT - datetime64, NULL-поля возвращаются как numpy.ma.MaskedArray. BLOB-поля возвращаются адресами (блок, размер)
+        Сравнение значений S16/S<длина> в массиве точное, но при извлечении отдельного элемента numpy отбрасывает
+        завершающие нулевые байты
+        Требуется пакет numpy, без него используйте read_table_columns_python
+        :param str table: Имя таблицы
+        :param list columns: Имена читаемых полей, None - все поля
+        :return dict: Имя поля - массив значений
+        """
+        columnar.check_numpy()
+        logger.debug('Read table columns: %s' % table.upper())
+        table_desc = self.get_table_info(table)
+        return columnar.read_columns(self.__read_table_data(table_desc), table_desc, columns)
+
+    def read_table_columns_python(self, table, columns=None):
+        """
+        Колоночное чтение таблицы в списки значений без NumPy
+        Значения те же, что при чтении строк (Guid, datetime, NULL - None), преобразуются пакетно по колонкам
+        (см. columnar.read_columns_python)
+        :param str table: Имя таблицы
+        :param list columns: Имена читаемых полей, None - все поля
+        :return dict: Имя поля - список значений
+        """
+        logger.debug('Read table columns: %s' % table.upper())
+        table_desc = self.get_table_info(table)
+        return columnar.read_columns_python(self.__read_table_data(table_desc), table_desc, columns)
+
+    def __read_table_data(self, table_desc):
+        data = self.reader.read_obj(table_desc.data_addr)
+        if data is None:
+            data = b''
+        table_desc.table_size = len(data)
+        table_desc.rows_count = table_desc.table_size // table_desc.row_size
+        return data
+
     def get_table_info(self, table_name):
         """
         Ищет описание таблицы по имени
@@ -1,10 +1,175 @@
-from struct import unpack
+from struct import iter_unpack
 import datetime
 import logging
+import mmap
+import os
 
+logger = None
 
 flag7fffff = 0x07fffffff
 bytes7fffffff = b'\xff\xff\xff\x7f'
+CONTAINER_HEADER_SIZE = 16
+ITEM_HEADER_SIZE = 31
+
+
+class Container:
+    """
+    Контейнер 1С (cf, epf, формы и т.п.) поверх данных в памяти: bytes, memoryview или mmap
+    При создании читаются только таблица адресов и заголовки документов (имена),
+    данные документов читаются по запросу срезами без копирования.
+    Документ, занимающий несколько страниц (цепочка next_item), собирается в bytes
+
+    Заголовок контейнера: int32 0x7fffffff, int32 размер страницы, int32 версия, int32 резерв
+    Страница: заголовок 31 байт (CRLF, размер документа, размер страницы, смещение следующей страницы - 8 hex
+    через пробел, CRLF), данные
+    Таблица адресов (документ со смещения 16): записи int32 адрес заголовка, int32 адрес данных, int32 0x7fffffff
+    Заголовок документа: 8 байт дата создания, 8 байт дата изменения, 4 байта атрибуты, имя UTF-16
+
+    Контейнер, открытый из файла (open), нужно закрыть (close или with), чтобы освободить отображение файла
+    """
+    def __init__(self, data):
+        """
+        :param data: Данные контейнера
+        """
+        self.mmap = None
+        self.data = memoryview(data)
+        if not self.is_container(self.data):
+            raise Exception('Данные не являются контейнером')
+        self.entries = {}
+        table = self.read_document(CONTAINER_HEADER_SIZE)
+        for header_addr, data_addr, mark in iter_unpack('III', table[:len(table) // 12 * 12]):
+            if mark != flag7fffff:
+                break
+            name = bytes(self.read_document(header_addr)[20:]).decode('utf-16').rstrip('\x00')
+            self.entries[name] = data_addr
+
+    @staticmethod
+    def is_container(data):
+        """
+        Проверка сигнатуры контейнера
+        :param data: Данные
+        :return bool:
+        """
+        return len(data) >= CONTAINER_HEADER_SIZE + ITEM_HEADER_SIZE and bytes(data[:4]) == bytes7fffffff
+
+    @staticmethod
+    def open(file_name):
+        """
+        Контейнер из файла, файл отображается в память
+        :param str file_name: Имя файла
+        :return Container:
+        """
+        with open(file_name, 'rb') as stream:
+            if os.fstat(stream.fileno()).st_size == 0:
+                raise Exception('Данные не являются контейнером')
+            file_map = mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+        if not Container.is_container(file_map):
+            file_map.close()
+            raise Exception('Данные не являются контейнером')
+        container = Container(file_map)
+        container.mmap = file_map
+        return container
+
+    def close(self):
+        """
+        Освобождает отображение файла в память (для контейнера, открытого из файла)
+        Если на данные документов еще есть ссылки (memoryview), отображение будет закрыто сборщиком мусора
+        :return:
+        """
+        if self.mmap is None:
+            return
+        try:
+            self.data.release()
+            self.mmap.close()
+        except BufferError:
+            logger.debug('Отображение контейнера используется, закрытие отложено')
+        self.mmap = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __read_item_header(self, offset):
+        """
+        Заголовок страницы
+        :param int offset: Смещение страницы
+        :return tuple: размер документа, размер страницы, смещение следующей страницы
+        """
+        header = bytes(self.data[offset: offset + ITEM_HEADER_SIZE])
+        if len(header) < ITEM_HEADER_SIZE:
+            raise Exception('Неверное смещение страницы контейнера: %s' % offset)
+        return int(header[2:10], 16), int(header[11:19], 16), int(header[20:28], 16)
+
+    def read_document(self, offset):
+        """
+        Данные документа, начинающегося со страницы по смещению
+        :param int offset: Смещение первой страницы документа
+        :return: memoryview (документ на одной странице) или bytes
+        """
+        data_len, page_len, next_item = self.__read_item_header(offset)
+        start = offset + ITEM_HEADER_SIZE
+        if data_len <= page_len or next_item == flag7fffff:
+            return self.data[start: start + data_len]
+        parts = [self.data[start: start + page_len]]
+        rest = data_len - page_len
+        visited = {offset}
+        while rest > 0 and next_item != flag7fffff:
+            if next_item in visited:
+                raise Exception('Цикл в цепочке страниц контейнера: %s' % next_item)
+            visited.add(next_item)
+            offset = next_item
+            _, page_len, next_item = self.__read_item_header(offset)
+            size = min(rest, page_len)
+            parts.append(self.data[offset + ITEM_HEADER_SIZE: offset + ITEM_HEADER_SIZE + size])
+            rest -= size
+        return b''.join(parts)
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, name):
+        return name in self.entries
+
+    def __getitem__(self, name):
+        return self.read_document(self.entries[name])
+
+    def names(self):
+        """
+        Имена документов в порядке таблицы адресов
+        :return list:
+        """
+        return list(self.entries)
+
+    def get(self, name, default=None):
+        return self[name] if name in self.entries else default
+
+    def sub_container(self, name):
+        """
+        Вложенный контейнер
+        :param str name: Имя документа
+        :return Container: None - документ не является контейнером
+        """
+        data = self[name]
+        return Container(data) if self.is_container(data) else None
+
+    def iter_files(self, recursive=False):
+        """
+        Перебор документов контейнера
+        :param bool recursive: Раскрывать вложенные контейнеры, имена документов в них - "имя/вложенное имя"
+        :return: Генератор (имя, данные)
+        """
+        for name in self.entries:
+            data = self[name]
+            if recursive and self.is_container(data):
+                for sub_name, sub_data in Container(data).iter_files(recursive):
+                    yield name + '/' + sub_name, sub_data
+            else:
+                yield name, data
 
 
 class ReaderCF:
@@ -16,21 +181,6 @@ class ReaderCF:
         self.packed = packed
         self.files = {}
 
-    @staticmethod
-    def __read_item_header(stream):
-        """
-        Считывает заголовок блока
-        :param stream: Поток чтения
-        :return dict: Описание блока
-        """
-        data = stream.read(31)
-
-        return {
-            'data_len': int(data[2:10], 16),
-            'page_len': int(data[11:19], 16),
-            'next_item': data[20:28]
-        }
-
     @staticmethod
     def read_container(stream):
         """
@@ -38,26 +188,9 @@ class ReaderCF:
         :param stream: Поток чтения
         :return dict: Имя документа - данные документа
         """
-        stream.seek(16)
-        item_header = ReaderCF.__read_item_header(stream)
-        addresses = []
-        files = {}
-        while 1:
-            block_addr = unpack('III', stream.read(12))
-            if block_addr[2] != flag7fffff:
-                break
-            addresses.append(block_addr)
-
-        for addr in addresses:
-            stream.seek(addr[0])
-            item_header = ReaderCF.__read_item_header(stream)
-            data = stream.read(item_header['data_len'])
-            name = data[20:].decode('utf-16').rstrip('\x00')
-            stream.seek(addr[1])
-            item_header = ReaderCF.__read_item_header(stream)
-            data = stream.read(item_header['data_len'])
-            files[name] = data
-        return files
+        stream.seek(0)
+        container = Container(stream.read())
+        return {name: bytes(data) for name, data in container.iter_files()}
 
     @staticmethod
     def read_file(file_name):
@@ -66,12 +199,11 @@ class ReaderCF:
         :param file_name: Имя файла контейнера
         :return dict: Имя документа - данные документа
         """
-        with open(file_name, 'rb') as stream:
-            data = ReaderCF.read_container(stream)
-            stream.close()
-            return data
+        with Container.open(file_name) as container:
+            return {name: bytes(data) for name, data in container.iter_files()}
 
     def read(self):
         self.files = self.read_container(self.stream)
 
+
 logger = logging.getLogger('1CD')
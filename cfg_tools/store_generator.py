@@ -0,0 +1,608 @@
+# -*- coding: utf-8 -*-
+"""
+Генератор синтетических хранилищ конфигурации 1С для нагрузочного и регрессионного тестирования
+Создает файл 1cv8ddb.1CD (формат 8.2.14) с таблицами хранилища (см. STORE_SCHEMA.md), индексами и BLOB-цепочками,
+для хранилищ 8.3 - файлы данных data/pack/*.ind, *.pck
+
+Файл пишется потоково: записи таблиц, BLOB и данные пакета записываются по мере формирования,
+в памяти остаются только ключи индексов
+
+Пример:
+    python -m cfg_tools.store_generator c:\\store --format 83 --versions 100000 --objects 1000
+"""
+import argparse
+import hashlib
+import logging
+import os
+import random
+import struct
+import zlib
+from datetime import datetime, timedelta
+from cfg_tools import reader_1cd
+from cfg_tools import utils
+
+logger = None
+
+PAGE_SIZE = 4096
+ALLOC_PAGE_CAPACITY = 1023
+BLOB_CHUNK_SIZE = 256
+BLOB_DATA_SIZE = 250
+NO_PAGE = 0xffffffff
+LEAF_HEADER_SIZE = 30
+
+CONFIG_CLASS = 'cf4abeab-37b2-11d4-940f-008048da11f9'
+MODULE_CLASS = '0fe48980-252d-11d6-a3c7-0050bae0a776'
+CATALOG_CLASS = 'cf4abea6-37b2-11d4-940f-008048da11f9'
+
+
+class PageFile:
+    """
+    Файл 1CD, страницы выделяются последовательно и записываются сразу
+    Страницы 0 (заголовок файла), 1 (свободные страницы) и 2 (корневой объект) зарезервированы
+    """
+    def __init__(self, file_name):
+        self.stream = open(file_name, 'wb+')
+        self.count = 3
+
+    def alloc(self):
+        """
+        Выделение страницы
+        :return int: Номер страницы
+        """
+        self.count += 1
+        return self.count - 1
+
+    def write_page(self, number, data):
+        self.stream.seek(number * PAGE_SIZE)
+        self.stream.write(bytes(data).ljust(PAGE_SIZE, b'\x00'))
+
+    def close(self):
+        self.write_page(0, b'1CDBMSV8' + bytes([8, 2, 14, 0]) + struct.pack('Ii', self.count, 0))
+        self.write_page(1, b'1CDBOBV8' + struct.pack('iiii', 0, 0, 0, 0))
+        self.stream.close()
+
+
+class ObjectWriter:
+    """
+    Потоковая запись объекта файла 1CD: данные, страницы размещения, заголовок
+    """
+    def __init__(self, page_file, header=None):
+        """
+        :param PageFile page_file: Файл
+        :param int header: Страница заголовка, None - выделяется при закрытии
+        """
+        self.page_file = page_file
+        self.header = header
+        self.buffer = bytearray()
+        self.pages = []
+        self.size = 0
+
+    def write(self, data):
+        self.buffer += data
+        self.size += len(data)
+        while len(self.buffer) >= PAGE_SIZE:
+            self.__flush_page()
+
+    def __flush_page(self):
+        page = self.page_file.alloc()
+        self.page_file.write_page(page, self.buffer[:PAGE_SIZE])
+        del self.buffer[:PAGE_SIZE]
+        self.pages.append(page)
+
+    def close(self):
+        """
+        Запись оставшихся данных, страниц размещения и заголовка
+        :return int: Страница заголовка объекта
+        """
+        if self.buffer:
+            self.__flush_page()
+        alloc_pages = []
+        for pos in range(0, len(self.pages), ALLOC_PAGE_CAPACITY):
+            part = self.pages[pos: pos + ALLOC_PAGE_CAPACITY]
+            page = self.page_file.alloc()
+            self.page_file.write_page(page, struct.pack('i%si' % len(part), len(part), *part))
+            alloc_pages.append(page)
+        if self.header is None:
+            self.header = self.page_file.alloc()
+        self.page_file.write_page(self.header, b'1CDBOBV8' + struct.pack('iiii', self.size, 0, 0, 1) +
+                                  struct.pack('%si' % len(alloc_pages), *alloc_pages))
+        return self.header
+
+
+def write_object(page_file, data, header=None):
+    """
+    Запись объекта целиком
+    :return int: Страница заголовка объекта
+    """
+    writer = ObjectWriter(page_file, header)
+    writer.write(data)
+    return writer.close()
+
+
+class BlobWriter:
+    """
+    Запись BLOB-объекта таблицы: блоки по 256 байт (uint32 следующий блок, uint16 длина, 250 байт данных),
+    блок 0 не используется
+    """
+    def __init__(self, page_file):
+        self.writer = ObjectWriter(page_file)
+        self.writer.write(bytes(BLOB_CHUNK_SIZE))
+        self.blocks = 1
+
+    def add(self, data):
+        """
+        Запись значения
+        :param bytes data: Данные
+        :return tuple: (первый блок, размер) - значение поля типа I/NT
+        """
+        if not data:
+            return 0, 0
+        start = self.blocks
+        count = (len(data) + BLOB_DATA_SIZE - 1) // BLOB_DATA_SIZE
+        for ind in range(count):
+            chunk = data[ind * BLOB_DATA_SIZE: (ind + 1) * BLOB_DATA_SIZE]
+            next_block = start + ind + 1 if ind + 1 < count else 0
+            self.writer.write(struct.pack('IH', next_block, len(chunk)) + chunk.ljust(BLOB_DATA_SIZE, b'\x00'))
+        self.blocks += count
+        return start, len(data)
+
+    def close(self):
+        return self.writer.close()
+
+
+class TableWriter:
+    """
+    Запись таблицы: записи пишутся сразу, ключи индексов накапливаются до закрытия
+    """
+    def __init__(self, page_file, name, fields, indexes=None):
+        """
+        :param PageFile page_file: Файл
+        :param str name: Имя таблицы
+        :param list fields: Поля (имя, тип, допускает NULL, длина, точность)
+        :param list indexes: Индексы (имя, [поля]), первый - первичный
+        """
+        self.page_file = page_file
+        self.name = name
+        self.fields = fields
+        self.indexes = indexes or []
+        self.desc = reader_1cd.parse_table_info(self.description(0, 0, 0))
+        self.desc.init()
+        self.data = ObjectWriter(page_file)
+        self.data.write(b'\x01' + bytes(self.desc.row_size - 1))
+        self.rows = 0
+        self.blob = BlobWriter(page_file) if self.desc.blob_fields else None
+        self.keys = [[] for _ in self.indexes]
+
+    def description(self, data_addr, blob_addr, index_addr):
+        """
+        Текстовое описание таблицы (как в файле 1CD)
+        :return str:
+        """
+        fields = ',\n'.join('{"%s","%s",%s,%s,%s,"CS"}' % (name, field_type, 1 if nullable else 0, length, precision)
+                            for name, field_type, nullable, length, precision in self.fields)
+        indexes = ''.join(',\n{"%s",%s,\n%s\n}' % (name, 1 if number == 0 else 0,
+                                                     ',\n'.join('{"%s",0}' % field_name for field_name in fields_names))
+                          for number, (name, fields_names) in enumerate(self.indexes))
+        return '{"%s",0,\n{"Fields",\n%s\n},\n{"Indexes"%s},\n{"Recordlock","0"},\n{"Files",%s,%s,%s}\n}' % \
+               (self.name, fields, indexes, data_addr, blob_addr, index_addr)
+
+    def encode_value(self, field, value):
+        """
+        Двоичное представление значения поля (без признака NULL)
+        BLOB-поля (I, NT) принимают bytes/str (записываются в BLOB) или адрес (блок, размер)
+        """
+        if field.type in ('I', 'NT'):
+            if isinstance(value, str):
+                value = value.encode('utf-16-le')
+            if not isinstance(value, tuple):
+                value = self.blob.add(value or b'')
+            return struct.pack('2I', *value)
+        if field.type == 'NC':
+            return value.ljust(field.length).encode('utf-16-le')
+        if field.type == 'NVC':
+            return struct.pack('h', len(value)) + value.encode('utf-16-le').ljust(field.length * 2, b'\x00')
+        if field.type == 'B':
+            return bytes(value).ljust(field.length, b'\x00')
+        return field.encode(value)
+
+    def add(self, **values):
+        """
+        Добавление записи, отсутствующие значения - NULL (для полей без NULL - пустые значения)
+        """
+        row = bytearray(self.desc.row_size)
+        for field in self.desc.fields:
+            value = values.get(field.name)
+            offset = field.offset
+            size = field.byte_size
+            if field.nullable:
+                if value is None:
+                    continue
+                row[offset] = 1
+                offset += 1
+                size -= 1
+            elif value is None and field.type in ('I', 'NT'):
+                value = (0, 0)
+            if value is None:
+                continue
+            row[offset: offset + size] = self.encode_value(field, value)
+        self.data.write(row)
+        self.rows += 1
+        for number, (index_name, fields_names) in enumerate(self.indexes):
+            key = self.desc.get_index(number).encode_key(self.desc, tuple(values.get(field_name)
+                                                                          for field_name in fields_names))
+            self.keys[number].append((key, self.rows))
+
+    def close(self):
+        """
+        Запись данных, BLOB и индексов
+        :return str: Описание таблицы с адресами объектов
+        """
+        data_addr = self.data.close()
+        blob_addr = self.blob.close() if self.blob else 0
+        index_addr = write_object(self.page_file, self.index_data()) if self.indexes else 0
+        return self.description(data_addr, blob_addr, index_addr)
+
+    def index_data(self):
+        """
+        Файл индексов таблицы (см. index_1cd)
+        :return bytes:
+        """
+        pages = [bytearray(PAGE_SIZE)]
+        starts = []
+        for number in range(len(self.indexes)):
+            keys = sorted(self.keys[number])
+            length = len(keys[0][0]) if keys else self.desc.get_index(number).key_length(self.desc)
+            header_page = len(pages)
+            pages.append(bytearray(PAGE_SIZE))
+            starts.append(header_page * PAGE_SIZE)
+            root = self.__write_index(pages, keys, length)
+            root_page = pages[root // PAGE_SIZE]
+            struct.pack_into('<H', root_page, 0, struct.unpack_from('<H', root_page)[0] | 1)
+            struct.pack_into('<Ih', pages[header_page], 0, root, length)
+        struct.pack_into('<I%sI' % len(starts), pages[0], 0, len(starts), *starts)
+        return b''.join(pages)
+
+    def __write_index(self, pages, keys, length):
+        """
+        Листовые страницы и страницы-ветви одного индекса
+        :return int: Смещение корневой страницы
+        """
+        numrec_bits = max(1, (self.rows + 1).bit_length())
+        lr_bits = max(1, length.bit_length())
+        rec_bytes = (numrec_bits + 2 * lr_bits + 7) // 8
+        leaves = []
+        entries = []
+        used = LEAF_HEADER_SIZE
+        prev = None
+        for key, record in keys:
+            left = 0
+            if entries:
+                while left < length and key[left] == prev[left]:
+                    left += 1
+            right = 0
+            while right < length - left and key[length - 1 - right] == 0:
+                right += 1
+            if entries and used + rec_bytes + length - left - right > PAGE_SIZE:
+                leaves.append(entries)
+                entries = []
+                used = LEAF_HEADER_SIZE
+                left = 0
+                right = 0
+                while right < length and key[length - 1 - right] == 0:
+                    right += 1
+            entries.append((key, record, left, right))
+            used += rec_bytes + length - left - right
+            prev = key
+        if entries or not leaves:
+            leaves.append(entries)
+
+        first_leaf = len(pages)
+        level = []
+        for ind, entries in enumerate(leaves):
+            page = bytearray(PAGE_SIZE)
+            offset = (first_leaf + ind) * PAGE_SIZE
+            next_page = offset + PAGE_SIZE if ind + 1 < len(leaves) else NO_PAGE
+            prev_page = offset - PAGE_SIZE if ind else NO_PAGE
+            struct.pack_into('<HHII', page, 0, 2, len(entries), prev_page, next_page)
+            struct.pack_into('<HIHHHHHH', page, 12, 0, (1 << numrec_bits) - 1, (1 << lr_bits) - 1,
+                             (1 << lr_bits) - 1, numrec_bits, lr_bits, lr_bits, rec_bytes)
+            pos = LEAF_HEADER_SIZE
+            key_pos = PAGE_SIZE
+            for key, record, left, right in entries:
+                packed = record | (left << numrec_bits) | (right << (numrec_bits + lr_bits))
+                page[pos: pos + rec_bytes] = packed.to_bytes(rec_bytes, 'little')
+                pos += rec_bytes
+                stored = length - left - right
+                key_pos -= stored
+                page[key_pos: key_pos + stored] = key[left: left + stored]
+            pages.append(page)
+            last = entries[-1][:2] if entries else (bytes(length), 0)
+            level.append((last[0], last[1], offset))
+
+        per_page = (PAGE_SIZE - 12) // (length + 8)
+        while len(level) > 1:
+            upper = []
+            for pos in range(0, len(level), per_page):
+                part = level[pos: pos + per_page]
+                page = bytearray(PAGE_SIZE)
+                struct.pack_into('<HHII', page, 0, 0, len(part), NO_PAGE, NO_PAGE)
+                item_pos = 12
+                for key, record, child in part:
+                    page[item_pos: item_pos + length] = key
+                    struct.pack_into('>II', page, item_pos + length, record, child)
+                    item_pos += length + 8
+                upper.append((part[-1][0], part[-1][1], len(pages) * PAGE_SIZE))
+                pages.append(page)
+            level = upper
+        return level[0][2]
+
+
+class PackWriter:
+    """
+    Запись файлов данных хранилища 8.3: пакет pack-1.pck (int64 размер, данные) и индекс pack-1.ind
+    Одинаковые данные записываются один раз
+    """
+    def __init__(self, path):
+        self.path = os.path.join(path, 'data', 'pack')
+        os.makedirs(self.path, exist_ok=True)
+        self.stream = open(os.path.join(self.path, 'pack-1.pck'), 'wb')
+        self.offsets = {}
+        self.size = 0
+
+    def add(self, data):
+        """
+        Запись данных
+        :param bytes data: Хранимые данные
+        :return bytes: Хэш данных (20 байт)
+        """
+        data_hash = hashlib.sha1(data).digest()
+        if data_hash not in self.offsets:
+            self.offsets[data_hash] = self.size
+            self.stream.write(struct.pack('q', len(data)))
+            self.stream.write(data)
+            self.size += 8 + len(data)
+        return data_hash
+
+    def close(self):
+        self.stream.close()
+        with open(os.path.join(self.path, 'pack-1.ind'), 'wb') as stream:
+            stream.write(struct.pack('4s4sI', b'ind\x00', bytes(4), len(self.offsets)))
+            for data_hash in sorted(self.offsets):
+                stream.write(data_hash + struct.pack('q', self.offsets[data_hash]))
+
+
+def store_schema(format_83):
+    """
+    Поля и индексы таблиц хранилища
+    :param bool format_83: Формат 8.3
+    :return dict: Имя таблицы - (поля, индексы)
+    """
+    guid, num, string, boolean, date = 'B', 'N', 'NVC', 'L', 'DT'
+    tables = {
+        'DEPOT': [('DEPOTID', guid, 0, 16, 0), ('ROOTOBJID', guid, 0, 16, 0), ('CREATEDATE', date, 0, 19, 0),
+                  ('DEPOTVER', 'B', 0, 8, 0)] + ([('COMPATIBILITYMODE', num, 0, 10, 0)] if format_83 else []),
+        'USERS': [('USERID', guid, 0, 16, 0), ('NAME', string, 0, 256, 0), ('PASSWORD', 'NC', 0, 32, 0),
+                  ('REMOVED', boolean, 0, 0, 0), ('BINDID', guid, 1, 16, 0), ('BINDSTRING', 'NT', 1, 0, 0),
+                  ('RIGHTS', 'B', 0, 4, 0)],
+        'OBJECTS': [('OBJID', guid, 0, 16, 0), ('CLASSID', guid, 0, 16, 0)] +
+                   ([] if format_83 else [('PARENTID', guid, 0, 16, 0)]) +
+                   [('SELFVERNUM', num, 0, 10, 0), ('REVISED', boolean, 1, 0, 0), ('REVISORID', guid, 1, 16, 0),
+                    ('REVISEDATE', date, 1, 19, 0)],
+        'VERSIONS': [('VERNUM', num, 0, 10, 0), ('USERID', guid, 0, 16, 0), ('VERDATE', date, 0, 19, 0)] +
+                    ([('PVERSION', 'B', 0, 8, 0), ('CVERSION', 'B', 0, 4, 0)] if format_83 else []) +
+                    [('CODE', string, 1, 256, 0), ('COMMENT', 'NT', 1, 0, 0), ('SNAPSHOTMAKER', guid, 1, 16, 0),
+                     ('SNAPSHOTCRC', 'B', 1, 4, 0)] + ([('VERSIONID', guid, 0, 16, 0)] if format_83 else []),
+        'HISTORY': [('OBJID', guid, 0, 16, 0), ('VERNUM', num, 0, 10, 0), ('SELFVERNUM', num, 0, 10, 0),
+                    ('OBJVERID', guid, 0, 16, 0)] + ([('PARENTID', guid, 0, 16, 0)] if format_83 else []) +
+                   [('OWNERID', guid, 1, 16, 0), ('OBJNAME', string, 0, 256, 0), ('OBJPOS', num, 0, 6, 0),
+                    ('REMOVED', boolean, 0, 0, 0), ('DATAPACKED', boolean, 1, 0, 0), ('OBJDATA', 'I', 1, 0, 0)] +
+                   ([('DATAHASH', 'B', 1, 20, 0)] if format_83 else []),
+        'EXTERNALS': [('OBJID', guid, 0, 16, 0), ('VERNUM', num, 0, 10, 0), ('EXTNAME', string, 0, 128, 0),
+                      ('EXTVERID', guid, 0, 16, 0), ('DATAPACKED', boolean, 0, 0, 0), ('EXTDATA', 'I', 0, 0, 0)] +
+                     ([('DATAHASH', 'B', 1, 20, 0)] if format_83 else []),
+        'OUTREFS': [('OBJID', guid, 0, 16, 0), ('VERNUM', num, 0, 10, 0), ('OBJREF', guid, 0, 16, 0)] +
+                   ([('KIND', num, 0, 1, 0)] if format_83 else []),
+    }
+    indexes = {
+        'VERSIONS': [('PK_VERSIONS', ['VERNUM'])],
+        'HISTORY': [('PK_HISTORY', ['OBJID', 'VERNUM']), ('VERNUM', ['VERNUM', 'OBJID'])],
+        'EXTERNALS': [('PK_EXTERNALS', ['OBJID', 'VERNUM', 'EXTNAME']), ('VERNUM', ['VERNUM'])],
+        'OBJECTS': [('PK_OBJECTS', ['OBJID'])],
+    }
+    return {name: (fields, indexes.get(name, [])) for name, fields in tables.items()}
+
+
+def make_container(entries):
+    """
+    Контейнер 1С (см. reader_cf.Container), каждый документ на одной странице
+    :param list entries: (имя, данные)
+    :return bytes:
+    """
+    def item(data):
+        return b'\r\n%08x %08x %08x \r\n' % (len(data), len(data), 0x7fffffff) + data
+
+    base = 16 + 31 + len(entries) * 12
+    table = bytearray()
+    body = bytearray()
+    for name, data in entries:
+        header_addr = base + len(body)
+        body += item(bytes(20) + name.encode('utf-16-le') + bytes(4))
+        table += struct.pack('III', header_addr, base + len(body), 0x7fffffff)
+        body += item(data)
+    return struct.pack('4I', 0x7fffffff, 512, 0, 0) + item(bytes(table)) + bytes(body)
+
+
+def deflate(data):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+    return compressor.compress(data) + compressor.flush()
+
+
+def generate(path, versions=10, objects=20, files_per_object=2, payload_size=1024, binary_size=0,
+             format_83=True, seed=1, changed_objects=0.2, change_files=1.0, removed_objects=0.0, renamed_objects=0.0,
+             moved_objects=0.0, skipped_files=0.0):
+    """
+    Создает хранилище
+    Объекты: корень конфигурации и objects объектов (общие модули и справочники). В первой версии помещаются все
+    объекты, в каждой следующей - доля changed_objects случайных неудаленных объектов.
+    Измененный объект (кроме корня) может быть удален (запись HISTORY с REMOVED и без данных, без файлов; удаляются
+    только объекты без подчиненных), переименован или перенесен к другому родителю (только 8.3, в 8.2 родитель
+    задается в OBJECTS)
+    Файлы объекта: 0 - модуль (текст payload_size байт), 1 - контейнер формы, далее - двоичные данные
+    binary_size байт (при 0 - контейнеры)
+    :param str path: Каталог хранилища
+    :param int versions: Количество версий
+    :param int objects: Количество объектов
+    :param int files_per_object: Количество файлов (EXTERNALS) объекта в версии
+    :param int payload_size: Размер текста модуля
+    :param int binary_size: Размер двоичных файлов (несжимаемые данные)
+    :param bool format_83: Формат 8.3 (данные в data/pack), иначе 8.2 (данные в BLOB)
+    :param int seed: Начальное значение генератора случайных чисел
+    :param float changed_objects: Доля объектов, изменяемых в версии
+    :param float change_files: Доля файлов изменяемого объекта, содержимое которых меняется
+                               (остальные помещаются с прежним содержимым)
+    :param float removed_objects: Доля удаляемых объектов среди измененных
+    :param float renamed_objects: Доля переименовываемых объектов среди измененных
+    :param float moved_objects: Доля объектов, переносимых к другому родителю, среди измененных
+    :param float skipped_files: Доля пропущенных файлов (пустой EXTVERID, без данных)
+    :return str: Имя файла 1CD
+    """
+    rnd = random.Random(seed)
+    os.makedirs(path, exist_ok=True)
+    file_name = os.path.join(path, '1cv8ddb.1CD')
+    page_file = PageFile(file_name)
+    tables = {name: TableWriter(page_file, name, fields, indexes)
+              for name, (fields, indexes) in store_schema(format_83).items()}
+    pack = PackWriter(path) if format_83 else None
+
+    def new_guid():
+        return bytes(rnd.getrandbits(8) for _ in range(16))
+
+    def store_data(raw):
+        packed = deflate(raw)
+        if format_83:
+            return None, pack.add(packed)
+        return packed, None
+
+    root = new_guid()
+    user = new_guid()
+    tables['DEPOT'].add(DEPOTID=new_guid(), ROOTOBJID=root, CREATEDATE=datetime(2020, 1, 1), DEPOTVER=b'\x01' * 8,
+                        COMPATIBILITYMODE=0)
+    tables['USERS'].add(USERID=user, NAME='Admin', PASSWORD='', REMOVED=False, RIGHTS=b'\xff' * 4)
+    store_objects = [(root, CONFIG_CLASS, 'Конфигурация', None)]
+    for ind in range(objects):
+        store_objects.append((new_guid(), MODULE_CLASS if ind % 2 == 0 else CATALOG_CLASS, 'Объект%s' % ind, root))
+    # текущие имя и родитель объектов
+    names = {obj_id: name for obj_id, class_id, name, parent in store_objects}
+    parents = {obj_id: parent for obj_id, class_id, name, parent in store_objects}
+    removed = set()
+
+    def subtree(obj_id):
+        result = {obj_id}
+        while True:
+            children = {item for item, parent in parents.items() if parent in result and item not in removed}
+            if children <= result:
+                return result
+            result |= children
+
+    for obj_id, class_id, name, parent in store_objects:
+        tables['OBJECTS'].add(OBJID=obj_id, CLASSID=utils.guid_to_bytes(class_id), PARENTID=parent or bytes(16),
+                              SELFVERNUM=1)
+
+    date = datetime(2020, 1, 1)
+    last_files = {}
+    for version in range(1, versions + 1):
+        date += timedelta(hours=1)
+        tables['VERSIONS'].add(VERNUM=version, USERID=user, VERDATE=date, PVERSION=bytes(8), CVERSION=bytes(4),
+                               COMMENT='Версия %s' % version, VERSIONID=new_guid())
+        alive = [item for item in store_objects if item[0] not in removed]
+        changed = alive if version == 1 else rnd.sample(alive, max(1, int(len(alive) * changed_objects)))
+        version_removed = set()
+        for obj_id, class_id, name, parent in changed:
+            if version > 1 and obj_id != root:
+                if removed_objects and rnd.random() < removed_objects and len(subtree(obj_id)) == 1:
+                    version_removed.add(obj_id)
+                elif renamed_objects and rnd.random() < renamed_objects:
+                    names[obj_id] = '%s_%s' % (name, version)
+                elif format_83 and moved_objects and rnd.random() < moved_objects:
+                    excluded = subtree(obj_id)
+                    parents[obj_id] = rnd.choice([item[0] for item in alive if item[0] not in excluded])
+            if obj_id in version_removed:
+                tables['HISTORY'].add(OBJID=obj_id, VERNUM=version, SELFVERNUM=version, OBJVERID=new_guid(),
+                                      PARENTID=parents[obj_id] or bytes(16), OBJNAME=names[obj_id], OBJPOS=0,
+                                      REMOVED=True)
+                continue
+            info = ('{info %s %s}' % (names[obj_id], version)).encode('utf-8') + \
+                bytes(rnd.getrandbits(8) for _ in range(16))
+            blob, data_hash = store_data(info)
+            tables['HISTORY'].add(OBJID=obj_id, VERNUM=version, SELFVERNUM=version, OBJVERID=new_guid(),
+                                  PARENTID=parents[obj_id] or bytes(16), OBJNAME=names[obj_id], OBJPOS=0,
+                                  REMOVED=False, DATAPACKED=True, OBJDATA=blob, DATAHASH=data_hash)
+        removed |= version_removed
+        for obj_id, class_id, name, parent in changed:
+            if obj_id in version_removed:
+                continue
+            name = names[obj_id]
+            for number in range(files_per_object):
+                key = (obj_id, number)
+                if skipped_files and rnd.random() < skipped_files:
+                    tables['EXTERNALS'].add(OBJID=obj_id, VERNUM=version,
+                                            EXTNAME=utils.bytes_to_guid(obj_id) + '.%s' % number,
+                                            EXTVERID=bytes(16), DATAPACKED=False)
+                    continue
+                if version > 1 and change_files < 1.0 and key in last_files and rnd.random() >= change_files:
+                    raw = last_files[key]
+                elif number == 0:
+                    text = ('// module %s v%s\n' % (name, version)) * (payload_size // 24 + 1)
+                    raw = b'\xef\xbb\xbf' + text.encode('utf-8')[:payload_size]
+                elif number == 1 or not binary_size:
+                    raw = make_container([('info', b'{1}'), ('form', b'{form %d}' % version),
+                                          ('module', b'mod' * 10)])
+                else:
+                    raw = bytes(rnd.getrandbits(8) for _ in range(binary_size))
+                last_files[key] = raw
+                blob, data_hash = store_data(raw)
+                tables['EXTERNALS'].add(OBJID=obj_id, VERNUM=version,
+                                        EXTNAME=utils.bytes_to_guid(obj_id) + '.%s' % number,
+                                        EXTVERID=new_guid(), DATAPACKED=True, EXTDATA=blob or (0, 0),
+                                        DATAHASH=data_hash)
+        if version % 1000 == 0:
+            logger.info('Сформировано версий: %s' % version)
+
+    descriptions = [table.close() for table in tables.values()]
+    addresses = [write_object(page_file, text.encode('utf-16-le')) for text in descriptions]
+    write_object(page_file, b'ru_RU'.ljust(32, b'\x00') + struct.pack('i%si' % len(addresses), len(addresses),
+                                                                        *addresses), header=2)
+    page_file.close()
+    if pack is not None:
+        pack.close()
+    logger.info('Хранилище создано: %s' % file_name)
+    return file_name
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Генератор синтетического хранилища конфигурации 1С')
+    parser.add_argument('path', help='Каталог хранилища')
+    parser.add_argument('--format', choices=('82', '83'), default='83')
+    parser.add_argument('--versions', type=int, default=10)
+    parser.add_argument('--objects', type=int, default=20)
+    parser.add_argument('--files', type=int, default=2, help='Файлов объекта в версии')
+    parser.add_argument('--payload', type=int, default=1024, help='Размер текста модуля')
+    parser.add_argument('--binary', type=int, default=0, help='Размер двоичных файлов')
+    parser.add_argument('--changed-objects', type=float, default=0.2)
+    parser.add_argument('--change-files', type=float, default=1.0)
+    parser.add_argument('--removed-objects', type=float, default=0.0)
+    parser.add_argument('--renamed-objects', type=float, default=0.0)
+    parser.add_argument('--moved-objects', type=float, default=0.0)
+    parser.add_argument('--skipped-files', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    print(generate(args.path, args.versions, args.objects, args.files, args.payload, args.binary,
+                   args.format == '83', args.seed, args.changed_objects, args.change_files, args.removed_objects,
+                   args.renamed_objects, args.moved_objects, args.skipped_files))
+
+
+logger = logging.getLogger('Store')
+
+if __name__ == '__main__':
+    main()
@@ -5,14 +5,25 @@ from cfg_tools import utils
 import xml.etree.ElementTree as etree
 from cfg_tools.common import Ref
 from cfg_tools import reader_cf
-import io
 import logging
-from struct import unpack
+from struct import unpack_from, iter_unpack
 from cfg_tools import common
-import binascii
+from cfg_tools.predicates import NotEqual
+import mmap
+import itertools
+import functools
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from cfg_tools.pipeline import Pipeline
+from cfg_tools.timeline import Timeline
 
 logger = None
 
+IND_HEADER = '4s4sI'
+IND_HEADER_SIZE = 12
+IND_ENTRY_SIZE = 28
+HASH_SIZE = 20
+
 
 def rmdir_r(path):
     if not os.path.exists(path):
@@ -26,6 +37,134 @@ def rmdir_r(path):
     os.rmdir(path)
 
 
+class StreamedFile:
+    """
+    Данные большого файла хранилища: не загружаются в память целиком,
+    а читаются и распаковываются частями при каждом переборе
+    """
+    def __init__(self, chunks, packed, size):
+        """
+        :param chunks: Функция без параметров, возвращающая итератор частей хранимых данных
+        :param bool packed: Данные сжаты
+        :param int size: Размер хранимых данных
+        """
+        self.chunks = chunks
+        self.packed = packed
+        self.size = size
+        self.length = None
+
+    def __iter__(self):
+        if self.packed:
+            return utils.inflate_iter(self.chunks())
+        return (bytes(chunk) for chunk in self.chunks())
+
+    def __len__(self):
+        """
+        Размер распакованных данных, для сжатых данных требует распаковки (без сохранения результата)
+        :return int:
+        """
+        if self.length is None:
+            self.length = sum(len(chunk) for chunk in self)
+        return self.length
+
+    def head(self, size):
+        """
+        Начало данных
+        :param int size: Размер
+        :return bytes:
+        """
+        data = b''
+        for chunk in self:
+            data += chunk
+            if len(data) >= size:
+                break
+        return data[:size]
+
+    def read(self):
+        """
+        Все данные
+        :return bytes:
+        """
+        return b''.join(self)
+
+    def write_to(self, stream):
+        """
+        Запись данных в поток частями
+        :param stream: Поток записи
+        :return:
+        """
+        for chunk in self:
+            stream.write(chunk)
+
+
+def unpack_file(data, name, files_types):
+    """
+    Разбор файла объекта: определение имени и расширения по классу метаданных, распаковка контейнера
+    :param bytes data: Данные файла
+    :param str name: Имя файла в хранилище
+    :param dict files_types: Описание файлов класса метаданных (суффикс - имя, тип содержимого), None - не задано
+    :return: Генератор (имя файла, данные)
+    """
+    if files_types and '.' in name and name[name.rindex('.'):] in files_types:
+        content_type = files_types[name[name.rindex('.'):]][1]
+        name = files_types[name[name.rindex('.'):]][0]
+        if content_type == 'module':
+            ext = '.txt'
+        elif content_type == 'xml':
+            ext = '.xml'
+        else:
+            ext = '.mxl'
+    else:
+        ext = ''
+
+    if isinstance(data, StreamedFile):
+        if data.head(len(reader_cf.bytes7fffffff)) != reader_cf.bytes7fffffff:
+            yield name + ext, data
+            return
+        # контейнеру нужен произвольный доступ к данным - загружается целиком
+        data = data.read()
+
+    if reader_cf.Container.is_container(data):
+        container = reader_cf.Container(data)
+        for file_name in container:
+            if file_name == 'info':
+                continue
+            if file_name == 'form':
+                yield 'Форма.mxl', container[file_name]
+            elif file_name == 'module':
+                yield 'Модуль.txt', container[file_name]
+            elif file_name == 'text':
+                yield name + ext, container[file_name]
+            elif file_name == 'image':
+                yield name + '_СкомпилированныйОбраз' + ext, container[file_name]
+            else:
+                yield name + '_' + file_name + ext, container[file_name]
+
+    else:
+        yield name + ext, data
+
+
+def unpack_file_task(task, copy=False):
+    """
+    Распаковка файла объекта, выполняется в том числе в пуле процессов
+    :param tuple task: Данные, признак сжатия, имя файла, описание файлов класса метаданных,
+                       признак возврата распакованных данных (необязательный)
+    :param bool copy: Копировать части контейнеров в bytes (результат передается между процессами),
+                      иначе части - memoryview над распакованными данными
+    :return list: (имя файла, данные); с признаком возврата данных - (список, распакованные данные)
+    """
+    data, packed, name, files_types = task[:4]
+    keep_data = len(task) > 4 and task[4]
+    if data is None:
+        return ([], data) if keep_data else []
+    if packed:
+        data = utils.inflate_inmemory(data)
+    files = list(unpack_file(data, name, files_types))
+    if copy:
+        files = [(file_name, bytes(file_data)) for file_name, file_data in files]
+    return (files, data) if keep_data else files
+
+
 class User(common.Ref):
 
     def __init__(self, data, name, email=None):
@@ -44,72 +183,253 @@ class MetaObject(common.Ref):
         self.files = []
 
 
+class PackIndex:
+    """
+    Индекс файла пакета хранилища 8.3 (.ind) и сам пакет (.pck)
+    Оба файла отображаются в память, поиск по индексу - двоичный (записи индекса упорядочены по хешу)
+
+    Файл индекса: заголовок '4s4sI' (последнее - количество записей), записи: 20 байт хеш, int64 смещение в пакете
+    Запись пакета: int64 размер, данные
+    """
+    def __init__(self, ind_file, pack_file):
+        """
+        :param str ind_file: Путь к файлу индекса
+        :param str pack_file: Путь к файлу пакета
+        """
+        self.ind_file = ind_file
+        self.pack_file = pack_file
+        self.index = map_file(ind_file)
+        self.pack = map_file(pack_file)
+        self.count = 0
+        if len(self.index) >= IND_HEADER_SIZE:
+            self.count = min(unpack_from(IND_HEADER, self.index)[2],
+                             (len(self.index) - IND_HEADER_SIZE) // IND_ENTRY_SIZE)
+        self.offsets = None
+
+    def find(self, key):
+        """
+        Поиск смещения данных в пакете
+        :param bytes key: Хеш данных
+        :return int: Смещение, None - нет в пакете
+        """
+        if self.offsets is not None:
+            return self.offsets.get(key)
+        index = self.index
+        low, high = 0, self.count
+        while low < high:
+            mid = (low + high) // 2
+            pos = IND_HEADER_SIZE + mid * IND_ENTRY_SIZE
+            if index[pos: pos + HASH_SIZE] < key:
+                low = mid + 1
+            else:
+                high = mid
+        pos = IND_HEADER_SIZE + low * IND_ENTRY_SIZE
+        if low < self.count and index[pos: pos + HASH_SIZE] == key:
+            return unpack_from('q', index, pos + HASH_SIZE)[0]
+        return None
+
+    def scan(self, key):
+        """
+        Поиск смещения данных полным просмотром индекса
+        Если запись найдена, индекс не упорядочен: дальше поиск в пакете идет по словарю
+        :param bytes key: Хеш данных
+        :return int: Смещение, None - нет в пакете
+        """
+        if self.offsets is not None:
+            return None
+        end = IND_HEADER_SIZE + self.count * IND_ENTRY_SIZE
+        pos = self.index.find(key, IND_HEADER_SIZE, end)
+        while pos != -1 and (pos - IND_HEADER_SIZE) % IND_ENTRY_SIZE:
+            pos = self.index.find(key, pos + 1, end)
+        if pos == -1:
+            return None
+        logger.warning('Индекс пакета не упорядочен: %s' % self.ind_file)
+        self.offsets = dict(iter_unpack('<%ssq' % HASH_SIZE, self.index[IND_HEADER_SIZE: end]))
+        return self.offsets[key]
+
+    def read(self, offset):
+        """
+        Чтение данных из пакета
+        :param int offset: Смещение записи в пакете
+        :return bytes:
+        """
+        size = unpack_from('q', self.pack, offset)[0]
+        return self.pack[offset + 8: offset + 8 + size]
+
+    def close(self):
+        for data in (self.index, self.pack):
+            if isinstance(data, mmap.mmap):
+                data.close()
+        self.index = self.pack = b''
+        self.count = 0
+
+
+def map_file(file_name):
+    """
+    Отображает файл в память только для чтения
+    Открытый файл после отображения не нужен
+    :param str file_name: Путь к файлу
+    :return: mmap, для пустого файла - b''
+    """
+    with open(file_name, 'rb') as stream:
+        if os.fstat(stream.fileno()).st_size == 0:
+            return b''
+        return mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+
+
 class Depot83Reader:
+    """
+    Чтение файлов данных хранилища 8.3 (каталог data): из пакетов pack/*.pck или из отдельных файлов objects/
+    Пакеты и индексы отображаются в память один раз, чтение потокобезопасно
+    """
 
-    def __init__(self, path):
+    def __init__(self, path, metrics=None):
+        """
+        :param str path: Каталог data хранилища
+        :param Metrics metrics: Сбор счетчиков (см. cfg_tools.metrics), None - не собирать
+        """
         self.path = path
-        self.files = []
+        self.metrics = metrics
+        self.packs = []
         self.init()
 
     def init(self):
-        self.files.clear()
-        ind_files = []
-        pack_files = []
+        self.close()
         for root, dirs, files in os.walk(os.path.join(self.path, 'pack')):
-            for file in files:
-                if file.endswith(".ind"):
-                    ind_files.append(os.path.join(root, file))
-                elif file.endswith('.pck'):
-                    pack_files.append(os.path.join(root, file))
-        for file in ind_files:
-            with open(file, 'rb') as stream:
-                sub_files = {}
-                self.files.append({
-                    'name': file[:-4] + '.pck',
-                    'files': sub_files
-                })
-                sign = unpack('4s4sI', stream.read(12))
-                count = sign[2]
-                for i in range(count):
-                    data = stream.read(28)
-                    sub_files[binascii.hexlify(data[:20]).decode()] = unpack('q', data[20:])[0]
-                    if not data:
-                        break
-                stream.close()
+            for file in sorted(files):
+                if not file.endswith('.ind'):
+                    continue
+                pack_file = os.path.join(root, file[:-4] + '.pck')
+                if not os.path.exists(pack_file):
+                    logger.warning('Нет файла пакета для индекса %s' % os.path.join(root, file))
+                    continue
+                self.packs.append(PackIndex(os.path.join(root, file), pack_file))
+
+    def locate(self, hash_name):
+        """
+        Поиск данных в пакетах
+        :param str hash_name: Хэш данных (hex)
+        :return tuple: (пакет, смещение записи), None - данные хранятся отдельным файлом
+        """
+        if self.metrics is not None:
+            self.metrics.add('depot_lookups')
+        key = bytes.fromhex(hash_name)
+        for pack in self.packs:
+            offset = pack.find(key)
+            if offset is not None:
+                return pack, offset
+        if not os.path.exists(self.object_file(hash_name)):
+            if self.metrics is not None:
+                self.metrics.add('depot_scans')
+            for pack in self.packs:
+                offset = pack.scan(key)
+                if offset is not None:
+                    return pack, offset
+        return None
+
+    def object_file(self, hash_name):
+        return os.path.join(self.path, 'objects', hash_name[:2], hash_name[2:])
 
     def get_file(self, hash_name):
-        for file in self.files:
-            if hash_name in file['files']:
-                with open(file['name'], 'rb') as stream:
-                    stream.seek(file['files'][hash_name])
-                    size = unpack('q', stream.read(8))[0]
-                    data = stream.read(size)
-                    stream.close()
-                    return data
-        source = os.path.join(os.path.join(self.path, 'objects'), hash_name[:2], hash_name[2:])
-        with open(source, 'rb') as stream:
-            data = stream.read()
-            stream.close()
-            return data
+        location = self.locate(hash_name)
+        if location is not None:
+            data = location[0].read(location[1])
+        else:
+            with open(self.object_file(hash_name), 'rb') as stream:
+                data = stream.read()
+        if self.metrics is not None:
+            self.metrics.add('depot_bytes_read', len(data))
+        return data
+
+    def get_file_size(self, hash_name):
+        """
+        Размер хранимых (сжатых) данных
+        :param str hash_name: Хэш данных (hex)
+        :return int:
+        """
+        location = self.locate(hash_name)
+        if location is not None:
+            return unpack_from('q', location[0].pack, location[1])[0]
+        return os.path.getsize(self.object_file(hash_name))
+
+    def iter_file(self, hash_name, chunk_size=utils.INFLATE_CHUNK_SIZE):
+        """
+        Чтение хранимых данных частями
+        :param str hash_name: Хэш данных (hex)
+        :param int chunk_size: Размер части
+        :return: Генератор частей данных
+        """
+        location = self.locate(hash_name)
+        if location is not None:
+            pack, offset = location
+            size = unpack_from('q', pack.pack, offset)[0]
+            for pos in range(offset + 8, offset + 8 + size, chunk_size):
+                yield pack.pack[pos: min(pos + chunk_size, offset + 8 + size)]
+            return
+        with open(self.object_file(hash_name), 'rb') as stream:
+            while True:
+                data = stream.read(chunk_size)
+                if not data:
+                    break
+                yield data
+
+    def close(self):
+        for pack in self.packs:
+            pack.close()
+        self.packs = []
 
 
 class StoreReader(reader_1cd.Reader1CD):
 
     @staticmethod
     def _write_file(data, file_name):
+        """
+        Запись файла
+        :return int: Размер записанных данных
+        """
         with open(file_name, 'wb+') as f:
-            f.write(data)
-            f.close()
+            if isinstance(data, StreamedFile):
+                data.write_to(f)
+            else:
+                f.write(data)
+            return f.tell()
+
+    DATA_CACHE_SIZE = 64 * 1024 * 1024
+    # Пропущенные при помещении в хранилище файлы (пустой EXTVERID) отбрасываются по двоичным данным записи
+    EXTERNALS_FILTER = [NotEqual('EXTVERID', bytes(16))]
+    STREAM_THRESHOLD = 16 * 1024 * 1024
 
-    def __init__(self, file):
-        super(StoreReader, self).__init__(file)
+    def __init__(self, file, workers=0, skip_unchanged=True, data_cache=DATA_CACHE_SIZE, data_cache_parts=False,
+                 stream_threshold=STREAM_THRESHOLD, **kwargs):
+        """
+        :param str file: Имя файла хранилища
+        :param int workers: Количество процессов распаковки файлов, 0 или 1 - распаковка в текущем процессе
+        :param bool skip_unchanged: При выгрузке нескольких версий не перезаписывать файлы,
+                                    хэш которых не изменился (формат 8.3)
+        :param int data_cache: Объем кэша распакованных данных по хэшу в байтах (формат 8.3), 0 - без кэша
+        :param bool data_cache_parts: Кэшировать файлы, уже разобранные на части (с учетом имени файла)
+        :param int stream_threshold: Файлы, хранимые данные которых больше этого размера, распаковываются и
+                                     записываются потоком, без загрузки в память (см. StreamedFile). 0 - не использовать
+        :param kwargs: Параметры чтения файла 1CD (см. Reader1CD)
+        """
+        self.workers = workers
+        self.skip_unchanged = skip_unchanged
+        self.data_cache = common.LRUCache(data_cache)
+        self.data_cache_parts = data_cache_parts
+        self.data_cache_lock = threading.Lock()
+        self.stream_threshold = stream_threshold
+        self.pool = None
+        self.version_checkpoint = None
+        self.pipeline_running = False
+        self.depot83_files_reader = None
+        super(StoreReader, self).__init__(file, **kwargs)
         self.users = None
         self.versions = None
         self.meta_classes = None
         self.format_83 = True
         self.root_uid = None
         self.objects_info = None
-        self.depot83_files_reader = None
+        self.timeline = None
         self.read()
 
     def _read_objects(self):
@@ -119,12 +439,12 @@ class StoreReader(reader_1cd.Reader1CD):
             return
         self.objects_info = {}
         for row in self.read_table_by_name('OBJECTS', push_headers=False):
-            obj_id = row.by_name('OBJID')
+            obj_id = row.OBJID
             obj = MetaObject(obj_id)
-            obj.meta_class = self.meta_classes[row.by_name('CLASSID')] if row.by_name('CLASSID') in self.meta_classes else row.by_name('CLASSID')
+            obj.meta_class = self.meta_classes[row.CLASSID] if row.CLASSID in self.meta_classes else row.CLASSID
 
             if not self.format_83:
-                obj.parent = row.by_name('PARENTID')
+                obj.parent = row.PARENTID
             self.objects_info[obj_id] = obj
         if not self.format_83:
             self._set_parents()
@@ -139,115 +459,227 @@ class StoreReader(reader_1cd.Reader1CD):
             else:
                 obj.parent = None
 
+    def _get_file_data(self, row, name):
+        """
+        Данные файла хранилища 8.2 из BLOB поля
+        Большие BLOB не читаются сразу, а передаются как StreamedFile
+        :param Row row: Строка HISTORY или EXTERNALS
+        :param str name: Имя BLOB поля
+        :return: bytes или StreamedFile
+        """
+        value = row.by_name(name)
+        if self.stream_threshold and isinstance(value, tuple) and value[0] and value[1] > self.stream_threshold:
+            blob_reader = row.table.blob_reader
+            return StreamedFile(lambda: itertools.islice(blob_reader.read_obj_iter(value), 1, None),
+                                row.DATAPACKED, value[1])
+        return row.get_blob(name)
+
     def _get_objects_by_version(self, version_number):
         objects = {}
-        row_version = 0
-        for row in self.read_table_by_name('HISTORY',
-                                           push_headers=False):
-            assert row_version <= row.by_name('VERNUM')
-            row_version = row.by_name('VERNUM')
+        # Для восстановления имен и родителей нужна только последняя до версии запись каждого объекта.
+        # Таблица упорядочена по версиям, поэтому чтение прекращается на первой записи новее версии
+        last_rows = {}
+        version_rows = []
+        for row in self.read_table_by_name('HISTORY', push_headers=False, lazy=True):
+            vernum = row.VERNUM
+            if vernum > version_number:
+                break
+            last_rows[row.OBJID] = row
+            if vernum == version_number:
+                version_rows.append(row)
 
-            obj_id = row.by_name('OBJID')
+        for obj_id, row in last_rows.items():
             obj = self.objects_info[obj_id]
-            obj.name = row.by_name('OBJNAME')
+            obj.name = row.OBJNAME
             if self.format_83:
-                obj.parent = row.by_name('PARENTID')
+                obj.parent = row.PARENTID
 
-            if row_version > version_number:
-                break
-            elif row_version != version_number:
-                continue
+        for row in version_rows:
+            obj_id = row.OBJID
+            obj = self.objects_info[obj_id]
             obj.files.clear()
 
             objects[obj_id] = obj
-            obj.removed = row.by_name('REMOVED')
+            obj.removed = row.REMOVED
             obj.files.append({
-                'data': row.by_name('DATAHASH') if self.format_83 else row.get_blob('OBJDATA'),
-                'packed': row.by_name('DATAPACKED'),
+                'data': row.DATAHASH if self.format_83 else self._get_file_data(row, 'OBJDATA'),
+                'packed': row.DATAPACKED,
                 'name': 'info.txt'
             })
         if self.format_83:
             self._set_parents()
         gen = self.read_table_by_name('EXTERNALS',
                                       push_headers=False,
-                                      read_blob=False)
+                                      read_blob=False,
+                                      lazy=True,
+                                      where=self.EXTERNALS_FILTER,
+                                      start_row=self.find_first_row('EXTERNALS', 'VERNUM', version_number))
 
-        row_version = 0
         for row in gen:
-            assert row_version <= row.by_name('VERNUM')
-            row_version = row.by_name('VERNUM')
-            if row_version > version_number:
+            if row.VERNUM != version_number:
                 break
-            elif row_version != version_number:
-                continue
-
-            obj_id = row.by_name('OBJID')
+            obj_id = row.OBJID
             if obj_id not in objects:
                 logger.error('Найден файл не принадлежащий объекту. OBJID: %s; EXTNAME: %s' %
-                             (row.by_name('OBJID'), row.by_name('EXTNAME')))
-            elif row.by_name('EXTVERID') == common.Guid.EMPTY:
-                logger.debug('Пропущен файл: %s' % row.by_name('EXTNAME'))
+                             (row.OBJID, row.EXTNAME))
             else:
                 objects[obj_id].files.append(
                     {
-                        'name': row.by_name('EXTNAME'),
-                        'data': row.by_name('DATAHASH') if self.format_83 else row.get_blob('EXTDATA'),
-                        'packed': row.by_name('DATAPACKED')
+                        'name': row.EXTNAME,
+                        'data': row.DATAHASH if self.format_83 else self._get_file_data(row, 'EXTDATA'),
+                        'packed': row.DATAPACKED
                     })
 
         logger.debug('version objects (%s) %s' % (len(objects), ', '.join([item.name for item in objects.values()])))
         return [v for v in objects.values()]
 
-    def _read_objects_by_version(self, start_version, last_version=None):
+    def get_checkpoint(self, version_number):
+        """
+        Контрольная точка выгрузки: состояние объектов (имя, признак удаления, родитель) после версии
+        и номера первых записей HISTORY и EXTERNALS следующей версии
+        В конвейере состояние объектов опережает обрабатываемую версию, поэтому контрольная точка доступна только
+        для версий, отмеченных функцией checkpoint_due (см. export_versions)
+        :param int version_number: Номер выгруженной версии
+        :return dict:
+        """
+        if self.version_checkpoint is not None and self.version_checkpoint['version'] == version_number:
+            return self.version_checkpoint
+        if self.pipeline_running:
+            raise Exception('Контрольная точка версии %s не сформирована на стадии чтения конвейера' % version_number)
+        return self._make_checkpoint(version_number)
+
+    def _make_checkpoint(self, version_number):
+        """
+        Контрольная точка по текущему состоянию объектов (см. get_checkpoint)
+        """
+        objects = {}
+        for obj_id, obj in self.objects_info.items():
+            if obj.name is None:
+                continue
+            parent = None
+            if self.format_83 and obj.parent is not None:
+                # родитель может быть уже связан с объектом (см. _set_parents), сохраняются только данные GUID
+                parent = obj.parent.data if isinstance(obj.parent, MetaObject) else obj.parent
+                parent = parent.data
+            objects[obj_id.data] = (obj.name, obj.removed, parent)
+        return {
+            'store': os.path.abspath(self.file_name),
+            'version': version_number,
+            'history_row': self.find_first_row('HISTORY', 'VERNUM', version_number + 1),
+            'externals_row': self.find_first_row('EXTERNALS', 'VERNUM', version_number + 1),
+            'objects': objects,
+        }
+
+    def _check_position(self, table, row_number, version_number):
+        """
+        Проверяет, что запись с номером row_number - первая запись таблицы новее версии
+        :param str table: Имя таблицы
+        :param int row_number: Номер записи
+        :param int version_number: Номер версии
+        :return bool:
+        """
+        count = self.rows_count(table)
+        if row_number > count:
+            return False
+        if row_number > 0:
+            row = self.read_row(table, row_number - 1, lazy=True)
+            if row is not None and row.VERNUM > version_number:
+                return False
+        if row_number < count:
+            row = self.read_row(table, row_number, lazy=True)
+            if row is not None and row.VERNUM <= version_number:
+                return False
+        return True
+
+    def _apply_checkpoint(self, checkpoint, start_version):
+        """
+        Восстанавливает состояние объектов из контрольной точки
+        :param dict checkpoint: Контрольная точка (см. get_checkpoint)
+        :param int start_version: Начальная выгружаемая версия
+        :return bool: Контрольная точка применена
+        """
+        if checkpoint.get('store') != os.path.abspath(self.file_name) or \
+                checkpoint['version'] >= start_version or \
+                not self._check_position('HISTORY', checkpoint['history_row'], checkpoint['version']) or \
+                not self._check_position('EXTERNALS', checkpoint['externals_row'], checkpoint['version']):
+            logger.debug('Контрольная точка не соответствует хранилищу')
+            return False
+        objects = [(self.objects_info.get(common.Guid.intern(data)), state) for data, state in checkpoint['objects'].items()]
+        if any(obj is None for obj, _ in objects):
+            logger.debug('Контрольная точка содержит неизвестные объекты')
+            return False
+        for obj, (name, removed, parent) in objects:
+            obj.name = name
+            obj.removed = removed
+            if self.format_83:
+                obj.parent = common.Guid.intern(parent) if parent is not None else None
+        logger.debug('Состояние восстановлено из контрольной точки версии %s' % checkpoint['version'])
+        return True
+
+    def _read_objects_by_version(self, start_version, last_version=None, checkpoint=None):
         """
         Генератор, возвращает список объектов и файлов для каждой версии хранилища
         :param int start_version: Начальная версия
         :param int last_version: Последная версия
+        :param dict checkpoint: Контрольная точка предыдущей выгрузки (см. get_checkpoint)
         :return tuple(int, list): Кортеж: номер версии, объекты версии
         """
+        # Таблицы упорядочены по версиям: начальные записи находим делением пополам,
+        # а состояние объектов на начало восстанавливаем по последним записям до начальной версии.
+        # Контрольная точка позволяет восстанавливать состояние только по записям после нее
+        history_from = 0
+        externals_from = 0
+        if checkpoint is not None and self._apply_checkpoint(checkpoint, start_version):
+            history_from = checkpoint['history_row']
+            externals_from = checkpoint['externals_row']
+        history_start = self.find_first_row('HISTORY', 'VERNUM', start_version, low=history_from)
+        externals_start = self.find_first_row('EXTERNALS', 'VERNUM', start_version, low=externals_from)
+        if history_start > history_from:
+            last_rows = {}
+            for row in self.read_table_by_name('HISTORY', push_headers=False, lazy=True, start_row=history_from):
+                if row.VERNUM >= start_version:
+                    break
+                last_rows[row.OBJID] = row
+            for obj_id, row in last_rows.items():
+                obj = self.objects_info[obj_id]
+                obj.name = row.OBJNAME
+                obj.removed = row.REMOVED
+                if self.format_83:
+                    obj.parent = row.PARENTID
+
         history_iter = self.read_table_by_name('HISTORY',
-                                               push_headers=False)
+                                               push_headers=False,
+                                               lazy=True,
+                                               start_row=history_start)
         externals_iter = self.read_table_by_name('EXTERNALS',
                                                  push_headers=False,
-                                                 read_blob=False)
-
-        # move to start_version
-        history_row = None
-        external_row = None
-        for row in history_iter:
-            obj_id = row.by_name('OBJID')
-            obj = self.objects_info[obj_id]
-            obj.name = row.by_name('OBJNAME')
-            obj.removed = row.by_name('REMOVED')
-            if self.format_83:
-                obj.parent = row.by_name('PARENTID')
-            if row.by_name('VERNUM') >= start_version:
-                history_row = row
-                break
-
-        for row in externals_iter:
-            if row.by_name('VERNUM') >= start_version:
-                external_row = row
-                break
-        if history_row is None or external_row is None or history_row.by_name('VERNUM') < start_version:
+                                                 read_blob=False,
+                                                 lazy=True,
+                                                 where=self.EXTERNALS_FILTER,
+                                                 start_row=externals_start)
+        history_row = next(history_iter, None)
+        external_row = next(externals_iter, None)
+        if history_row is None or history_row.VERNUM < start_version:
             return None
-        current_version = history_row.by_name('VERNUM')
+        current_version = history_row.VERNUM
         while True:  # Основной цикл по версиям
+            if self.metrics is not None:
+                self.metrics.set_version(current_version)
             objects = {}
             # Собираем данные об выгружаемых объектах
-            while history_row and current_version == history_row.by_name('VERNUM'):
-                obj = self.objects_info[history_row.by_name('OBJID')]
-                obj.name = history_row.by_name('OBJNAME')
-                obj.removed = history_row.by_name('REMOVED')
+            while history_row and current_version == history_row.VERNUM:
+                obj = self.objects_info[history_row.OBJID]
+                obj.name = history_row.OBJNAME
+                obj.removed = history_row.REMOVED
                 if self.format_83:
-                    obj.parent = history_row.by_name('PARENTID')
+                    obj.parent = history_row.PARENTID
                 obj.files.clear()
                 obj.files.append({
-                    'data': history_row.by_name('DATAHASH') if self.format_83 else history_row.get_blob('OBJDATA'),
-                    'packed': history_row.by_name('DATAPACKED'),
+                    'data': history_row.DATAHASH if self.format_83 else self._get_file_data(history_row, 'OBJDATA'),
+                    'packed': history_row.DATAPACKED,
                     'name': 'info.txt',
                 })
-                objects[history_row.by_name('OBJID')] = obj
+                objects[history_row.OBJID] = obj
                 try:
                     history_row = next(history_iter)
                 except StopIteration:
@@ -257,19 +689,18 @@ class StoreReader(reader_1cd.Reader1CD):
                 # Проставим свяжем родителей по uid
                 self._set_parents()
             # Соберем данные о доп. файлах объектов(модули, справка, предопределенные и тд)
-            while external_row and current_version == external_row.by_name('VERNUM'):
-                obj_id = external_row.by_name('OBJID')
+            while external_row and current_version == external_row.VERNUM:
+                obj_id = external_row.OBJID
                 if obj_id not in objects:
                     logger.error('Найден файл не принадлежащий объекту. OBJID: %s; EXTNAME: %s' %
-                                 (external_row.by_name('OBJID'), external_row.by_name('EXTNAME')))
-                elif external_row.by_name('EXTVERID') == common.Guid.EMPTY:
-                    logger.debug('Пропущен файл: %s. Инфо: %s' % (external_row.by_name('EXTNAME'), external_row))
+                                 (external_row.OBJID, external_row.EXTNAME))
                 else:
                     objects[obj_id].files.append(
                         {
-                            'name': external_row.by_name('EXTNAME'),
-                            'data': external_row.by_name('DATAHASH') if self.format_83 else external_row.get_blob('EXTDATA'),
-                            'packed': external_row.by_name('DATAPACKED')
+                            'name': external_row.EXTNAME,
+                            'data': (external_row.DATAHASH if self.format_83 else
+                                     self._get_file_data(external_row, 'EXTDATA')),
+                            'packed': external_row.DATAPACKED
                         })
                 try:
                     external_row = next(externals_iter)
@@ -277,9 +708,10 @@ class StoreReader(reader_1cd.Reader1CD):
                     external_row = None
                     break
             yield current_version, [v for v in objects.values()]
-            if history_row is None and external_row is None:
+            versions = [row.VERNUM for row in (history_row, external_row) if row is not None]
+            if not versions:
                 break
-            current_version = min(history_row.by_name('VERNUM'), external_row.by_name('VERNUM'))
+            current_version = min(versions)
             if (last_version and current_version > last_version):
                 break
 
@@ -290,11 +722,11 @@ class StoreReader(reader_1cd.Reader1CD):
         file_groups = {
             group.attrib['name']: {
                                     file.attrib['id']: (file.attrib['name'], file.attrib['content_type'])
-                                    for file in group.getiterator('file')}
-            for group in tree.getiterator('type')
+                                    for file in group.iter('file')}
+            for group in tree.iter('type')
         }
         self.meta_classes = {}
-        for cls in tree.getiterator('class'):
+        for cls in tree.iter('class'):
             meta_class = Ref(
                 utils.guid_to_bytes(cls.attrib['id']),
                 cls.attrib['single'])
@@ -303,46 +735,48 @@ class StoreReader(reader_1cd.Reader1CD):
 
             meta_class.files = {
                 file.attrib['id']: (file.attrib['name'], file.attrib['content_type'])
-                for file in cls.getiterator('file')
+                for file in cls.iter('file')
                 }
             if len(meta_class.files) == 0 and meta_class.type is not None and meta_class.type in file_groups:
                 meta_class.files = file_groups[meta_class.type]
             self.meta_classes[utils.guid_to_bytes(cls.attrib['id'])] = meta_class
 
-    def _unpuck_file(self, data, name, meta_class):
-        if meta_class and '.' in name and name[name.rindex('.'):] in meta_class.files:
-            content_type = meta_class.files[name[name.rindex('.'):]][1]
-            name = meta_class.files[name[name.rindex('.'):]][0]
-            if content_type == 'module':
-                ext = '.txt'
-            elif content_type == 'xml':
-                ext = '.xml'
-            else:
-                ext = '.mxl'
-        else:
-            ext = ''
-
-        if data[:4] == reader_cf.bytes7fffffff:
-            cf_files = reader_cf.ReaderCF.read_container(io.BytesIO(data))
-            for file_name in cf_files:
-                if file_name == 'info':
-                    continue
-                if file_name == 'form':
-                    yield 'Форма.mxl', cf_files[file_name]
-                elif file_name == 'module':
-                    yield 'Модуль.txt', cf_files[file_name]
-                elif file_name == 'text':
-                    yield name + ext, cf_files[file_name]
-                elif file_name == 'image':
-                    yield name + '_СкомпилированныйОбраз' + ext, cf_files[file_name]
-                else:
-                    yield name + '_' + file_name + ext, cf_files[file_name]
+    def _get_pool(self):
+        """
+        Пул процессов распаковки файлов, создается при первом обращении
+        :return ProcessPoolExecutor: None - распаковка выполняется в текущем процессе
+        """
+        if self.workers <= 1:
+            return None
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self.pool
 
-        else:
-            yield name + ext, data
+    def close_file(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+        if self.depot83_files_reader is not None:
+            self.depot83_files_reader.close()
+            self.depot83_files_reader = None
+        super(StoreReader, self).close_file()
 
-    def _save_files(self, objects, path, hierarchy=True):
-        files = []
+    def _plan_files(self, objects, path, hierarchy=True, written=None):
+        """
+        Формирует операции сохранения объектов версии по текущему состоянию объектов:
+        удаление и создание каталогов, запись файлов
+        :param list objects: Объекты версии
+        :param str path: Каталог сохранения файлов
+        :param bool hierarchy: Иерархическая выгрузка(по каталогам)
+        :param dict written: Хэши записанных файлов (каталог и имя файла в хранилище - хэш, формат 8.3),
+                             для файлов с неизменившимся хэшем формируется операция пропуска.
+                             None - записывать все файлы
+        :return tuple(list, list): Операции ('remove'|'makedirs', каталог), ('write'|'skip', каталог, задание),
+                                   задания распаковки для операций записи
+        """
+        operations = []
+        tasks = []
+        skipped = 0
         for obj in objects:
             meta_class = obj.meta_class
             str_guid = str(obj.data)
@@ -358,37 +792,241 @@ class StoreReader(reader_1cd.Reader1CD):
             obj_path = os.path.join(path, full_name)
             if obj.removed:
                 logger.debug('Remove %s' % full_name)
-                rmdir_r(obj_path)
+                operations.append(('remove', obj_path))
+                if written:
+                    for key in [key for key in written if key.startswith(obj_path)]:
+                        del written[key]
                 continue
             logger.debug('Export %s' % full_name)
-            if hierarchy and not os.path.exists(obj_path):
-                os.makedirs(obj_path)
+            if hierarchy:
+                operations.append(('makedirs', obj_path))
             for file_info in obj.files:
                 if file_info['data'] is None:
                     continue
-                data = self.depot83_files_reader.get_file(file_info['data']) if self.format_83 else file_info['data']
-                if data is None:
+                files_types = getattr(meta_class, 'files', None) \
+                    if obj == self.root_uid or file_info['name'][:36] == str_guid \
+                    else None
+                task = (file_info['data'], file_info['packed'], file_info['name'], files_types)
+                if written is not None:
+                    key = obj_path + '\0' + file_info['name']
+                    data_hash = bytes.fromhex(file_info['data'])
+                    if written.get(key) == data_hash:
+                        operations.append(('skip', obj_path, task))
+                        skipped += 1
+                        continue
+                    written[key] = data_hash
+                operations.append(('write', obj_path, task))
+                tasks.append(task)
+        if skipped:
+            logger.debug('Skipped %s unchanged files' % skipped)
+        return operations, tasks
+
+    def _data_cache_key(self, hash_name, name, files_types):
+        """
+        Ключ кэша данных: хэш данных, в режиме data_cache_parts дополнительно имя файла и описание его типа,
+        от которых зависят имена частей
+        :return:
+        """
+        if not self.data_cache_parts:
+            return hash_name
+        suffix = name[name.rindex('.'):] if '.' in name else None
+        return hash_name, name, files_types.get(suffix) if files_types and suffix else None
+
+    def _stream_file(self, hash_name, packed, name, files_types):
+        """
+        Разбор большого файла хранилища 8.3 без загрузки в память (кроме контейнеров)
+        :return list: (имя файла, данные)
+        """
+        depot = self.depot83_files_reader
+        data = StreamedFile(lambda: depot.iter_file(hash_name), packed, depot.get_file_size(hash_name))
+        return list(unpack_file(data, name, files_types))
+
+    def _unpack_files(self, tasks):
+        """
+        Получение данных и распаковка файлов
+        Распаковка при workers > 1 выполняется в пуле процессов
+        Для формата 8.3 распакованные данные (или части файлов в режиме data_cache_parts) кэшируются по хэшу
+        Файлы больше stream_threshold распаковываются потоком при записи (см. StreamedFile), без кэша и пула
+        :param list tasks: Задания распаковки (см. _plan_files)
+        :return list: Для каждого задания - список (имя файла, данные)
+        """
+        if self.metrics is None:
+            return self.__unpack_files(tasks)
+        with self.metrics.timer('unpack'):
+            results = self.__unpack_files(tasks)
+        self.metrics.add('files_unpacked', len(tasks))
+        self.metrics.add('bytes_unpacked', sum(len(data) for files in results for _, data in files
+                                               if not isinstance(data, StreamedFile)))
+        return results
+
+    def __unpack_files(self, tasks):
+        pool = self._get_pool()
+        cache = self.data_cache if self.format_83 and self.data_cache.max_size else None
+        results = [None] * len(tasks)
+        fetched = []
+        keys = []
+        for ind, (data, packed, name, files_types) in enumerate(tasks):
+            key = None
+            if self.format_83 and data is not None:
+                # большие файлы в кэш не попадают, поэтому размер проверяется только при промахе кэша
+                cached = None
+                if cache is not None:
+                    key = self._data_cache_key(data, name, files_types)
+                    with self.data_cache_lock:
+                        cached = cache.get(key)
+                if cached is None:
+                    if self.stream_threshold and \
+                            self.depot83_files_reader.get_file_size(data) > self.stream_threshold:
+                        results[ind] = self._stream_file(data, packed, name, files_types)
+                        continue
+                    data = self.depot83_files_reader.get_file(data)
+                elif self.data_cache_parts:
+                    results[ind] = cached
                     continue
-                if file_info['packed']:
-                    data = utils.inflate_inmemory(data)
-                for name, data in self._unpuck_file(data,
-                                                    file_info['name'],
-                                                    meta_class
-                                                    if obj == self.root_uid or file_info['name'][:36] == str_guid
-                                                    else None):
-                    self._write_file(data, os.path.join(obj_path, name))
-                    files.append(os.path.join(obj_path, name))
+                else:
+                    data, packed, key = cached, False, None
+            elif isinstance(data, StreamedFile):
+                results[ind] = list(unpack_file(data, name, files_types))
+                continue
+            if data is not None and pool is not None:
+                data = bytes(data)
+            if packed and data is not None and self.metrics is not None:
+                self.metrics.add('bytes_inflated', len(data))
+            fetched.append((data, packed, name, files_types, key is not None and not self.data_cache_parts))
+            keys.append((ind, key))
+        if pool is None:
+            unpacked = [unpack_file_task(task) for task in fetched]
+        else:
+            unpacked = pool.map(functools.partial(unpack_file_task, copy=True), fetched,
+                                chunksize=max(1, len(fetched) // (self.workers * 4)))
+        for (ind, key), result in zip(keys, unpacked):
+            if key is None:
+                results[ind] = result
+                continue
+            if self.data_cache_parts:
+                # части не должны удерживать в кэше весь распакованный контейнер
+                result = [(name, bytes(data)) for name, data in result]
+                size = sum(len(data) for _, data in result)
+            else:
+                result, data = result
+                size = len(data)
+            with self.data_cache_lock:
+                cache.put(key, result if self.data_cache_parts else data, size)
+            results[ind] = result
+        return results
+
+    def _resolve_changes(self, operations, results, state=None):
+        """
+        Формирует изменения версии в порядке операций
+        Для пропущенных файлов проверяется, что записанные ранее данные не перезаписаны другими файлами
+        (например, формы нескольких контейнеров объекта), иначе файл распаковывается и записывается повторно
+        :param list operations: Операции (см. _plan_files)
+        :param list results: Результаты распаковки операций записи (см. _unpack_files)
+        :param dict state: Состояние выгрузки нескольких версий: 'disk' - файл: источник записанных данных,
+                           'produced' - ключ файла хранилища: (хэш, имена записанных файлов).
+                           None - файлы не пропускались
+        :return list: ('remove', каталог), ('makedirs', каталог), ('write', файл, данные)
+        """
+        results = iter(results)
+        changes = []
+        expected = {}
+        skipped = {}
+        for operation in operations:
+            if operation[0] in ('remove', 'makedirs'):
+                changes.append(operation)
+                if operation[0] == 'remove' and state is not None:
+                    for files in (state['disk'], expected):
+                        for file_name in [file_name for file_name in files if file_name.startswith(operation[1])]:
+                            del files[file_name]
+                continue
+            kind, obj_path, task = operation
+            if state is None:
+                for name, data in next(results):
+                    changes.append(('write', os.path.join(obj_path, name), data))
+                continue
+            key = obj_path + '\0' + task[2]
+            source = (key, bytes.fromhex(task[0]))
+            if kind == 'skip':
+                produced = state['produced'].get(key)
+                if produced is not None and produced[0] == source[1]:
+                    skipped[source] = (obj_path, task)
+                    for name in produced[1]:
+                        expected[os.path.join(obj_path, name)] = source
+                    continue
+                files = self._unpack_files([task])[0]
+            else:
+                files = next(results)
+            for name, data in files:
+                file_name = os.path.join(obj_path, name)
+                changes.append(('write', file_name, data))
+                state['disk'][file_name] = source
+                expected[file_name] = source
+            state['produced'][key] = (source[1], [name for name, _ in files])
+
+        if skipped:
+            restore = {}
+            for file_name, source in expected.items():
+                if source in skipped and state['disk'].get(file_name) != source:
+                    restore.setdefault(source, set()).add(file_name)
+            for source, file_names in restore.items():
+                obj_path, task = skipped[source]
+                logger.debug('Restore overwritten files of %s' % task[2])
+                for name, data in self._unpack_files([task])[0]:
+                    file_name = os.path.join(obj_path, name)
+                    if file_name in file_names:
+                        changes.append(('write', file_name, data))
+                        state['disk'][file_name] = source
+        return changes
 
+    def _write_files(self, changes, path=''):
+        """
+        Выполняет изменения версии в исходном порядке
+        :param list changes: Изменения (см. _resolve_changes)
+        :param str path: Каталог сохранения файлов, если в изменениях относительные пути
+        :return list: Сохраненные файлы
+        """
+        if self.metrics is None:
+            return self.__write_files(changes, path)
+        with self.metrics.timer('write'):
+            return self.__write_files(changes, path)
+
+    def __write_files(self, changes, path):
+        files = []
+        for change in changes:
+            file_name = os.path.join(path, change[1])
+            if change[0] == 'remove':
+                rmdir_r(file_name)
+            elif change[0] == 'makedirs':
+                if not os.path.exists(file_name):
+                    os.makedirs(file_name)
+            else:
+                size = self._write_file(change[2], file_name)
+                files.append(file_name)
+                if self.metrics is not None:
+                    self.metrics.add('files_written')
+                    self.metrics.add('bytes_written', size)
         logger.debug('Saved %s files' % len(files))
         return files
 
+    def _save_files(self, objects, path, hierarchy=True):
+        """
+        Сохранение файлов объектов версии
+        :param list objects: Объекты версии
+        :param str path: Каталог сохранения файлов
+        :param bool hierarchy: Иерархическая выгрузка(по каталогам)
+        :return list: Сохраненные файлы
+        """
+        operations, tasks = self._plan_files(objects, path, hierarchy)
+        return self._write_files(self._resolve_changes(operations, self._unpack_files(tasks)))
+
     def read(self):
         super(StoreReader, self).read()
         self.format_83 = 'DATAHASH' in self.get_table_info('HISTORY').fields_indexes
         for row in self.read_table_by_name('DEPOT'):
             self.root_uid = row.by_name('ROOTOBJID')
         if self.format_83:
-            self.depot83_files_reader = Depot83Reader(os.path.join(os.path.dirname(self.file_name), 'data'))
+            self.depot83_files_reader = Depot83Reader(os.path.join(os.path.dirname(self.file_name), 'data'),
+                                                      self.metrics)
 
     def read_users(self):
         if not self.users:
@@ -420,25 +1058,198 @@ class StoreReader(reader_1cd.Reader1CD):
         """
         self._load_classes()
         self._read_objects()
+        if self.metrics is not None:
+            self.metrics.set_version(version_number)
 
         objects = self._get_objects_by_version(version_number)
         return self._save_files(objects, path, hierarchy)
 
-    def export_versions(self, path, start_version, last_version=None, hierarchy=True):
+    def get_timeline(self, cache_file=None):
+        """
+        Индекс истории объектов (см. cfg_tools.timeline)
+        Сохраненный индекс дочитывается записями, добавленными в хранилище после его построения
+        :param str cache_file: Файл сохранения индекса, None - индекс не сохраняется
+        :return Timeline:
+        """
+        if self.timeline is not None:
+            return self.timeline
+        timeline = Timeline.load(cache_file, self.file_name) if cache_file else None
+        if timeline is not None and \
+                not (self._check_position('HISTORY', timeline.history_row, timeline.history_version) and
+                     self._check_position('EXTERNALS', timeline.externals_row, timeline.externals_version)):
+            logger.debug('Индекс истории не соответствует хранилищу')
+            timeline = None
+        if timeline is None:
+            timeline = Timeline()
+        history_row, externals_row = timeline.history_row, timeline.externals_row
+        timeline.update(self)
+        if cache_file and (history_row, externals_row) != (timeline.history_row, timeline.externals_row):
+            timeline.save(cache_file, self.file_name)
+        self.timeline = timeline
+        return timeline
+
+    def export_snapshot(self, version_number, path, hierarchy=True, timeline_cache=None):
+        """
+        Выгрузка полного состояния конфигурации на версию хранилища
+        Состояние объектов определяется по индексу истории (см. get_timeline), без последовательной выгрузки версий
+        :param int version_number: Номер версии
+        :param str path: Каталог сохранения файлов (пустой)
+        :param bool hierarchy: Иерархическая выгрузка(по каталогам)
+        :param str timeline_cache: Файл сохранения индекса истории, None - индекс не сохраняется
+        :return list: выгруженные файлы
+        """
+        self._load_classes()
+        self._read_objects()
+        timeline = self.get_timeline(timeline_cache)
+        if self.metrics is not None:
+            self.metrics.set_version(version_number)
+
+        objects = []
+        for obj_id, obj in self.objects_info.items():
+            state = timeline.state(obj_id, version_number)
+            if state is None:
+                obj.name = None
+                obj.removed = False
+                if self.format_83:
+                    obj.parent = None
+                continue
+            history_row, externals = state
+            row = self.read_row('HISTORY', history_row, lazy=True)
+            obj.name = row.OBJNAME
+            obj.removed = row.REMOVED
+            if self.format_83:
+                obj.parent = row.PARENTID
+            if obj.removed:
+                continue
+            obj.files.append({
+                'data': row.DATAHASH if self.format_83 else self._get_file_data(row, 'OBJDATA'),
+                'packed': row.DATAPACKED,
+                'name': 'info.txt',
+            })
+            for external_row in sorted(externals.values()):
+                row = self.read_row('EXTERNALS', external_row, lazy=True)
+                obj.files.append({
+                    'name': row.EXTNAME,
+                    'data': row.DATAHASH if self.format_83 else self._get_file_data(row, 'EXTDATA'),
+                    'packed': row.DATAPACKED,
+                })
+            objects.append(obj)
+        if self.format_83:
+            self._set_parents()
+
+        logger.debug('snapshot objects (%s) version %s' % (len(objects), version_number))
+        return self._save_files(objects, path, hierarchy)
+
+    def export_versions(self, path, start_version, last_version=None, hierarchy=True, checkpoint=None,
+                        pipeline=0, checkpoint_due=None):
         """
         Оптимизированная выгрузка нескольких версий
         :param str path: Каталог сохранения файлов
         :param int start_version: Начальная версия хранилища(включительно)
         :param int last_version: Последная выгружаемая версия(включительно)
         :param bool hierarchy: Иерархическая выгрузка(по каталогам)
+        :param dict checkpoint: Контрольная точка предыдущей выгрузки (см. get_checkpoint)
+        :param int pipeline: Размер очередей конвейерной выгрузки, 0 - без конвейера.
+                             В конвейере чтение хранилища и распаковка файлов следующих версий выполняются
+                             в отдельных потоках, пока обрабатывается (записывается, фиксируется) текущая версия
+        :param checkpoint_due: Функция (порядковый номер версии в выгрузке, начиная с 1) -> bool: в конвейере
+                               формировать контрольную точку версии (см. get_checkpoint). Без конвейера
+                               контрольная точка доступна для любой версии, по завершении выгрузки - для последней
         :return tuple(int, list): Кортеж: номер версии, выгруженные файлы
         """
+        for version_number, changes in self._iter_versions(start_version, last_version, hierarchy, checkpoint,
+                                                           pipeline, checkpoint_due):
+            logger.info('Exporting version: %s' % version_number)
+            yield version_number, self._write_files(changes, path)
+
+    def read_versions_changes(self, start_version, last_version=None, hierarchy=True, checkpoint=None, pipeline=0,
+                              path=None, checkpoint_due=None):
+        """
+        Чтение изменений нескольких версий без записи файлов (например, для git fast-import)
+        Параметры аналогичны export_versions
+        :param str path: Каталог сохранения файлов, если нужно дополнительно записать файлы, None - не записывать
+        :return tuple(int, list): Кортеж: номер версии, изменения (относительный путь через "/", данные).
+                                  Данные None - удаление каталога
+        """
+        for version_number, changes in self._iter_versions(start_version, last_version, hierarchy, checkpoint,
+                                                           pipeline, checkpoint_due):
+            logger.info('Reading version changes: %s' % version_number)
+            if path is not None:
+                self._write_files(changes, path)
+            result = []
+            for change in changes:
+                file_name = change[1].replace(os.path.sep, '/')
+                if change[0] == 'remove':
+                    result.append((file_name.rstrip('/'), None))
+                elif change[0] == 'write':
+                    result.append((file_name, change[2]))
+            yield version_number, result
+
+    def _iter_versions(self, start_version, last_version, hierarchy, checkpoint, pipeline, checkpoint_due=None):
+        """
+        Итератор изменений версий (см. _resolve_changes), пути относительные
+        Для 8.3 неизменившиеся (по хэшу) файлы объектов не читаются из хранилища, не распаковываются
+        и не перезаписываются
+        :return tuple(int, list): номер версии, изменения
+        """
         self._load_classes()
         self._read_objects()
-        for objects in self._read_objects_by_version(start_version, last_version):
-            logger.info('Exporting version: %s' % objects[0])
-            files = self._save_files(objects[1], path, hierarchy)
-            yield objects[0], files
+        skip = self.skip_unchanged and self.format_83
+        written = {} if skip else None
+        state = {'disk': {}, 'produced': {}} if skip else None
+        if pipeline:
+            versions = self._iter_versions_pipeline(start_version, last_version, hierarchy, checkpoint, pipeline,
+                                                    written, checkpoint_due)
+        else:
+            versions = self._iter_versions_serial(start_version, last_version, hierarchy, checkpoint, written)
+        for version_number, operations, results in versions:
+            if self.metrics is not None:
+                self.metrics.set_version(version_number)
+            yield version_number, self._resolve_changes(operations, results, state)
+
+    def _read_versions_timed(self, start_version, last_version, checkpoint):
+        """
+        Чтение объектов версий (см. _read_objects_by_version) с замером времени стадии чтения
+        """
+        versions = self._read_objects_by_version(start_version, last_version, checkpoint)
+        return versions if self.metrics is None else self.metrics.timed_iter(versions, 'read')
+
+    def _iter_versions_serial(self, start_version, last_version, hierarchy, checkpoint, written):
+        for version_number, objects in self._read_versions_timed(start_version, last_version, checkpoint):
+            operations, tasks = self._plan_files(objects, '', hierarchy, written)
+            yield version_number, operations, self._unpack_files(tasks)
+
+    def _iter_versions_pipeline(self, start_version, last_version, hierarchy, checkpoint, queue_size, written,
+                                checkpoint_due=None):
+        """
+        Конвейерная выгрузка версий: чтение хранилища -> получение и распаковка файлов -> запись.
+        Состояние объектов меняется при чтении следующих версий, поэтому операции сохранения
+        и контрольные точки версий, отмеченных checkpoint_due, формируются на стадии чтения
+        """
+        def read_stage():
+            versions = self._read_versions_timed(start_version, last_version, checkpoint)
+            for count, (version_number, objects) in enumerate(versions, 1):
+                operations, tasks = self._plan_files(objects, '', hierarchy, written)
+                version_checkpoint = None
+                if checkpoint_due is not None and checkpoint_due(count):
+                    version_checkpoint = self._make_checkpoint(version_number)
+                yield version_number, operations, tasks, version_checkpoint
+
+        def unpack_stage(item):
+            version_number, operations, tasks, version_checkpoint = item
+            if self.metrics is not None:
+                self.metrics.set_version(version_number)
+            return version_number, operations, self._unpack_files(tasks), version_checkpoint
+
+        self.pipeline_running = True
+        try:
+            for version_number, operations, results, version_checkpoint in \
+                    Pipeline(read_stage(), [unpack_stage], queue_size):
+                self.version_checkpoint = version_checkpoint
+                yield version_number, operations, results
+        finally:
+            self.version_checkpoint = None
+            self.pipeline_running = False
 
 
 logger = logging.getLogger('Store')
@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+"""
+Индекс истории объектов хранилища: для каждого объекта - версии, в которых он изменялся,
+номера записей HISTORY и номера записей EXTERNALS по именам файлов.
+Строится одним проходом по таблицам (читаются только ключевые поля), может сохраняться в файл
+и дочитываться при добавлении версий. По индексу состояние любого объекта на версию определяется
+делением пополам, без чтения истории (см. StoreReader.export_snapshot)
+"""
+import logging
+import marshal
+import os
+from array import array
+from bisect import bisect_right, insort
+from cfg_tools import common
+
+logger = None
+
+
+def _append(versions, rows, version, row):
+    """
+    Добавление записи в упорядоченные по версиям массивы. Таблицы упорядочены по версиям,
+    поэтому обычно запись добавляется в конец
+    """
+    if not versions or versions[-1] <= version:
+        versions.append(version)
+        rows.append(row)
+    else:
+        pos = bisect_right(versions, version)
+        versions.insert(pos, version)
+        rows.insert(pos, row)
+
+
+class ObjectTimeline:
+    """
+    История объекта
+    """
+    __slots__ = ('versions', 'history', 'removals', 'externals')
+
+    def __init__(self):
+        self.versions = array('i')
+        self.history = array('i')
+        # версии, в которых объект удален
+        self.removals = array('i')
+        # имя файла - (версии, номера записей EXTERNALS)
+        self.externals = {}
+
+    def add_history(self, version, row, removed):
+        _append(self.versions, self.history, version, row)
+        if removed:
+            insort(self.removals, version)
+
+    def add_external(self, name, version, row):
+        if name not in self.externals:
+            self.externals[name] = (array('i'), array('i'))
+        _append(*self.externals[name], version, row)
+
+    def state(self, version):
+        """
+        Состояние объекта на версию
+        Файлы объекта - последние записи каждого файла, не старше версии и новее последнего удаления объекта
+        :param int version: Номер версии
+        :return tuple(int, dict): Номер записи HISTORY, имя файла - номер записи EXTERNALS.
+                                  None - объект появился позже версии
+        """
+        pos = bisect_right(self.versions, version)
+        if not pos:
+            return None
+        removed = bisect_right(self.removals, version)
+        since = self.removals[removed - 1] if removed else 0
+        files = {}
+        for name, (versions, rows) in self.externals.items():
+            ind = bisect_right(versions, version)
+            if ind and versions[ind - 1] > since:
+                files[name] = rows[ind - 1]
+        return self.history[pos - 1], files
+
+    def to_data(self):
+        """
+        Простые данные для сохранения в файл (см. Timeline.save)
+        :return tuple: Версии, записи HISTORY, удаления, имя файла - (версии, записи EXTERNALS)
+        """
+        return (self.versions.tolist(), self.history.tolist(), self.removals.tolist(),
+                {name: (versions.tolist(), rows.tolist()) for name, (versions, rows) in self.externals.items()})
+
+    @classmethod
+    def from_data(cls, data):
+        """
+        Восстановление из данных to_data
+        :param tuple data:
+        :return ObjectTimeline:
+        """
+        obj = cls()
+        versions, history, removals, externals = data
+        obj.versions.fromlist(versions)
+        obj.history.fromlist(history)
+        obj.removals.fromlist(removals)
+        obj.externals = {name: (array('i', versions), array('i', rows))
+                         for name, (versions, rows) in externals.items()}
+        return obj
+
+
+class Timeline:
+    """
+    Индекс истории объектов хранилища
+    """
+    FORMAT = 2
+
+    def __init__(self):
+        # OBJID (двоичный) - ObjectTimeline
+        self.objects = {}
+        # позиции дочитывания: номер первой непрочитанной записи и последняя прочитанная версия таблиц
+        self.history_row = 0
+        self.history_version = 0
+        self.externals_row = 0
+        self.externals_version = 0
+
+    def __object(self, obj_id):
+        obj = self.objects.get(obj_id.data)
+        if obj is None:
+            obj = self.objects[obj_id.data] = ObjectTimeline()
+        return obj
+
+    def update(self, reader):
+        """
+        Чтение записей HISTORY и EXTERNALS, добавленных после построения индекса
+        Пропущенные при выгрузке файлы (пустой EXTVERID) в индекс не попадают
+        :param StoreReader reader: Ридер хранилища
+        :return:
+        """
+        count = 0
+        for number, (obj_id, version, removed) in reader.read_table_fields('HISTORY', ('OBJID', 'VERNUM', 'REMOVED'),
+                                                                           self.history_row):
+            self.__object(obj_id).add_history(version, number, removed)
+            self.history_version = max(self.history_version, version)
+            count += 1
+        self.history_row = reader.rows_count('HISTORY')
+
+        for number, (obj_id, version, name, ext_ver_id) in reader.read_table_fields(
+                'EXTERNALS', ('OBJID', 'VERNUM', 'EXTNAME', 'EXTVERID'), self.externals_row):
+            self.externals_version = max(self.externals_version, version)
+            if ext_ver_id == common.Guid.EMPTY:
+                continue
+            self.__object(obj_id).add_external(name, version, number)
+            count += 1
+        self.externals_row = reader.rows_count('EXTERNALS')
+        logger.debug('Индекс истории: прочитано записей %s, объектов %s' % (count, len(self.objects)))
+
+    def state(self, obj_id, version):
+        """
+        Состояние объекта на версию (см. ObjectTimeline.state)
+        :param Guid obj_id: Идентификатор объекта
+        :param int version: Номер версии
+        :return tuple(int, dict):
+        """
+        obj = self.objects.get(obj_id.data)
+        return None if obj is None else obj.state(version)
+
+    def save(self, file_name, store):
+        """
+        Сохранение индекса в файл
+        Файл содержит только простые данные (числа, строки, байты, списки) в формате marshal
+        :param str file_name: Имя файла
+        :param str store: Имя файла хранилища
+        :return:
+        """
+        state = {
+            'format': self.FORMAT,
+            'store': os.path.abspath(store),
+            'history': (self.history_row, self.history_version),
+            'externals': (self.externals_row, self.externals_version),
+            'objects': {obj_id: obj.to_data() for obj_id, obj in self.objects.items()},
+        }
+        with open(file_name + '.tmp', 'wb') as f:
+            marshal.dump(state, f)
+        os.replace(file_name + '.tmp', file_name)
+        logger.debug('Индекс истории сохранен: %s' % file_name)
+
+    @classmethod
+    def load(cls, file_name, store):
+        """
+        Загрузка индекса из файла
+        :param str file_name: Имя файла
+        :param str store: Имя файла хранилища
+        :return Timeline: None - файла нет, он не читается или построен для другого хранилища
+        """
+        try:
+            with open(file_name, 'rb') as f:
+                state = marshal.load(f)
+            if state.get('format') != cls.FORMAT or state['store'] != os.path.abspath(store):
+                return None
+            timeline = cls()
+            timeline.history_row, timeline.history_version = state['history']
+            timeline.externals_row, timeline.externals_version = state['externals']
+            timeline.objects = {obj_id: ObjectTimeline.from_data(data) for obj_id, data in state['objects'].items()}
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning('Не удалось прочитать индекс истории %s: %s' % (file_name, e))
+            return None
+        return timeline
+
+
+logger = logging.getLogger('Store')
@@ -1,9 +1,10 @@
 import binascii
 import zlib
 from struct import unpack, calcsize
-from datetime import datetime
+from cfg_tools import codec
 
 BYTES16_AS_GUID = True
+INFLATE_CHUNK_SIZE = 1024 * 1024
 
 
 def read_struct(buffer, frmt, offset=0):
@@ -14,7 +15,7 @@ def read_struct(buffer, frmt, offset=0):
 
 
 def bytes_to_guid(data):
-    hex_str = b2s(data[8:]) + b2s(bytes(reversed(data[:8])))
+    hex_str = (bytes(data[8:]) + bytes(data[7::-1])).hex()
     return '%s-%s-%s-%s-%s' % (hex_str[24:], hex_str[20:24], hex_str[16:20], hex_str[:4], hex_str[4:16])
 
 
@@ -29,24 +30,31 @@ def b2s(data):
 
 
 def bytes_to_int(type_info, data):
-    hex_str = b2s(data)
-    if type_info.precision:
-        return float(''.join(['-' if hex_str[0] == '0' else '+',
-                              hex_str[1: -type_info.precision],
-                              '.',
-                              hex_str[-type_info.precision:]]))
-    else:
-        return int(''.join(['-' if hex_str[0] == '0' else '+',
-                            hex_str[1:type_info.length + 1]]))
+    return codec.decode_numeric(type_info, data)
+
+
+def int_to_bytes(type_info, value):
+    """
+    Преобразование числа в BCD представление поля типа N (обратное bytes_to_int)
+    Первая тетрада - знак (1 - положительное, 0 - отрицательное), далее length цифр
+    """
+    digits = str(abs(round(value * 10 ** type_info.precision)))
+    if len(digits) > type_info.length:
+        raise ValueError('Число %s не помещается в %s знаков' % (value, type_info.length))
+    hex_str = ('1' if value >= 0 else '0') + digits.zfill(type_info.length)
+    return binascii.unhexlify(hex_str.ljust((type_info.length + 2) // 2 * 2, '0'))
+
+
+def datetime_to_bytes(type_info, value):
+    """
+    Преобразование даты в BCD представление поля типа DT (обратное bytes_to_datetime)
+    """
+    return binascii.unhexlify(value.strftime('%Y%m%d%H%M%S').zfill(14))
 
 
 def bytes_to_datetime(type_info, data):
-    byte_str = b2s(data)
-    if data[:2] == b'\x00\x00':
-        # TODO Убрать исключение после теста
-        raise Exception("Ошибка преобразования даты. Значение: " + byte_str)
-    else:
-        return datetime.strptime(byte_str, '%Y%m%d%H%M%S')
+    return codec.decode_datetime(data)
+
 
 def print_table_content(gen, with_headers=True):
     if with_headers:
@@ -82,3 +90,21 @@ def inflate(source_file, dest_file):
 def inflate_inmemory(source):
     return zlib.decompress(source, -15)
 
+
+def inflate_iter(chunks, chunk_size=INFLATE_CHUNK_SIZE):
+    """
+    Потоковая распаковка: сжатые данные подаются частями, распакованные возвращаются частями не больше chunk_size
+    :param chunks: Итератор частей сжатых данных
+    :param int chunk_size: Максимальный размер возвращаемой части
+    :return: Генератор частей распакованных данных
+    """
+    decompressor = zlib.decompressobj(-15)
+    for chunk in chunks:
+        while chunk:
+            data = decompressor.decompress(chunk, chunk_size)
+            if data:
+                yield data
+            chunk = decompressor.unconsumed_tail
+    data = decompressor.flush()
+    if data:
+        yield data
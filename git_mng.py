@@ -1,7 +1,7 @@
 import logging
 import subprocess
 import os
-import tempfile
+import time
 
 
 logger = None
@@ -9,82 +9,265 @@ logger = None
 
 class GitMng:
 
-    def __init__(self, path, remote_url):
+    def __init__(self, path, remote_url, metrics=None):
+        """
+        :param str path: Каталог репозитория
+        :param str remote_url: Адрес удаленного репозитория
+        :param Metrics metrics: Учет времени команд git (см. cfg_tools.metrics), None - не учитывать
+        """
         self.path = path
         self.remote_url = remote_url
+        self.metrics = metrics
 
-    def __execute_cmd(self, cmd_command):
-        os.chdir(self.path)
-        logger.debug('Executing "%s"' % cmd_command)
-        pr = subprocess.Popen(cmd_command,
-                              shell=True,
-                              stdout=subprocess.PIPE,
-                              stderr=subprocess.PIPE)
-        while pr.returncode is None:
-            stdpip = None
-            try:
-                stdpip = pr.communicate(None, 1)
-            except subprocess.TimeoutExpired:
-                pass
-            # if stdpip is not None:
-            #     logger.debug('stdout: %s' % stdpip[0].decode())
-            # else:
-            #     logger.debug('stdout: %s' % pr.stdout.readline().decode())
-        logger.debug('Exit code: %s' % pr.returncode)
-        if pr.returncode:
-            logger.error(stdpip[1].decode())
+    def fast_import(self):
+        """
+        Создает сеанс фиксации версий через git fast-import
+        :return GitFastImport:
+        """
+        return GitFastImport(self.path, self.metrics)
+
+    def reset(self):
+        """
+        Приводит индекс в соответствие с текущим коммитом (рабочий каталог не изменяется)
+        :return:
+        """
+        exit_code = self.__execute_cmd(['reset', '-q'])
+        if exit_code != 0:
+            raise Exception('Не удалось обновить индекс (git reset). Код возврата: %s' % exit_code)
+
+    def __execute_cmd(self, args, input=None, env=None):
+        """
+        Выполняет команду git в каталоге репозитория и ожидает ее завершения
+        Текущий каталог и окружение процесса не изменяются
+        :param list args: Аргументы команды git
+        :param bytes input: Данные стандартного ввода команды
+        :param dict env: Дополнительные переменные окружения команды
+        :return int: Код возврата
+        """
+        logger.debug('Executing "git %s"' % ' '.join(args))
+        start = time.perf_counter()
+        result = subprocess.run(['git'] + args,
+                                cwd=self.path,
+                                env=dict(os.environ, **env) if env else None,
+                                input=input,
+                                stdin=None if input is not None else subprocess.DEVNULL,
+                                stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE)
+        if self.metrics is not None:
+            self.metrics.add_time('git %s' % args[0], time.perf_counter() - start)
+        logger.debug('Exit code: %s' % result.returncode)
+        if result.returncode:
+            logger.error(result.stderr.decode('utf-8', 'replace'))
         else:
-            logger.debug(stdpip[0].decode())
-        # if err:
-        #     logger.error('Executed "%s"\n%s\n%s' % (cmd_command, msg.decode(), err.decode()))
-        # else:
-        #     logger.debug('%s' % msg.decode())
-        # return msg, err
-        return pr.returncode
+            logger.debug(result.stdout.decode('utf-8', 'replace'))
+        return result.returncode
 
     def init(self):
-        exit_code = self.__execute_cmd('git init')
+        exit_code = self.__execute_cmd(['init'])
         if exit_code != 0:
             raise Exception('Не удалось инициализировать репозиторий. Код возврата: %s' % exit_code)
         else:
             logger.info('Инициализирован репозиторий')
 
-    def add(self):
-        exit_code = self.__execute_cmd('git add -A .')
+    def add(self, files=None, removed=None):
+        """
+        Добавление изменений в индекс
+        Если изменения известны, файлы передаются одному процессу git update-index, рабочий каталог не просматривается
+        :param list files: Измененные файлы (пути относительно каталога репозитория через "/"),
+                           None - все изменения рабочего каталога (git add -A)
+        :param list removed: Удаленные каталоги (пути относительно каталога репозитория через "/")
+        :return:
+        """
+        if files is None:
+            exit_code = self.__execute_cmd(['add', '-A', '.'])
+        else:
+            exit_code = 0
+            if removed:
+                exit_code = self.__execute_cmd(['rm', '-r', '-q', '--cached', '--ignore-unmatch', '--'] + removed)
+            if files and exit_code == 0:
+                exit_code = self.__execute_cmd(['update-index', '--add', '--remove', '-z', '--stdin'],
+                                               input=b''.join(file.encode('utf-8') + b'\0' for file in files))
         if exit_code != 0:
             raise Exception('Не удалось добавить измения в индекс (git add). Код возврата: %s' % exit_code)
 
     def commit(self, version, msg, author, email, date):
-        os.environ['GIT_AUTHOR_DATE'] = date.strftime('"%Y-%m-%d %H:%M:%S"')
-        os.environ['GIT_COMMITTER_DATE'] = date.strftime('"%Y-%m-%d %H:%M:%S"')
-        comment_file = tempfile.NamedTemporaryFile(mode='w',
-                                                   delete=False,
-                                                   encoding='utf-8')
+        """
+        Фиксация проиндексированных изменений (см. add)
+        :return:
+        """
         msg = 'Version %s. %s' % (version, msg)
-        comment_file.write(msg)
-        comment_file.close()
         logger.debug('Message %s' % msg)
-        exit_code = self.__execute_cmd('git commit -a --file="%s" --author "%s <%s>"' % (comment_file.name, author, email))
-        os.unlink(comment_file.name)
+        date = date.strftime('%Y-%m-%d %H:%M:%S')
+        exit_code = self.__execute_cmd(['commit', '--file=-', '--author', '%s <%s>' % (author, email)],
+                                       input=msg.encode('utf-8'),
+                                       env={'GIT_AUTHOR_DATE': date, 'GIT_COMMITTER_DATE': date})
         if exit_code != 0:
             raise Exception('Не удалось зафиксировать изменения (commit). Код возврата: %s' % exit_code)
 
     def push(self):
         self.gc()
         logger.info('Отправка данных в центральный репозиторий')
-        exit_code = self.__execute_cmd('git push -u --all -v %s' % self.remote_url)
+        exit_code = self.__execute_cmd(['push', '-u', '--all', '-v', self.remote_url])
         if exit_code != 0:
             raise Exception('Не удалось отправить данные в центральный репозиторий. Код возврата: %s' % exit_code)
 
     def pull(self):
-        exit_code = self.__execute_cmd('git pull -v %s' % self.remote_url)
+        exit_code = self.__execute_cmd(['pull', '-v', self.remote_url])
         if exit_code != 0:
             raise Exception('Не удалось получить данные из центрального репозитория. Код возврата: %s' % exit_code)
         logger.info('Получены данные из центрального репозитория')
 
     def gc(self):
-        if self.__execute_cmd('git gc --auto') != 0:
+        if self.__execute_cmd(['gc', '--auto']) != 0:
             raise Exception('Не удалось выполнить сборку мусора')
 
 
+class GitFastImport:
+    """
+    Фиксация версий потоком в один процесс git fast-import
+    Файлы версии передаются как данные, рабочий каталог и индекс не используются
+    """
+
+    def __init__(self, path, metrics=None):
+        """
+        :param str path: Каталог репозитория
+        :param Metrics metrics: Учет переданных данных и времени (см. cfg_tools.metrics), None - не учитывать
+        """
+        self.path = path
+        self.metrics = metrics
+        self.process = None
+        self.branch = None
+        self.parent = None
+        self.committer = None
+        self.commits = 0
+
+    def __git(self, *args):
+        result = subprocess.run(('git', ) + args, cwd=self.path, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        return result.returncode, result.stdout.decode('utf-8').strip()
+
+    def start(self):
+        """
+        Запуск процесса git fast-import, новые коммиты добавляются к текущей ветке
+        :return:
+        """
+        exit_code, branch = self.__git('symbolic-ref', '-q', 'HEAD')
+        self.branch = branch if exit_code == 0 and branch else 'refs/heads/master'
+        exit_code, _ = self.__git('rev-parse', '-q', '--verify', self.branch)
+        self.parent = self.branch if exit_code == 0 else None
+        exit_code, ident = self.__git('var', 'GIT_COMMITTER_IDENT')
+        self.committer = ident.rsplit(' ', 2)[0] if exit_code == 0 else None
+        logger.debug('Запуск git fast-import, ветка %s' % self.branch)
+        self.process = subprocess.Popen(['git', 'fast-import', '--quiet', '--date-format=raw'],
+                                        cwd=self.path,
+                                        stdin=subprocess.PIPE,
+                                        stdout=subprocess.PIPE)
+
+    def __write(self, *data):
+        for item in data:
+            self.process.stdin.write(item.encode('utf-8') if isinstance(item, str) else item)
+
+    def __write_data(self, data):
+        if self.metrics is not None:
+            self.metrics.add('git_blobs')
+            self.metrics.add('git_bytes', len(data))
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            self.__write('data %s\n' % len(data), data, '\n')
+            return
+        # данные большого файла (см. StreamedFile) передаются частями
+        self.__write('data %s\n' % len(data))
+        for chunk in data:
+            self.__write(chunk)
+        self.__write('\n')
+
+    def commit(self, version, msg, author, email, date, changes):
+        """
+        Фиксация версии
+        :param int version: Номер версии
+        :param str msg: Комментарий версии
+        :param str author: Автор
+        :param str email: Адрес электронной почты автора
+        :param datetime date: Дата версии
+        :param list changes: Изменения (путь в репозитории, данные), данные None - удаление каталога
+        :return:
+        """
+        if self.process is None:
+            self.start()
+        start = time.perf_counter()
+        date = date.astimezone()
+        stamp = '%d %s' % (int(date.timestamp()), date.strftime('%z'))
+        author_ident = '%s <%s>' % (author, email)
+        msg = 'Version %s. %s' % (version, msg)
+        logger.debug('Message %s' % msg)
+        self.__write('commit %s\n' % self.branch,
+                     'author %s %s\n' % (author_ident, stamp),
+                     'committer %s %s\n' % (self.committer or author_ident, stamp))
+        self.__write_data(msg.encode('utf-8'))
+        if self.parent:
+            self.__write('from %s^0\n' % self.parent)
+            self.parent = None
+        for path, data in changes:
+            if data is None:
+                self.__write('D %s\n' % path)
+            else:
+                self.__write('M 100644 inline %s\n' % path)
+                self.__write_data(data)
+        self.__write('\n')
+        self.commits += 1
+        if self.metrics is not None:
+            self.metrics.add_time('git fast-import', time.perf_counter() - start)
+
+    def checkpoint(self):
+        """
+        Сохранение переданных данных и обновление ветки, ожидает завершения
+        :return:
+        """
+        if self.process is None:
+            return
+        start = time.perf_counter()
+        self.__write('checkpoint\n\nprogress checkpoint %s\n\n' % self.commits)
+        self.process.stdin.flush()
+        expected = ('progress checkpoint %s' % self.commits).encode('utf-8')
+        while True:
+            line = self.process.stdout.readline()
+            if not line:
+                raise Exception('Процесс git fast-import завершился. Код возврата: %s' % self.process.wait())
+            if line.rstrip() == expected:
+                break
+        if self.metrics is not None:
+            self.metrics.add_time('git fast-import checkpoint', time.perf_counter() - start)
+        logger.debug('git fast-import: сохранено коммитов: %s' % self.commits)
+
+    def close(self):
+        """
+        Завершение процесса git fast-import
+        :return:
+        """
+        if self.process is None:
+            return
+        self.process.stdin.close()
+        self.process.stdout.read()
+        exit_code = self.process.wait()
+        self.process = None
+        if exit_code != 0:
+            raise Exception('Не удалось зафиксировать изменения (fast-import). Код возврата: %s' % exit_code)
+
+    def kill(self):
+        """
+        Аварийное завершение процесса git fast-import (при ошибке выгрузки)
+        Данные, переданные после последней контрольной точки, не сохраняются, ветка остается на ней
+        :return:
+        """
+        if self.process is None:
+            return
+        self.process.kill()
+        self.process.wait()
+        for stream in (self.process.stdin, self.process.stdout):
+            try:
+                stream.close()
+            except OSError:
+                pass
+        self.process = None
+        logger.debug('Процесс git fast-import прерван')
+
+
 logger = logging.getLogger('GIT')
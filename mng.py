@@ -2,11 +2,27 @@
 from ensurepip import version
 
 from cfg_tools import store_reader as store_reader
+from cfg_tools.metrics import Metrics
 from git_mng import GitMng
 import logging
 import configparser
 import datetime
+import functools
+import marshal
 import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+
+class JobFilter(logging.Filter):
+    """
+    Добавляет в записи лога имя выполняемого задания выгрузки (секции файла настройки)
+    """
+    job = ''
+
+    def filter(self, record):
+        record.job = '[%s] ' % JobFilter.job if JobFilter.job else ''
+        return True
 
 
 class Mng:
@@ -14,6 +30,7 @@ class Mng:
     Управление процессом выгрузки версий и помещением в GIT
     """
     push_step = 0
+    CHECKPOINT_FORMAT = 2
 
     @staticmethod
     def init_log(log_level, file_name=None):
@@ -23,27 +40,96 @@ class Mng:
         :param str file_name: Имя файла вывода. если не указа будет выводиться в консоль
         :return:
         """
+        handler = logging.StreamHandler() if file_name is None else logging.FileHandler(file_name, encoding='utf-8')
+        handler.addFilter(JobFilter())
         logging.basicConfig(level=log_level,
-                            format='%(asctime)-15s %(levelname)7s: %(name)5s: %(message)s',
-                            handlers=[logging.StreamHandler()
-                                      if file_name is None else
-                                      logging.FileHandler(file_name, encoding='utf-8')])
+                            format='%(asctime)-15s %(levelname)7s: %(name)5s: %(job)s%(message)s',
+                            handlers=[handler])
+
+    @staticmethod
+    def init_log_config(config):
+        """
+        Инициализация логера по секции LOG файла настройки
+        :param ConfigParser config: Настройки
+        :return:
+        """
+        for sect_name in config.sections():
+            if sect_name.upper() != 'LOG':
+                continue
+            section = config[sect_name]
+            log_level = getattr(logging, section['level'], logging.DEBUG) if 'level' in section else logging.DEBUG
+            file_name = section['file'] if 'file' in section else None
+            if file_name is not None and '%' in file_name:
+                file_name = datetime.datetime.now().strftime(file_name)
+            Mng.init_log(log_level, file_name)
+
+    @staticmethod
+    def read_config(file_name):
+        """
+        Чтение файла настройки
+        :param str file_name: Имя файла настройки
+        :return ConfigParser:
+        """
+        config = configparser.ConfigParser()
+        config.read(file_name, 'utf-8')
+        return config
+
+    @staticmethod
+    def store_sections(config_file):
+        """
+        Секции настройки выгрузки хранилищ (все, кроме LOG)
+        :param str config_file: Имя файла настройки
+        :return list:
+        """
+        return [name for name in Mng.read_config(config_file).sections() if name.upper() != 'LOG']
+
+    @staticmethod
+    def shared_outputs(config, sections):
+        """
+        Пути сохранения (репозиторий, кэш каталога, отчет выполнения), общие для нескольких секций выгрузки,
+        например заданные в секции DEFAULT. Задания выгрузки могут выполняться одновременно, общие файлы недопустимы
+        :param ConfigParser config: Настройки
+        :param list sections: Секции выгрузки
+        :return dict: (настройка, путь) - секции
+        """
+        used = {}
+        for name in sections:
+            section = config[name]
+            for option in ('local_repo', 'catalog_cache', 'metrics'):
+                if option in section:
+                    path = os.path.abspath(section.get(option, raw=True))
+                    used.setdefault((option, path), []).append(name)
+        return {key: names for key, names in used.items() if len(names) > 1}
 
-    def __init__(self, config_file=None, store_path=None, local_path=None, remote_url=None):
+    def __init__(self, config_file=None, store_path=None, local_path=None, remote_url=None, section=None):
         """
         Инициализация
         :param str config_file: Имя файла конфигурации, если указан другие параметры игнорируются
         :param str store_path: путь к файлу хранилища
         :param str local_path: путь к каталогу локального репозитория
         :param str remote_url: адрес удаленного репозитория
+        :param str section: Секция файла конфигурации с настройкой выгрузки, None - все секции
         :return:
         """
         self.local_repo = None
         self.store_path = None
         self.remote_repo_url = None
         self.use_pull = True
+        self.use_mmap = False
+        self.page_cache = None
+        self.catalog_cache = None
+        self.data_cache = None
+        self.data_cache_parts = False
+        self.stream_threshold = None
+        self.workers = 0
+        self.pipeline = 0
+        self.fast_import = False
+        self.fast_import_worktree = False
+        self.fast_import_step = 100
+        self.checkpoint_step = 100
+        self.metrics_file = None
         if config_file:
-            self.__load_config(config_file)
+            self.__load_config(config_file, section)
         else:
             self.local_repo = local_path
             self.store_path = store_path
@@ -51,33 +137,60 @@ class Mng:
         self.export_to_remote_repo = True if self.remote_repo_url else False
         self.use_pull = self.export_to_remote_repo and self.use_pull
         self.reader = None
-        self.repo = GitMng(self.local_repo, self.remote_repo_url)
+        self.metrics = Metrics() if self.metrics_file else None
+        self.repo = GitMng(self.local_repo, self.remote_repo_url, self.metrics)
 
-    def __load_config(self, file_name):
+    def __load_config(self, file_name, section_name=None):
         """
         Загрузка настройки выгрузки
         :param file_name: Имя файла настройки
+        :param str section_name: Секция настройки выгрузки, None - все секции
         :return:
         """
-        config = configparser.ConfigParser()
-        config.read(file_name, 'utf-8')
+        config = self.read_config(file_name)
+        self.init_log_config(config)
+        if section_name is not None and section_name not in config:
+            raise Exception('Не найдена секция настройки "%s"' % section_name)
         for sect_name in config.sections():
             section = config[sect_name]
-            if sect_name.upper() == 'LOG':
-                log_level = getattr(logging, section['level'], logging.DEBUG) if 'level' in section else logging.DEBUG
-                file_name = section['file'] if 'file' in section else None
-                if file_name is not None and '%' in file_name:
-                    file_name = datetime.datetime.now().strftime(file_name)
-                self.init_log(log_level, file_name)
-            else:
-                if 'store' in section:
-                    self.store_path = section['store']
-                if 'local_repo' in section:
-                    self.local_repo = section['local_repo']
-                if 'remote_repo' in section:
-                    self.remote_repo_url = section['remote_repo']
-                if 'use_pull' in section:
-                    self.use_pull = section.getboolean('use_pull')
+            if sect_name.upper() == 'LOG' or section_name is not None and sect_name != section_name:
+                continue
+            if 'store' in section:
+                self.store_path = section['store']
+            if 'local_repo' in section:
+                self.local_repo = section['local_repo']
+            if 'remote_repo' in section:
+                self.remote_repo_url = section['remote_repo']
+            if 'use_pull' in section:
+                self.use_pull = section.getboolean('use_pull')
+            if 'use_mmap' in section:
+                self.use_mmap = section.getboolean('use_mmap')
+            if 'page_cache' in section:
+                self.page_cache = section.getint('page_cache')
+            if 'catalog_cache' in section:
+                self.catalog_cache = section['catalog_cache']
+            if 'data_cache' in section:
+                self.data_cache = section.getint('data_cache')
+            if 'data_cache_parts' in section:
+                self.data_cache_parts = section.getboolean('data_cache_parts')
+            if 'stream_threshold' in section:
+                self.stream_threshold = section.getint('stream_threshold')
+            if 'workers' in section:
+                self.workers = section.getint('workers')
+            if 'pipeline' in section:
+                self.pipeline = section.getint('pipeline')
+            if 'fast_import' in section:
+                self.fast_import = section.getboolean('fast_import')
+            if 'fast_import_worktree' in section:
+                self.fast_import_worktree = section.getboolean('fast_import_worktree')
+            if 'fast_import_step' in section:
+                self.fast_import_step = section.getint('fast_import_step')
+            if 'checkpoint_step' in section:
+                self.checkpoint_step = section.getint('checkpoint_step')
+            if 'metrics' in section:
+                self.metrics_file = section['metrics']
+                if '%' in self.metrics_file:
+                    self.metrics_file = datetime.datetime.now().strftime(self.metrics_file)
 
         logger.info('''
 
@@ -93,7 +206,18 @@ class Mng:
         :return:
         """
         if self.reader is None:
-            self.reader = store_reader.StoreReader(self.store_path)
+            params = {'use_mmap': self.use_mmap, 'workers': self.workers, 'data_cache_parts': self.data_cache_parts}
+            if self.page_cache is not None:
+                params['cache_size'] = self.page_cache
+            if self.data_cache is not None:
+                params['data_cache'] = self.data_cache
+            if self.stream_threshold is not None:
+                params['stream_threshold'] = self.stream_threshold
+            if self.catalog_cache:
+                params['catalog_cache'] = self.catalog_cache
+            if self.metrics is not None:
+                params['metrics'] = self.metrics
+            self.reader = store_reader.StoreReader(self.store_path, **params)
 
     def __before_export(self):
         """
@@ -105,14 +229,29 @@ class Mng:
 
         self.load_authors()
         self.read_versions()
+        self.reader.save_catalog()
 
-    def _commit(self, version_info):
+    def _commit(self, version_info, changes=None):
         """
         Выполняет запись изменений в репозиторий
         :param dict version_info: Информация о версии(номер, пользователь, комментарий...)
+        :param list changes: Изменения версии (путь в репозитории, данные), данные None - удаление каталога
+                             (см. StoreReader.read_versions_changes). None - индексируются все изменения рабочего каталога
         :return:
         """
-        self.repo.add()
+        if self.metrics is not None:
+            with self.metrics.timer('commit'):
+                return self.__commit(version_info, changes)
+        return self.__commit(version_info, changes)
+
+    def __commit(self, version_info, changes):
+        if changes is None:
+            self.repo.add()
+        else:
+            files = [path for path, data in changes if data is not None]
+            files.extend(name for name in ('last_version.txt', '.gitignore', 'authors.csv')
+                         if os.path.exists(os.path.join(self.local_repo, name)))
+            self.repo.add(files, [path for path, data in changes if data is None])
         logger.info('Commiting version: %s' % version_info['verion'])
         self.repo.commit(version=version_info['verion'],
                          msg=version_info['comment'] if version_info['comment'] is not None else '<no comment>',
@@ -130,6 +269,58 @@ class Mng:
             f.write(str(version))
             f.close()
 
+    def __checkpoint_file(self):
+        """
+        Получение имени файла контрольной точки выгрузки
+        Файл хранится в служебном каталоге git и не попадает в репозиторий
+        :return: Имя файла контрольной точки
+        """
+        return os.path.join(self.local_repo, '.git', 'store_checkpoint')
+
+    def __save_checkpoint(self, version):
+        """
+        Сохранение контрольной точки выгрузки версии
+        Контрольная точка содержит только простые данные (числа, строки, байты), файл в формате marshal
+        :param int version: Номер версии
+        :return:
+        """
+        file_name = self.__checkpoint_file()
+        checkpoint = dict(self.reader.get_checkpoint(version), format=self.CHECKPOINT_FORMAT)
+        with open(file_name + '.tmp', 'wb') as f:
+            marshal.dump(checkpoint, f)
+        os.replace(file_name + '.tmp', file_name)
+
+    def __checkpoint_due(self, count, step):
+        """
+        Проверяет, нужно ли сохранять контрольную точку после версии: на шагах push и каждые step версий
+        (по завершении выгрузки контрольная точка сохраняется всегда)
+        :param int count: Порядковый номер версии в выгрузке, начиная с 1
+        :param int step: Шаг сохранения, 0 - только на шагах push
+        :return bool:
+        """
+        return bool(self.push_step and count % self.push_step == 0 or step and count % step == 0)
+
+    def __load_checkpoint(self, start_version):
+        """
+        Загрузка контрольной точки предыдущей выгрузки
+        Подходит контрольная точка любой версии до начальной: если выгрузка прервалась между контрольными точками,
+        состояние объектов дочитывается по записям после нее (см. StoreReader._apply_checkpoint)
+        :param int start_version: Начальная выгружаемая версия
+        :return dict: Контрольная точка, None - отсутствует или не подходит
+        """
+        file_name = self.__checkpoint_file()
+        if not os.path.exists(file_name):
+            return None
+        try:
+            with open(file_name, 'rb') as f:
+                checkpoint = marshal.load(f)
+            if checkpoint.get('format') != self.CHECKPOINT_FORMAT or checkpoint['version'] >= start_version:
+                return None
+        except Exception as e:
+            logger.warning('Не удалось прочитать контрольную точку: %s' % e)
+            return None
+        return checkpoint
+
     def __last_version_file(self):
         """
         Получение имени файла сохранения версии
@@ -225,22 +416,111 @@ class Mng:
         :param commit: Помещать в репозиторий
         :return:
         """
+        if commit and self.fast_import:
+            return self.__export_versions_fast_import(start_version, last_version)
         self.__before_export()
         count = 0
-        for version_data in self.reader.export_versions(self.local_repo, start_version, last_version, True):
-            version = version_data[0]
+        exported = None
+        saved = None
+        checkpoint = self.__load_checkpoint(start_version)
+        checkpoint_due = functools.partial(self.__checkpoint_due, step=self.checkpoint_step)
+        for version, changes in self.reader.read_versions_changes(start_version, last_version, True, checkpoint,
+                                                                  self.pipeline, self.local_repo, checkpoint_due):
             version_info = self.reader.versions[version]
             self.__save_exported_version_info(version)
             if commit:
-                self._commit(version_info)
+                self._commit(version_info, changes)
+            exported = version
             count += 1
-            if commit and self.push_step and count == self.push_step:
-                count = 0
-                if self.export_to_remote_repo:
-                    self.repo.push()
+            if checkpoint_due(count):
+                self.__save_checkpoint(version)
+                saved = version
+            if commit and self.push_step and count % self.push_step == 0 and self.export_to_remote_repo:
+                self.repo.push()
+        if exported is not None and exported != saved:
+            self.__save_checkpoint(exported)
+        logger.debug('Кэш страниц: %s' % self.reader.page_cache.stats())
+        logger.debug('Кэш данных: %s' % self.reader.data_cache.stats())
+        self.reader.save_catalog()
         if commit and self.export_to_remote_repo:
             self.repo.push()
 
+    def __export_versions_fast_import(self, start_version, last_version=None):
+        """
+        Экспорт интервала версий с фиксацией через git fast-import
+        Файлы версий записываются в рабочий каталог только при fast_import_worktree.
+        Номер выгруженной версии и контрольная точка сохраняются после записи данных в репозиторий,
+        индекс приводится к записанному коммиту (для следующей выгрузки через git add).
+        При ошибке процесс fast-import прерывается: версии после последней контрольной точки не сохраняются,
+        следующая выгрузка продолжится с нее
+        :param int start_version: начальная версия
+        :param int last_version: Последная версия
+        :return:
+        """
+        self.__before_export()
+        checkpoint = self.__load_checkpoint(start_version)
+        checkpoint_due = functools.partial(self.__checkpoint_due, step=self.fast_import_step)
+        importer = self.repo.fast_import()
+        count = 0
+        committed = None
+        try:
+            for version, changes in self.reader.read_versions_changes(
+                    start_version, last_version, True, checkpoint, self.pipeline,
+                    self.local_repo if self.fast_import_worktree else None, checkpoint_due):
+                version_info = self.reader.versions[version]
+                changes.append(('last_version.txt', str(version).encode('utf-8')))
+                for name in ('.gitignore', 'authors.csv'):
+                    file_name = os.path.join(self.local_repo, name)
+                    if os.path.exists(file_name):
+                        with open(file_name, 'rb') as f:
+                            changes.append((name, f.read()))
+                logger.info('Commiting version: %s' % version)
+                start = time.perf_counter()
+                importer.commit(version=version,
+                                msg=version_info['comment'] if version_info['comment'] is not None else '<no comment>',
+                                author=version_info['user'].git_name,
+                                email=version_info['user'].email,
+                                date=version_info['date'],
+                                changes=changes)
+                if self.metrics is not None:
+                    self.metrics.add_time('commit', time.perf_counter() - start)
+                committed = version
+                count += 1
+                if checkpoint_due(count):
+                    importer.checkpoint()
+                    self.repo.reset()
+                    self.__save_exported_version_info(version)
+                    self.__save_checkpoint(version)
+                    if self.push_step and count % self.push_step == 0 and self.export_to_remote_repo:
+                        self.repo.push()
+        except:
+            importer.kill()
+            raise
+        importer.close()
+        if committed is not None:
+            self.repo.reset()
+            self.__save_exported_version_info(committed)
+            self.__save_checkpoint(committed)
+        logger.debug('Кэш страниц: %s' % self.reader.page_cache.stats())
+        logger.debug('Кэш данных: %s' % self.reader.data_cache.stats())
+        self.reader.save_catalog()
+        if self.export_to_remote_repo:
+            self.repo.push()
+
+    def save_metrics(self):
+        """
+        Сохраняет отчет выполнения (счетчики и время стадий, см. cfg_tools.metrics) в файл, указанный в настройке
+        metrics
+        :return:
+        """
+        if self.metrics is None:
+            return
+        if self.reader is not None:
+            self.metrics.set_info('store', self.store_path)
+            self.metrics.set_info('page_cache', self.reader.page_cache.stats())
+            self.metrics.set_info('data_cache', self.reader.data_cache.stats())
+        self.metrics.save(self.metrics_file)
+
     def export_new(self, commit=True):
         """
         Выгрузка новых версий.
@@ -278,4 +558,80 @@ class Mng:
         return True
 
 
+
+def export_job(config_file, section, use_pull=None):
+    """
+    Выгрузка новых версий хранилища одной секции файла настройки, выполняется в отдельном процессе
+    Ошибки не передаются, а возвращаются в результате
+    :param str config_file: Имя файла настройки
+    :param str section: Имя секции
+    :param bool use_pull: Выполнять pull, None - по настройке
+    :return tuple(bool, str, float): Успешно, описание ошибки, длительность
+    """
+    JobFilter.job = section
+    start = time.time()
+    try:
+        mng = Mng(config_file=config_file, section=section)
+        if use_pull is not None:
+            mng.use_pull = use_pull and mng.export_to_remote_repo
+        try:
+            success = mng.export_new()
+        finally:
+            mng.save_metrics()
+            if mng.reader is not None:
+                mng.reader.close_file()
+    except Exception as e:
+        logger.exception('Ошибка выгрузки')
+        return False, '%s: %s' % (type(e).__name__, e), time.time() - start
+    return bool(success), None, time.time() - start
+
+
+def export_all(config_file, jobs=1, use_pull=None):
+    """
+    Выгрузка всех хранилищ файла настройки: каждая секция (кроме LOG) - отдельное задание.
+    Задания выполняются в пуле процессов, не более jobs одновременно, ошибка одного задания не прерывает остальные
+    :param str config_file: Имя файла настройки
+    :param int jobs: Количество одновременно выполняемых заданий, 0 или 1 - последовательно в текущем процессе
+    :param bool use_pull: Выполнять pull, None - по настройке
+    :return bool: Все задания выполнены успешно
+    """
+    config = Mng.read_config(config_file)
+    Mng.init_log_config(config)
+    sections = Mng.store_sections(config_file)
+    if not sections:
+        logger.error('В файле настройки нет секций выгрузки')
+        return False
+    shared = Mng.shared_outputs(config, sections)
+    for (option, path), names in shared.items():
+        logger.error('Настройка %s (%s) совпадает в секциях: %s' % (option, path, ', '.join(names)))
+    if shared:
+        return False
+    results = {}
+    if jobs <= 1 or len(sections) == 1:
+        for section in sections:
+            results[section] = export_job(config_file, section, use_pull)
+        JobFilter.job = ''
+    else:
+        with ProcessPoolExecutor(max_workers=min(jobs, len(sections))) as pool:
+            futures = {section: pool.submit(export_job, config_file, section, use_pull) for section in sections}
+            for section, future in futures.items():
+                try:
+                    results[section] = future.result()
+                except Exception as e:
+                    # процесс задания завершился аварийно
+                    results[section] = (False, '%s: %s' % (type(e).__name__, e), None)
+
+    failed = [section for section, (success, error, duration) in results.items() if not success]
+    logger.info('Выгрузка завершена. Заданий: %s, успешно: %s, с ошибками: %s' %
+                (len(results), len(results) - len(failed), len(failed)))
+    for section, (success, error, duration) in results.items():
+        message = '%s: %s%s' % (section, 'OK' if success else 'ОШИБКА',
+                                '' if duration is None else ' (%.1f sec.)' % duration)
+        if success:
+            logger.info(message)
+        else:
+            logger.error(message + ('. %s' % error if error else ''))
+    return not failed
+
+
 logger = logging.getLogger('MNG')
@@ -1,41 +1,41 @@
 import logging
 import time
-from mng import Mng
+from mng import Mng, export_all
 import sys
 import os
 import traceback
 
 
 def init(args):
-    mng = Mng(config_file=args[1])
-    try:
-        for i in range(2, len(argv)):
-            arg = argv[i].split('=')
-            if len(arg) == 2:
-                if arg[0] == 'use_pull':
-                    mng.use_pull = bool(arg[1]) and mng.export_to_remote_repo
-    except:
-        print('Error: Ошибка рабора параметров')
-        return False
-    return mng.init_repo(True)
+    success = True
+    for section in Mng.store_sections(args[1]):
+        try:
+            Mng(config_file=args[1], section=section).init_repo(True)
+        except Exception as e:
+            logging.error('%s: не удалось инициализировать репозиторий. %s' % (section, e))
+            success = False
+    return success
 
 
 def export(args):
-    mng = Mng(config_file=args[1])
+    use_pull = None
+    jobs = 1
     try:
-        for i in range(2, len(argv)):
-            arg = argv[i].split('=')
+        for i in range(2, len(args)):
+            arg = args[i].split('=')
             if len(arg) == 2:
                 if arg[0] == 'use_pull':
-                    mng.use_pull = bool(arg[1]) and mng.export_to_remote_repo
+                    use_pull = bool(arg[1])
+                elif arg[0] == 'jobs':
+                    jobs = int(arg[1])
     except:
         print('Error: Ошибка рабора параметров')
         return False
-    return mng.export_new()
+    return export_all(args[1], jobs, use_pull)
 
 
 def show_help():
-    print('python run.py [%s] <config_file>)' % '|'.join(commands))
+    print('python run.py [%s] <config_file> [use_pull=1] [jobs=N])' % '|'.join(commands))
     for key, info in commands.items():
         print('%s - %s' % (key, info['description']))
     pass
@@ -49,7 +49,8 @@ commands = {
     },
     'export': {
         'func': export,
-        'description': 'выгрузка версий в git',
+        'description': 'выгрузка версий в git, каждая секция файла настройки - отдельное хранилище, '
+                       'jobs - количество одновременно выгружаемых хранилищ',
         'need_config': True
     },
     'help': {
@@ -59,46 +60,47 @@ commands = {
     }
 }
 
-t1 = time.time()
+if __name__ == '__main__':
+    t1 = time.time()
 
-argv = [arg.lower() for arg in sys.argv[1:]]
+    argv = [arg.lower() for arg in sys.argv[1:]]
 
-if len(argv) == 0:
-    show_help()
-    sys.exit(0)
-
-if argv[0] not in commands:
-    print('Error: Неизвестная команда')
-    show_help()
-    sys.exit(1)
+    if len(argv) == 0:
+        show_help()
+        sys.exit(0)
 
-command_name = argv[0]
-command = commands[command_name]
+    if argv[0] not in commands:
+        print('Error: Неизвестная команда')
+        show_help()
+        sys.exit(1)
 
-if command['need_config'] and len(argv) == 1:
-    print('Error: Не указан файл конфигурации')
-    show_help()
-    sys.exit(1)
+    command_name = argv[0]
+    command = commands[command_name]
 
-success = False
-if command['need_config']:
-    config_file = argv[1]
-    if not os.path.exists(config_file):
-        print('Error: Не найден файл конфигурации')
+    if command['need_config'] and len(argv) == 1:
+        print('Error: Не указан файл конфигурации')
         show_help()
         sys.exit(1)
-    try:
-        success = command['func'](argv)
-    except:
-        print('Error: выполения команды %s' % command_name)
-        traceback.print_exc()
-
-else:
-    try:
-        success = command['func']()
-    except:
-        print('Error: выполения команды %s' % command_name)
-        traceback.print_exc()
 
-logging.info('export delay: %s sec.' % (time.time() - t1))
-sys.exit(0 if success else 1)
+    success = False
+    if command['need_config']:
+        config_file = argv[1]
+        if not os.path.exists(config_file):
+            print('Error: Не найден файл конфигурации')
+            show_help()
+            sys.exit(1)
+        try:
+            success = command['func'](argv)
+        except:
+            print('Error: выполения команды %s' % command_name)
+            traceback.print_exc()
+
+    else:
+        try:
+            success = command['func']()
+        except:
+            print('Error: выполения команды %s' % command_name)
+            traceback.print_exc()
+
+    logging.info('export delay: %s sec.' % (time.time() - t1))
+    sys.exit(0 if success else 1)
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""
+Колоночное чтение таблиц (см. cfg_tools.columnar) в сравнении с построчным разбором записей
+Тесты чтения в массивы NumPy пропускаются, если пакет numpy не установлен
+"""
+import datetime
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+
+from cfg_tools import columnar
+from cfg_tools import store_generator
+from cfg_tools.common import Guid
+from cfg_tools.reader_1cd import Reader1CD, parse_table_info
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+GENERATOR_PARAMS = {
+    'versions': 12,
+    'objects': 8,
+    'files_per_object': 2,
+    'payload_size': 128,
+    'changed_objects': 0.5,
+    'change_files': 0.5,
+    'removed_objects': 0.1,
+    'skipped_files': 0.1,
+}
+
+# поля, которых нет в таблицах хранилища: N с дробной частью, NULL-значения NVC и DT
+TABLE_INFO = '{"TEST",0,\n{"Fields",\n{"NUM","N",0,10,0,"CS"},\n{"PRICE","N",1,8,3,"CS"},\n' \
+             '{"AMOUNT","N",0,5,2,"CS"},\n{"NAME","NVC",1,20,0,"CS"},\n{"CODE","NC",0,4,0,"CS"},\n' \
+             '{"CREATED","DT",1,19,0,"CS"},\n{"FLAG","L",1,0,0,"CS"},\n{"REF","B",0,16,0,"CS"}\n},\n' \
+             '{"Indexes"},\n{"Recordlock","0"},\n{"Files",0,0,0}\n}'
+
+TEST_ROWS = [
+    {'NUM': 1, 'PRICE': 12.345, 'AMOUNT': -1.5, 'NAME': 'Первый', 'CODE': 'A1',
+     'CREATED': datetime.datetime(2021, 3, 4, 5, 6, 7), 'FLAG': True, 'REF': bytes(range(16))},
+    {'NUM': 2, 'PRICE': None, 'AMOUNT': 0, 'NAME': None, 'CODE': 'ЯЯЯЯ', 'CREATED': None, 'FLAG': None,
+     'REF': bytes(16)},
+    {'NUM': 3, 'PRICE': -0.001, 'AMOUNT': 999.99, 'NAME': '', 'CODE': '',
+     'CREATED': datetime.datetime(1999, 12, 31, 23, 59, 59), 'FLAG': False, 'REF': b'\x01' + bytes(15)},
+]
+
+
+def encode_value(field, value):
+    """
+    Двоичное представление значения поля (без признака NULL), как в файле 1CD
+    """
+    if field.type == 'NC':
+        return value.ljust(field.length).encode('utf-16-le')
+    if field.type == 'NVC':
+        return struct.pack('h', len(value)) + value.encode('utf-16-le').ljust(field.length * 2, b'\x00')
+    if field.type == 'B':
+        return value
+    return field.encode(value)
+
+
+def table_data(table_desc, rows):
+    """
+    Данные таблицы: служебная первая запись, затем записи rows
+    """
+    data = bytearray(b'\x01' + bytes(table_desc.row_size - 1))
+    for values in rows:
+        row = bytearray(table_desc.row_size)
+        for field in table_desc.fields:
+            value = values[field.name]
+            offset = field.offset
+            if field.nullable:
+                if value is None:
+                    continue
+                row[offset] = 1
+                offset += 1
+            encoded = encode_value(field, value)
+            row[offset: offset + len(encoded)] = encoded
+        data += row
+    return bytes(data)
+
+
+def column_value(field, value):
+    """
+    Значение колонки NumPy в представлении построчного разбора
+    """
+    if value is numpy.ma.masked or isinstance(value, numpy.ma.MaskedArray) and value.mask.all():
+        return None
+    if field.type == 'GUID':
+        # numpy отбрасывает завершающие нулевые байты при извлечении элемента S16
+        return Guid(bytes(value).ljust(16, b'\x00'))
+    if field.type == 'B':
+        return bytes(value).ljust(field.length, b'\x00').hex()
+    if field.type == 'DT':
+        return value.astype('datetime64[s]').item()
+    if field.type in ('NT', 'I', 'RV'):
+        return tuple(value.tolist())
+    return value.item() if isinstance(value, numpy.generic) else value
+
+
+class ColumnarTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.temp_dir = tempfile.mkdtemp()
+        cls.stores = [store_generator.generate(os.path.join(cls.temp_dir, 'store%s' % format_83),
+                                               format_83=format_83, seed=5, **GENERATOR_PARAMS)
+                      for format_83 in (True, False)]
+        cls.table = parse_table_info(TABLE_INFO)
+        cls.table.init()
+        cls.data = table_data(cls.table, TEST_ROWS)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.temp_dir, ignore_errors=True)
+
+    def assert_columns(self, table_desc, rows, columns, convert=None):
+        """
+        Сравнение колонок со строками построчного разбора
+        """
+        self.assertEqual(set(columns), set(field.name for field in table_desc.fields))
+        for ind, field in enumerate(table_desc.fields):
+            values = list(columns[field.name])
+            self.assertEqual(len(values), len(rows), field.name)
+            if convert is not None:
+                values = [convert(field, value) for value in values]
+            self.assertEqual(values, [row[ind] for row in rows], '%s.%s' % (table_desc.name, field.name))
+
+    def rows(self):
+        """
+        Записи тестовой таблицы построчным разбором
+        """
+        size = self.table.row_size
+        return [self.table.decode_row(self.data[pos: pos + size]) for pos in range(size, len(self.data), size)]
+
+    def test_read_columns_python(self):
+        self.assert_columns(self.table, self.rows(), columnar.read_columns_python(self.data, self.table))
+        for store in self.stores:
+            reader = Reader1CD(store)
+            reader.read()
+            for name in reader.tables:
+                self.assert_columns(reader.tables[name], list(reader.read_table_by_name(name)),
+                                    reader.read_table_columns_python(name))
+            reader.close_file()
+
+    @unittest.skipIf(numpy is None, 'numpy не установлен')
+    def test_read_columns(self):
+        self.assert_columns(self.table, self.rows(), columnar.read_columns(self.data, self.table), column_value)
+        for store in self.stores:
+            for use_mmap in (False, True):
+                reader = Reader1CD(store, use_mmap=use_mmap)
+                reader.read()
+                for name in reader.tables:
+                    self.assert_columns(reader.tables[name], list(reader.read_table_by_name(name)),
+                                        reader.read_table_columns(name), column_value)
+                reader.close_file()
+
+    @unittest.skipIf(numpy is None, 'numpy не установлен')
+    def test_read_columns_subset(self):
+        columns = columnar.read_columns(self.data, self.table, ['PRICE', 'NAME'])
+        self.assertEqual(list(columns), ['PRICE', 'NAME'])
+        self.assertEqual(columns['PRICE'].tolist(), [12.345, None, -0.001])
+        self.assertEqual(columns['NAME'].tolist(), ['Первый', None, ''])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+from cfg_tools.common import LRUCache
+
+
+class LRUCacheTest(unittest.TestCase):
+
+    def test_eviction(self):
+        cache = LRUCache(8)
+        cache.put('a', b'1234')
+        cache.put('b', b'1234')
+        cache.get('a')
+        cache.put('c', b'1234')
+        self.assertEqual(cache.get('a'), b'1234')
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.size, 8)
+        self.assertEqual(cache.evictions, 1)
+
+    def test_oversize_put(self):
+        # значение больше объема кэша не помещается, прежнее значение ключа не должно остаться
+        cache = LRUCache(8)
+        cache.put('a', b'1234')
+        cache.put('a', b'123456789')
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.size, 0)
+        self.assertEqual(len(cache), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+"""
+Сравнение режимов выгрузки на синтетических хранилищах (см. cfg_tools.store_generator):
+последовательная выгрузка, пул распаковки, конвейер и git fast-import должны давать одинаковые деревья коммитов,
+выгрузка состояния на версию - совпадать с последовательной выгрузкой версий
+"""
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+from unittest import mock
+
+from cfg_tools import store_generator
+from cfg_tools.store_reader import StoreReader
+from git_mng import GitFastImport
+from mng import Mng
+
+GENERATOR_PARAMS = {
+    'versions': 30,
+    'objects': 16,
+    'files_per_object': 3,
+    'payload_size': 256,
+    'changed_objects': 0.3,
+    'change_files': 0.5,
+    'removed_objects': 0.1,
+    'renamed_objects': 0.1,
+    'moved_objects': 0.2,
+    'skipped_files': 0.1,
+}
+
+MODES = {
+    'serial': {},
+    'workers': {'workers': 2},
+    'pipeline': {'pipeline': 2, 'checkpoint_step': 4},
+    'fast_import': {'fast_import': True, 'fast_import_step': 4},
+    'fast_import_worktree': {'fast_import': True, 'fast_import_worktree': True, 'fast_import_step': 4},
+}
+
+
+def setUpModule():
+    os.environ.setdefault('GIT_AUTHOR_NAME', 'test')
+    os.environ.setdefault('GIT_AUTHOR_EMAIL', 'test@localhost')
+    os.environ.setdefault('GIT_COMMITTER_NAME', 'test')
+    os.environ.setdefault('GIT_COMMITTER_EMAIL', 'test@localhost')
+
+
+def commit_trees(repo):
+    """
+    Деревья коммитов репозитория от первого к последнему
+    :param str repo: Каталог репозитория
+    :return list:
+    """
+    result = subprocess.run(['git', 'log', '--reverse', '--format=%T'], cwd=repo, stdout=subprocess.PIPE, check=True)
+    return result.stdout.decode('utf-8').split()
+
+
+def read_tree(path):
+    """
+    Содержимое файлов каталога
+    :param str path: Каталог
+    :return dict: Относительное имя файла - данные
+    """
+    result = {}
+    for root, dirs, files in os.walk(path):
+        for name in files:
+            file_name = os.path.join(root, name)
+            with open(file_name, 'rb') as f:
+                result[os.path.relpath(file_name, path)] = f.read()
+    return result
+
+
+class ExportModesTest(unittest.TestCase):
+    format_83 = True
+
+    @classmethod
+    def setUpClass(cls):
+        cls.temp_dir = tempfile.mkdtemp()
+        cls.store = store_generator.generate(os.path.join(cls.temp_dir, 'store'), format_83=cls.format_83, seed=7,
+                                             **GENERATOR_PARAMS)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.temp_dir, ignore_errors=True)
+
+    def export(self, mode, split=10):
+        """
+        Выгрузка хранилища в новый репозиторий: первые версии, затем остальные с продолжением
+        по контрольной точке
+        :param str mode: Режим (см. MODES)
+        :param int split: Последняя версия первой выгрузки
+        :return list: Деревья коммитов
+        """
+        repo = tempfile.mkdtemp(prefix=mode, dir=self.temp_dir)
+
+        def make_mng():
+            mng = Mng(store_path=self.store, local_path=repo)
+            for name, value in MODES[mode].items():
+                setattr(mng, name, value)
+            return mng
+
+        mng = make_mng()
+        mng.init_repo()
+        mng.export_versions(1, split)
+        mng.reader.close_file()
+        mng = make_mng()
+        self.assertTrue(mng.export_new())
+        mng.reader.close_file()
+        return commit_trees(repo)
+
+    def test_modes(self):
+        expected = self.export('serial')
+        self.assertEqual(len(expected), GENERATOR_PARAMS['versions'])
+        for mode in MODES:
+            if mode == 'serial':
+                continue
+            with self.subTest(mode=mode):
+                self.assertEqual(self.export(mode), expected)
+
+    def test_fast_import_then_serial(self):
+        # после fast-import без рабочего каталога обычная выгрузка должна продолжаться от индекса коммита
+        expected = self.export('serial')
+        repo = tempfile.mkdtemp(prefix='mixed', dir=self.temp_dir)
+        mng = Mng(store_path=self.store, local_path=repo)
+        mng.fast_import = True
+        mng.init_repo()
+        mng.export_versions(1, 10)
+        mng.reader.close_file()
+        mng = Mng(store_path=self.store, local_path=repo)
+        self.assertTrue(mng.export_new())
+        mng.reader.close_file()
+        self.assertEqual(commit_trees(repo), expected)
+
+    def test_resume_after_interrupt(self):
+        # выгрузка прервана между контрольными точками: продолжение восстанавливает состояние
+        # по последней контрольной точке и дочитывает историю после нее
+        expected = self.export('serial')
+        repo = tempfile.mkdtemp(prefix='interrupted', dir=self.temp_dir)
+        mng = Mng(store_path=self.store, local_path=repo)
+        mng.checkpoint_step = 4
+        mng.init_repo()
+        commit = mng._commit
+        commits = []
+
+        def interrupted_commit(version_info, changes=None):
+            commit(version_info, changes)
+            commits.append(version_info)
+            if len(commits) == 7:
+                raise InterruptedError()
+
+        mng._commit = interrupted_commit
+        with self.assertRaises(InterruptedError):
+            mng.export_versions(1)
+        mng.reader.close_file()
+        mng = Mng(store_path=self.store, local_path=repo)
+        with self.assertLogs('Store', 'DEBUG') as logs:
+            self.assertTrue(mng.export_new())
+        mng.reader.close_file()
+        self.assertIn('Состояние восстановлено из контрольной точки версии 4', '\n'.join(logs.output))
+        self.assertEqual(commit_trees(repo), expected)
+
+    def test_fast_import_error(self):
+        # при ошибке fast-import прерывается: в репозитории остаются версии до последней контрольной точки,
+        # исходное исключение не подменяется, выгрузка продолжается с контрольной точки
+        expected = self.export('serial')
+        repo = tempfile.mkdtemp(prefix='fast_import_error', dir=self.temp_dir)
+        mng = Mng(store_path=self.store, local_path=repo)
+        mng.fast_import = True
+        mng.fast_import_step = 4
+        mng.init_repo()
+        commit = GitFastImport.commit
+
+        def failing_commit(importer, **kwargs):
+            if importer.commits == 6:
+                raise InterruptedError()
+            commit(importer, **kwargs)
+
+        with mock.patch.object(GitFastImport, 'commit', failing_commit):
+            with self.assertRaises(InterruptedError):
+                mng.export_versions(1)
+        mng.reader.close_file()
+        self.assertEqual(commit_trees(repo), expected[:4])
+        with open(os.path.join(repo, 'last_version.txt')) as f:
+            self.assertEqual(f.read().strip(), '4')
+        mng = Mng(store_path=self.store, local_path=repo)
+        self.assertTrue(mng.export_new())
+        mng.reader.close_file()
+        self.assertEqual(commit_trees(repo), expected)
+
+    def test_snapshot(self):
+        # переименования и переносы оставляют в выгрузке версий прежние каталоги, поэтому состояние на версию
+        # сравнивается с выгрузкой версий хранилища, в котором объекты только изменяются и удаляются
+        params = dict(GENERATOR_PARAMS, renamed_objects=0.0, moved_objects=0.0)
+        store = store_generator.generate(os.path.join(self.temp_dir, 'snapshot_store'), format_83=self.format_83,
+                                         seed=11, **params)
+        replay = tempfile.mkdtemp(prefix='replay', dir=self.temp_dir)
+        timeline_cache = os.path.join(self.temp_dir, 'timeline')
+        reader = StoreReader(store)
+        reader.read_versions()
+        for version, files in reader.export_versions(replay, 1):
+            if version % 10:
+                continue
+            # индекс истории строится при первой выгрузке состояния, далее загружается из файла
+            snapshot = tempfile.mkdtemp(prefix='snapshot', dir=self.temp_dir)
+            snapshot_reader = StoreReader(store)
+            snapshot_reader.export_snapshot(version, snapshot, timeline_cache=timeline_cache)
+            snapshot_reader.close_file()
+            self.assertEqual(read_tree(snapshot), read_tree(replay), 'version %s' % version)
+        reader.close_file()
+        self.assertTrue(os.path.exists(timeline_cache))
+
+
+class ExportModes82Test(ExportModesTest):
+    format_83 = False
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+"""
+Чтение индексов 1CD (см. cfg_tools.index_1cd)
+Файл индексов собирается вручную по описанию формата 8.2.14, независимо от store_generator
+"""
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+from unittest import mock
+
+from cfg_tools import index_1cd
+from cfg_tools import store_generator
+from cfg_tools.index_1cd import IndexDesc, IndexFormatError, IndexReader
+from cfg_tools.reader_1cd import Reader1CD
+
+PAGE_SIZE = 4096
+KEY_LENGTH = 6
+NO_PAGE = 0xffffffff
+# упакованная запись листа: 10 бит номера записи, по 3 бита left и right
+NUMREC_BITS = 10
+LR_BITS = 3
+REC_BYTES = 2
+
+# листовые страницы: (ключ, номер записи, left, right, хранимая часть ключа)
+LEAVES = [
+    [(b'ab\0\0\0\0', 5, 0, 4, b'ab'),
+     (b'abc\0\0\0', 3, 2, 3, b'c'),
+     (b'abd123', 7, 2, 0, b'd123')],
+    [(b'b\0\0\0\0\0', 1, 0, 5, b'b'),
+     (b'bb\0\0\0\0', 9, 1, 4, b'b'),
+     (b'bb\0\0\0\0', 10, 6, 0, b'')],
+]
+KEYS = [(key, record) for entries in LEAVES for key, record, *_ in entries]
+
+GENERATOR_PARAMS = {
+    'versions': 12,
+    'objects': 8,
+    'files_per_object': 2,
+    'payload_size': 128,
+    'changed_objects': 0.5,
+    'change_files': 0.5,
+    'removed_objects': 0.1,
+    'skipped_files': 0.1,
+}
+
+
+def leaf_page(entries, prev_page, next_page, numrec_mask=(1 << NUMREC_BITS) - 1):
+    """
+    Листовая страница: заголовок, упакованные записи от начала страницы, ключи от конца страницы
+    """
+    page = bytearray(PAGE_SIZE)
+    struct.pack_into('<HHII', page, 0, 2, len(entries), prev_page, next_page)
+    struct.pack_into('<HIHHHHHH', page, 12, 0, numrec_mask, (1 << LR_BITS) - 1, (1 << LR_BITS) - 1,
+                     NUMREC_BITS, LR_BITS, LR_BITS, REC_BYTES)
+    pos = 30
+    key_pos = PAGE_SIZE
+    for key, record, left, right, stored in entries:
+        packed = record | left << NUMREC_BITS | right << (NUMREC_BITS + LR_BITS)
+        struct.pack_into('<H', page, pos, packed)
+        pos += REC_BYTES
+        key_pos -= len(stored)
+        page[key_pos: key_pos + len(stored)] = stored
+    return page
+
+
+def index_file(**kwargs):
+    """
+    Файл индексов с одним индексом: заголовок файла, заголовок индекса, корневая ветвь, два листа
+    :param kwargs: Замена страниц и полей для проверки разбора неверных данных
+    :return list: Страницы файла
+    """
+    header = bytearray(PAGE_SIZE)
+    struct.pack_into('<II', header, 0, 1, PAGE_SIZE)
+    index_header = bytearray(PAGE_SIZE)
+    struct.pack_into('<Ih', index_header, 0, 2 * PAGE_SIZE, kwargs.get('length', KEY_LENGTH))
+    root = bytearray(PAGE_SIZE)
+    struct.pack_into('<HHII', root, 0, 1, len(LEAVES), NO_PAGE, NO_PAGE)
+    pos = 12
+    for number, entries in enumerate(LEAVES):
+        key, record = entries[-1][:2]
+        root[pos: pos + KEY_LENGTH] = key
+        struct.pack_into('>II', root, pos + KEY_LENGTH, record, kwargs.get('child', (3 + number) * PAGE_SIZE))
+        pos += KEY_LENGTH + 8
+    first = leaf_page(LEAVES[0], NO_PAGE, kwargs.get('next_page', 4 * PAGE_SIZE))
+    second = kwargs.get('second') or leaf_page(LEAVES[1], 3 * PAGE_SIZE, NO_PAGE)
+    return [header, index_header, root, first, second]
+
+
+class PageReader:
+    """
+    Страницы файла индексов в памяти вместо файла 1CD
+    """
+    PAGE_SIZE = PAGE_SIZE
+
+    def __init__(self, pages):
+        self.pages = pages
+
+    def read_block(self, addr):
+        return self.pages[addr]
+
+
+def index_reader(pages):
+    return IndexReader(PageReader(pages), len(pages) * PAGE_SIZE, list(range(len(pages))))
+
+
+class IndexReaderTest(unittest.TestCase):
+
+    def test_iter_range(self):
+        reader = index_reader(index_file())
+        self.assertEqual(list(reader.iter_range(0, key_length=KEY_LENGTH)), KEYS)
+        self.assertEqual(list(reader.iter_range(0, b'abc', b'b')), KEYS[1:])
+        self.assertEqual([record for _, record in reader.iter_range(0, b'ab', b'ab')], [5, 3, 7])
+        self.assertEqual([record for _, record in reader.iter_range(0, b'bb')], [9, 10])
+        self.assertEqual([record for _, record in reader.iter_range(0, high=b'abc')], [5, 3])
+        self.assertEqual(list(reader.iter_range(0, b'c')), [])
+
+    def test_format_errors(self):
+        bad_leaf = leaf_page(LEAVES[1], 3 * PAGE_SIZE, NO_PAGE, numrec_mask=0xffff)
+        # ключ, хранимая часть которого заходит на упакованные записи
+        bad_key = leaf_page([(b'b\0\0\0\0\0', 1, 0, 0, b'')], 3 * PAGE_SIZE, NO_PAGE)
+        struct.pack_into('<H', bad_key, 2, 2000)
+        for name, pages, key_length in (
+                ('длина ключа', index_file(), KEY_LENGTH + 1),
+                ('длина ключа в заголовке', index_file(length=0), None),
+                ('маска номера записи', index_file(second=bad_leaf), None),
+                ('записи листа', index_file(second=bad_key), None),
+                ('цикл листов', index_file(next_page=3 * PAGE_SIZE), None),
+                ('ссылка на лист', index_file(child=10 * PAGE_SIZE), None)):
+            with self.subTest(name):
+                with self.assertRaises(IndexFormatError):
+                    list(index_reader(pages).iter_range(0, key_length=key_length))
+
+    def test_missing_index(self):
+        with self.assertRaises(Exception) as context:
+            list(index_reader(index_file()).iter_range(1))
+        self.assertNotIsInstance(context.exception, IndexFormatError)
+
+
+class SeekTableTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.temp_dir = tempfile.mkdtemp()
+        cls.store = store_generator.generate(os.path.join(cls.temp_dir, 'store'), seed=7, **GENERATOR_PARAMS)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.temp_dir, ignore_errors=True)
+
+    def setUp(self):
+        self.reader = Reader1CD(self.store)
+        self.reader.read()
+        self.rows = [tuple(row) for row in self.reader.read_table_by_name('HISTORY')]
+        self.obj_id = self.rows[0][0]
+
+    def tearDown(self):
+        self.reader.close_file()
+
+    def seek(self):
+        """
+        Записи одного объекта и все записи таблицы HISTORY по первичному индексу
+        """
+        return ([tuple(row) for row in self.reader.seek_table('HISTORY', 'PK_HISTORY',
+                                                              ((self.obj_id,), (self.obj_id,)))],
+                [tuple(row) for row in self.reader.seek_table('HISTORY', 'PK_HISTORY')])
+
+    def expected(self):
+        return ([row for row in sorted(self.rows, key=lambda row: row[1]) if row[0] == self.obj_id],
+                sorted(self.rows, key=lambda row: (row[0].data, row[1])))
+
+    def test_seek_table(self):
+        expected = self.expected()
+        self.assertTrue(expected[0])
+        with mock.patch.object(Reader1CD, 'read_table_fields') as read_table_fields:
+            self.assertEqual(self.seek(), expected)
+        # записи читаются по индексу, без полного просмотра
+        self.assertEqual(read_table_fields.call_count, 0)
+
+    def test_key_length_mismatch(self):
+        # длина ключа в файле не совпадает с описанием таблицы - записи отбираются полным просмотром
+        with mock.patch.object(IndexDesc, 'key_length', return_value=1), self.assertLogs('1CD', 'WARNING'):
+            self.assertEqual(self.seek(), self.expected())
+
+    def test_error_after_entries(self):
+        # ошибка формата после части прочитанных записей: уже возвращенные записи не повторяются
+        iter_range = IndexReader.iter_range
+
+        def broken_iter_range(reader, *args):
+            for number, item in enumerate(iter_range(reader, *args)):
+                if number == 2:
+                    raise IndexFormatError('Неверная запись листовой страницы индекса')
+                yield item
+
+        with mock.patch.object(index_1cd.IndexReader, 'iter_range', broken_iter_range), \
+                self.assertLogs('1CD', 'WARNING'):
+            self.assertEqual(self.seek(), self.expected())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+from cfg_tools.predicates import Between, Equal, In
+from cfg_tools.reader_1cd import parse_table_info
+
+TABLE_INFO = '{"TEST",0,\n{"Fields",\n{"NUM","N",0,10,0,"CS"},\n{"PRICE","N",1,6,2,"CS"}\n},\n{"Indexes"},\n' \
+             '{"Recordlock","0"},\n{"Files",0,0,0}\n}'
+
+
+class PredicatesTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.table = parse_table_info(TABLE_INFO)
+        cls.table.init()
+        cls.rows = [cls.record(num, price) for num, price in
+                    ((0, None), (1, 0.5), (2, 1.25), (3, 1.3), (4, 2.0), (5, 12.34))]
+
+    @classmethod
+    def record(cls, num, price):
+        """
+        Двоичные данные записи
+        """
+        row = bytearray(cls.table.row_size)
+        num_field, price_field = cls.table.fields
+        row[num_field.offset: num_field.offset + num_field.byte_size] = num_field.encode(num)
+        if price is not None:
+            row[price_field.offset] = 1
+            row[price_field.offset + 1: price_field.offset + price_field.byte_size] = price_field.encode(price)
+        return bytes(row)
+
+    def select(self, predicate):
+        """
+        Номера (NUM) записей, прошедших отбор
+        """
+        check = predicate.compile(self.table)
+        return [num for num, data in enumerate(self.rows) if check(data)]
+
+    def test_between_integer(self):
+        self.assertEqual(self.select(Between('NUM', 1, 3)), [1, 2, 3])
+        self.assertEqual(self.select(Between('NUM', high=2)), [0, 1, 2])
+
+    def test_between_fractional_bounds(self):
+        # дробные границы поля без дробной части не округляются
+        self.assertEqual(self.select(Between('NUM', 1.4, 3.6)), [2, 3])
+        self.assertEqual(self.select(Between('NUM', 0.5, 2.6)), [1, 2])
+        self.assertEqual(self.select(Between('NUM', 1.4)), [2, 3, 4, 5])
+        self.assertEqual(self.select(Between('NUM', high=2.6)), [0, 1, 2])
+        # границы с большим числом знаков, чем точность поля
+        self.assertEqual(self.select(Between('PRICE', 1.251, 2.0)), [3, 4])
+        self.assertEqual(self.select(Between('PRICE', 0.5, 1.299)), [1, 2])
+        self.assertEqual(self.select(Between('PRICE', 1.25, 12.34)), [2, 3, 4, 5])
+
+    def test_equal_fractional(self):
+        self.assertEqual(self.select(Equal('NUM', 1.4)), [])
+        self.assertEqual(self.select(Equal('NUM', 2.0)), [2])
+        self.assertEqual(self.select(Equal('PRICE', 1.3)), [3])
+        self.assertEqual(self.select(Equal('PRICE', 1.251)), [])
+        self.assertEqual(self.select(In('NUM', [1.4, 3])), [3])
+        self.assertEqual(self.select(In('PRICE', [None, 0.5])), [0, 1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+Чтение таблиц 1CD на синтетических хранилищах (см. cfg_tools.store_generator)
+"""
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from cfg_tools import store_generator
+from cfg_tools.reader_1cd import Reader1CD
+
+GENERATOR_PARAMS = {
+    'versions': 12,
+    'objects': 8,
+    'files_per_object': 2,
+    'payload_size': 128,
+    'changed_objects': 0.5,
+    'change_files': 0.5,
+    'removed_objects': 0.1,
+    'skipped_files': 0.1,
+}
+
+
+class Reader1CDTest(unittest.TestCase):
+    format_83 = True
+
+    @classmethod
+    def setUpClass(cls):
+        cls.temp_dir = tempfile.mkdtemp()
+        cls.store = store_generator.generate(os.path.join(cls.temp_dir, 'store'), format_83=cls.format_83, seed=3,
+                                             **GENERATOR_PARAMS)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.temp_dir, ignore_errors=True)
+
+    def read_tables(self, reader):
+        """
+        Строки таблиц хранилища с BLOB-данными
+        :param Reader1CD reader:
+        :return dict: Имя таблицы - список строк
+        """
+        return {name: [tuple(row) for row in reader.read_table_by_name(name, read_blob=True)]
+                for name in ('HISTORY', 'EXTERNALS', 'VERSIONS')}
+
+    def test_catalog_cache(self):
+        # при открытии из кэша каталога адреса страниц объектов (в том числе таблиц BLOB) из файла не читаются
+        catalog_cache = os.path.join(self.temp_dir, 'catalog')
+        reader = Reader1CD(self.store, catalog_cache=catalog_cache)
+        reader.read()
+        expected = self.read_tables(reader)
+        reader.save_catalog()
+        reader.close_file()
+
+        reader = Reader1CD(self.store, catalog_cache=catalog_cache)
+        with mock.patch.object(reader.reader, 'get_data_address', wraps=reader.reader.get_data_address) as read_address:
+            reader.read()
+            self.assertEqual(self.read_tables(reader), expected)
+        reader.close_file()
+        self.assertEqual(read_address.call_count, 0)
+
+    def test_mmap(self):
+        # страницы отображения файла читаются без кэша страниц
+        reader = Reader1CD(self.store)
+        reader.read()
+        expected = self.read_tables(reader)
+        reader.close_file()
+        reader = Reader1CD(self.store, use_mmap=True)
+        reader.read()
+        self.assertEqual(self.read_tables(reader), expected)
+        self.assertEqual(len(reader.page_cache), 0)
+        reader.close_file()
+
+
+class Reader1CD82Test(Reader1CDTest):
+    format_83 = False
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import unittest
+
+from cfg_tools import store_generator
+from cfg_tools.reader_cf import Container, ReaderCF
+
+ENTRIES = [('root', b'{root}'), ('module', b'text' * 100), ('form', b'')]
+
+
+class ContainerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.file_name = os.path.join(self.temp_dir, 'test.cf')
+        with open(self.file_name, 'wb') as f:
+            f.write(store_generator.make_container(ENTRIES))
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_open(self):
+        with Container.open(self.file_name) as container:
+            self.assertEqual([(name, bytes(data)) for name, data in container.iter_files()], ENTRIES)
+            file_map = container.mmap
+        self.assertTrue(file_map.closed)
+        self.assertIsNone(container.mmap)
+
+    def test_close_with_references(self):
+        # отображение, на данные которого есть ссылки, закрывается позже без ошибки
+        container = Container.open(self.file_name)
+        data = container['module']
+        container.close()
+        self.assertEqual(bytes(data), ENTRIES[1][1])
+
+    def test_read_file(self):
+        self.assertEqual(ReaderCF.read_file(self.file_name), dict(ENTRIES))
+
+    def test_not_container(self):
+        with open(self.file_name, 'wb') as f:
+            f.write(b'not a container' * 10)
+        with self.assertRaises(Exception):
+            Container.open(self.file_name)
+
+
+if __name__ == '__main__':
+    unittest.main()